@@ -0,0 +1,99 @@
+# Farm storage layout benchmark: per-kind collections vs one document per farm.
+#
+# Builds synthetic farms and reports, per layout, how many documents and BSON
+# bytes loading one farm reads. With a MongoDB URL it also stores the farms in
+# a scratch database (dropped afterwards) and times farm_store operations in
+# both layouts: loading a whole farm, one kind, and updating one entity.
+#
+#   python -m bench.farm_layout --entities 100
+#   python -m bench.farm_layout --entities 100 --mongo-url mongodb://localhost:27017 --repeat 200
+
+import argparse
+import asyncio
+import random
+import time
+
+import bson
+
+from bench.responses import _farm
+from services import farm_store
+from services.farm_migrate import to_aggregate
+
+BENCH_DATABASE = "wildwest_bench_farm_layout"
+
+def sizes(farm):
+    """layout -> (documents, BSON bytes) read to load the whole farm"""
+    docs = [doc for kind in farm_store.FARM_KINDS for doc in farm[kind]]
+    aggregate = farm_store.to_farms(farm)
+    return {
+        "collections": (len(docs), sum(len(bson.encode(doc)) for doc in docs)),
+        "aggregate": (len(aggregate), sum(len(bson.encode(doc)) for doc in aggregate)),
+    }
+
+async def _time(operation, repeat):
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await operation()
+        elapsed = (time.perf_counter() - started) / repeat
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+async def timings(mongo_url, farms, repeat):
+    """layout -> operation -> µs, against a real MongoDB"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[BENCH_DATABASE]
+    try:
+        await client.drop_database(BENCH_DATABASE)
+        for farm in farms:
+            for kind in farm_store.FARM_KINDS:
+                await db[kind].insert_many([dict(doc) for doc in farm[kind]])
+        for kind in farm_store.FARM_KINDS:
+            await db[kind].create_index("user_id")
+            await db[kind].create_index("id")
+        await to_aggregate(db)
+        await db.farms.create_index("user_id")
+
+        user_id = farms[0]["crops"][0]["user_id"]
+        crop_id = farms[0]["crops"][0]["id"]
+        operations = {
+            "load farm": lambda: farm_store.load(db, user_id),
+            "find crops": lambda: farm_store.find(db, "crops", user_id),
+            "update crop": lambda: farm_store.update(db, "crops", user_id, crop_id, {"protected": random.random() < 0.5}),
+        }
+        results = {}
+        for layout in ("collections", "aggregate"):
+            farm_store.AGGREGATE = layout == "aggregate"
+            results[layout] = {name: await _time(operation, repeat) for name, operation in operations.items()}
+        return results
+    finally:
+        farm_store.AGGREGATE = farm_store.FARM_STORAGE == "aggregate"
+        await client.drop_database(BENCH_DATABASE)
+        client.close()
+
+if __name__ == "__main__":
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="Compare farm storage layouts")
+    parser.add_argument("--entities", type=int, default=100, help="entities per kind per farm")
+    parser.add_argument("--farms", type=int, default=10, help="farms stored for the timed run")
+    parser.add_argument("--repeat", type=int, default=100, help="operations per timing run")
+    parser.add_argument("--mongo-url", help="MongoDB to time operations against (a scratch database is used)")
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    farms = [_farm(args.entities, now) for _ in range(args.farms if args.mongo_url else 1)]
+
+    print(f"{'layout':<12} {'docs/load':>10} {'bytes/load':>11}")
+    for layout, (documents, size) in sizes(farms[0]).items():
+        print(f"{layout:<12} {documents:>10} {size:>11}")
+
+    if args.mongo_url:
+        results = asyncio.run(timings(args.mongo_url, farms, args.repeat))
+        print(f"\n{'operation':<12} {'collections µs':>15} {'aggregate µs':>13} {'speedup':>8}")
+        for name, micros in results["collections"].items():
+            aggregate = results["aggregate"][name]
+            print(f"{name:<12} {micros:>15.1f} {aggregate:>13.1f} {micros / aggregate:>7.1f}x")
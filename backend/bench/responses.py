@@ -0,0 +1,106 @@
+# Response encoding benchmark: payload size and encode time per endpoint.
+#
+# Builds a synthetic farm (no database needed), shapes it with the real
+# serializers and encodes each endpoint's payload three ways:
+#   baseline  FastAPI's default path: response_model validation where the
+#             route declares one, jsonable_encoder, then json.dumps
+#   orjson    GameResponse default
+#   msgpack   GameResponse with Accept: application/msgpack
+#
+#   python -m bench.responses --entities 500 --repeat 200
+
+import argparse
+import json
+import random
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models.building import BuildingResponse
+from routes.animals import serialize_animals
+from routes.buildings import serialize_buildings
+from routes.crops import serialize_crops
+from routes.pests import serialize_pests
+from routes.territory import serialize_territories
+from utils.catalog import catalog
+from utils.responses import dumps_json, dumps_msgpack
+
+def _farm(count, now):
+    user_id = str(uuid.uuid4())
+    ago = lambda: now - timedelta(seconds=random.randint(0, 7200))
+    base = lambda i: {"id": str(uuid.uuid4()), "user_id": user_id, "location": "main", "position": f"{i // 16}-{i % 16}"}
+    return {
+        "crops": [
+            {**base(i), "type": random.choice(list(catalog.crops)), "planted_at": ago(), "protected": False}
+            for i in range(count)
+        ],
+        "animals": [
+            {**base(i), "type": random.choice(list(catalog.animals)), "created_at": ago(), "last_fed": None, "last_collected": ago()}
+            for i in range(count)
+        ],
+        "buildings": [
+            {
+                **base(i), "type": building_type, "status": "building", "start_time": ago(),
+                "build_time": catalog.buildings[building_type]["time"], "last_collect_time": None, "level": 1
+            }
+            for i, building_type in enumerate(random.choice(list(catalog.buildings)) for _ in range(count))
+        ],
+        "territory": [
+            {**base(i), "type": random.choice(list(catalog.territory)), "status": "active", "clear_started_at": None, "clear_time": 60}
+            for i in range(count)
+        ],
+        "pests": [
+            {**base(i), "type": random.choice(list(catalog.pests)), "status": "active", "appeared_at": ago()}
+            for i in range(count)
+        ],
+    }
+
+def _baseline(validate):
+    def encode(payload):
+        if validate:
+            payload = validate(payload)
+        return json.dumps(
+            jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+    return encode
+
+def payloads(count):
+    """endpoint -> (payload, response_model validator or None)"""
+    now = datetime.utcnow()
+    farm = _farm(count, now)
+    buildings = serialize_buildings(farm["buildings"], now)
+    return {
+        "GET /api/crops": ({"crops": serialize_crops(farm["crops"], now), "nextCursor": None}, None),
+        "GET /api/animals": ({"animals": serialize_animals(farm["animals"], now), "nextCursor": None}, None),
+        "GET /api/buildings": (buildings, TypeAdapter(List[BuildingResponse]).validate_python),
+        "GET /api/territory": ({"territories": serialize_territories(farm["territory"], now), "nextCursor": None}, None),
+        "GET /api/pests": ({"pests": serialize_pests(farm["pests"], now), "nextCursor": None}, None),
+    }
+
+def run(count, repeat):
+    rows = []
+    for endpoint, (payload, validate) in payloads(count).items():
+        encoders = {"baseline": _baseline(validate), "orjson": dumps_json, "msgpack": dumps_msgpack}
+        row = {"endpoint": endpoint}
+        for name, encode in encoders.items():
+            seconds = min(timeit.repeat(lambda: encode(payload), number=repeat, repeat=3)) / repeat
+            row[name] = (len(encode(payload)), seconds * 1e6)
+        rows.append(row)
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark response encoders per endpoint")
+    parser.add_argument("--entities", type=int, default=500, help="entities per collection")
+    parser.add_argument("--repeat", type=int, default=100, help="encodes per timing run")
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<20} {'encoder':<9} {'bytes':>9} {'µs/encode':>10} {'speedup':>8}")
+    for row in run(args.entities, args.repeat):
+        baseline_us = row["baseline"][1]
+        for name in ("baseline", "orjson", "msgpack"):
+            size, micros = row[name]
+            print(f"{row['endpoint']:<20} {name:<9} {size:>9} {micros:>10.1f} {baseline_us / micros:>7.1f}x")
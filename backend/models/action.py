@@ -0,0 +1,16 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal
+import os
+
+ACTION_BATCH_MAX = int(os.getenv("ACTION_BATCH_MAX", "100"))
+
+class ActionCommand(BaseModel):
+    action: Literal["harvest", "plant", "feed", "collect", "collect_building", "clear", "chase", "purchase"]
+    id: Optional[str] = None  # crop (harvest), animal (feed, collect), building (collect_building) or pest (chase)
+    type: Optional[str] = None  # crop type (plant)
+    position: Optional[str] = None  # grid position (plant, clear)
+    location: str = "main"  # plant, clear
+    itemId: Optional[str] = None  # market item (purchase)
+
+class ActionBatchRequest(BaseModel):
+    commands: List[ActionCommand] = Field(..., min_length=1, max_length=ACTION_BATCH_MAX)
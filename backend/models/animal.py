@@ -7,17 +7,13 @@ class Animal(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     location: str = "main"
-    type: str  # cow, sheep, chicken, etc.
-    name: str
+    type: str  # cow, sheep, chicken, etc.; name, timings and yield come from the catalog
     position: str
     status: str = "growing"  # growing, adult, producing
-    age: int = 0  # in seconds
-    adult_age: int = 3600  # seconds to become adult
     last_fed: Optional[datetime] = None
     last_collected: Optional[datetime] = None
-    production_interval: int = 3600  # seconds between productions
-    production_yield: Dict[str, int] = {}  # what animal produces
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # change version for delta sync
 
 class AnimalCreate(BaseModel):
     type: str
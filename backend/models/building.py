@@ -6,8 +6,7 @@ import uuid
 class Building(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    type: str  # building type ID from frontend (saloon, mine, etc.)
-    name: str
+    type: str  # building type ID from frontend (saloon, mine, etc.); name and production come from the catalog
     position: str  # grid position like "5-7"
     status: str = "building"  # "building" or "built"
     progress: float = 0.0
@@ -15,9 +14,9 @@ class Building(BaseModel):
     build_time: int  # seconds
     last_collect_time: Optional[datetime] = None
     level: int = 1
-    production: Dict[str, int] = {}  # {"gold": 10, "wood": 5}
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # change version for delta sync
 
 class BuildingCreate(BaseModel):
     buildingType: str
@@ -30,10 +29,11 @@ class BuildingResponse(BaseModel):
     position: str
     status: str
     progress: float
-    startTime: str
+    startTime: datetime
     buildTime: int
-    lastCollectTime: Optional[str] = None
+    lastCollectTime: Optional[datetime] = None
     readyToCollect: bool = False
     level: int
     production: Dict[str, int]
     image: str = ""
+    nextTransitionAt: Optional[datetime] = None
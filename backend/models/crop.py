@@ -7,17 +7,13 @@ class Crop(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     location: str = "main"  # main, forest, north, etc.
-    type: str  # wheat, echinacea, ginger, etc.
-    name: str
+    type: str  # wheat, echinacea, ginger, etc.; name, timings and yield come from the catalog
     position: str  # grid position
     status: str = "growing"  # growing, ready, withered
     planted_at: datetime = Field(default_factory=datetime.utcnow)
-    grow_time: int  # seconds to grow
-    wither_time: int  # seconds after ready before withering
-    last_checked: datetime = Field(default_factory=datetime.utcnow)
     protected: bool = False  # drought protection
-    yield_data: Dict[str, int] = {}  # what you get when harvesting
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # change version for delta sync
 
 class CropCreate(BaseModel):
     type: str
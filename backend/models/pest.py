@@ -12,6 +12,7 @@ class Pest(BaseModel):
     status: str = "active"  # active, chasing, chased
     appeared_at: datetime = Field(default_factory=datetime.utcnow)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # change version for delta sync
 
 class PestChase(BaseModel):
     pest_id: str
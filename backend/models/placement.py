@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class PlacementFind(BaseModel):
+    location: str = "main"
+    near: Optional[str] = None  # grid position; without it cells come in row-major order
+    count: int = Field(1, ge=1, le=64)
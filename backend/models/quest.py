@@ -9,6 +9,8 @@ class QuestProgress(BaseModel):
     quest_id: str
     completed: bool = False
     claimed: bool = False
+    buildings: List[str] = []  # required building types built (services.quest_engine)
+    resources: List[str] = []  # required resource amounts reached
     completed_at: Optional[datetime] = None
     claimed_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -13,6 +13,7 @@ class Territory(BaseModel):
     clear_started_at: Optional[datetime] = None
     clear_time: int = 0  # seconds to clear
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # change version for delta sync
 
 class TerritoryClear(BaseModel):
     position: str
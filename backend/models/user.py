@@ -26,8 +26,11 @@ class User(BaseModel):
     last_energy_update: datetime = Field(default_factory=datetime.utcnow)
     max_energy: int = 100
     energy_regen_rate: int = 1  # energy per 5 minutes
+    quest_level: int = 0  # quests unlocked up to this level have progress (services.quest_engine)
+    territory_seed: Optional[int] = None  # generated territory map (services.territory_map); None: no map yet
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    state_version: int = 0  # bumped on every write, orders cached copies
     
 class UserCreate(BaseModel):
     username: str
@@ -0,0 +1,533 @@
+# Batched actions: one request runs an ordered list of farm commands.
+#
+# Commands run in order against state loaded once: the user (resources with
+# regenerated energy, level), the entities the commands name, and the
+# occupancy grids and territory of the locations they touch. Each command is
+# checked and applied to that in-memory state, so later commands see earlier
+# ones (harvest a cell, then replant it). A command that fails reports its
+# error, changes nothing, and the rest still run.
+#
+# Nothing is written until every command has run. Then, resources last:
+#   cells       one occupancy swap per location (freed cells, then taken ones)
+#   consumed    the entities commands are paid for (harvested crops, collected
+#               production, chased pests, cleared cells), each taken with a
+#               write guarded on the state the command checked. A command
+#               whose entity changed meanwhile (another request got it first)
+#               fails after all, and isn't paid.
+#   entities    the other writes, one ordered bulk_write per collection
+#               (farm_store.FarmWrites), all stamped with one change version
+#   resources   one ledger update with the net cost and reward of the commands
+#               that went through, guarded on the lowest balance they reach
+#   then        one tombstone write, one inventory update for the drops
+# If anything up to the ledger update fails (e.g. resources changed since they
+# were loaded), every write before it is undone and the whole batch fails.
+
+from collections import Counter, defaultdict
+from datetime import datetime
+import asyncio
+import random
+
+from fastapi import APIRouter, HTTPException, status, Request, Depends
+
+from models.action import ActionBatchRequest
+from models.crop import Crop
+from models.pest import Pest
+from routes.animals import ANIMAL_FIELDS
+from routes.buildings import BUILDING_FIELDS
+from routes.crops import CROP_FIELDS, HARVEST_COST
+from services import farm_store, ledger, occupancy, territory_map, timers
+from services.drops import DropBatch, ANIMAL_DROP_CHANCE, CROP_DROP_CHANCE, roll
+from services.projections import fields
+from services.scheduler import schedule_entity
+from services.sync import next_version, record_deletions
+from services.user_state import get_user_state
+from utils.auth import get_current_user
+from utils.catalog import catalog
+
+router = APIRouter()
+
+# Kinds loaded for the entities each action names
+ACTION_KINDS = {
+    "harvest": "crops", "feed": "animals", "collect": "animals", "collect_building": "buildings", "chase": "pests"
+}
+
+ACTION_FIELDS = {
+    "crops": CROP_FIELDS,
+    "animals": ANIMAL_FIELDS,
+    "buildings": BUILDING_FIELDS,
+    "pests": fields("id", "user_id", "type", "position", "location", "status"),
+}
+
+CLEAR_FIELDS = fields("id", "type", "location", "position", "status")
+
+def _not_found(detail):
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+def _bad_request(detail):
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+class ActionBatch:
+    """Runs commands against one loaded user state; commit() writes the outcome"""
+
+    def __init__(self, db, user_id):
+        self.db = db
+        self.user_id = user_id
+        self.now = datetime.utcnow()
+        self.user = None
+        self.resources = {}
+        self.entities = {}
+        self.territory = None
+        self.grids = {}
+        self.min_level = None
+        self.writes = farm_store.FarmWrites()
+        self.taken = defaultdict(list)
+        self.released = defaultdict(list)
+        # Per command, by its index: its result, and what commit() writes for it
+        self.results = []
+        self.index = None
+        self.failed = set()
+        self.charges = []  # (index, cost, reward, experience)
+        self.consumes = []  # (index, write(version), undo(taken), error if nothing matched)
+        self.undos = []  # (index, undo()) for the writes in self.writes
+        self.spawned = []  # (index, pest)
+        self.dropped = []  # (index, item ids)
+        self.deleted = []  # (index, kind, entity id)
+        self.scheduled = []  # (index, kind, doc)
+
+    async def load(self, kinds=(), territory=False, queries=None):
+        """Load the user, the entities of `kinds` (filtered by `queries[kind]`) and (optionally) territory"""
+        self.user = await get_user_state(self.db, self.user_id)
+        self.resources = dict(ledger.with_current_energy(self.user, self.now)["resources"])
+        if kinds:
+            loaded = await farm_store.load(
+                self.db, self.user_id, kinds=tuple(kinds), queries=queries,
+                projections={kind: ACTION_FIELDS[kind] for kind in kinds}
+            )
+            self.entities = {kind: {doc["id"]: doc for doc in docs} for kind, docs in loaded.items()}
+        if territory:
+            self.territory = {
+                (doc["location"], doc["position"]): doc
+                for doc in await territory_map.load(self.db, self.user_id, CLEAR_FIELDS)
+            }
+
+    # --- in-memory state
+
+    def _entity(self, kind, entity_id, detail):
+        doc = self.entities.get(kind, {}).get(entity_id)
+        if not doc:
+            raise _not_found(detail)
+        return doc
+
+    async def _grid(self, location):
+        if location not in self.grids:
+            self.grids[location] = await occupancy.load(self.db, self.user_id, location)
+        return self.grids[location]
+
+    async def _check_free(self, location, position):
+        index = occupancy.cell_index(position)
+        if not (await self._grid(location)).is_free(index):
+            raise _bad_request("Position already occupied")
+        return index
+
+    async def _take(self, location, position, index):
+        (await self._grid(location)).bits |= 1 << index
+        self.taken[location].append(position)
+
+    async def _release(self, location, position):
+        try:
+            (await self._grid(location)).bits &= ~(1 << occupancy.cell_index(position))
+        except HTTPException:
+            pass  # placed off-grid before positions were checked
+        self.released[location].append(position)
+
+    def _check_level(self, level_required):
+        if self.user["level"] < level_required:
+            raise _bad_request(f"Level {level_required} required")
+        self.min_level = max(self.min_level or 0, level_required)
+
+    def short_of(self, cost):
+        """First resource of `cost` the user can't currently pay, or None"""
+        for resource, amount in (cost or {}).items():
+            if self.resources.get(resource, 0) < amount:
+                return resource
+        return None
+
+    def charge(self, cost=None, reward=None, experience=0):
+        """Spend `cost` and grant `reward` in memory (400 if a resource is short)"""
+        cost = cost or {}
+        reward = reward or {}
+        short = self.short_of(cost)
+        if short:
+            raise _bad_request(f"Not enough {short}")
+        for resource, amount in cost.items():
+            self.resources[resource] = self.resources.get(resource, 0) - amount
+        for resource, amount in reward.items():
+            self.resources[resource] = self.resources.get(resource, 0) + amount
+        self.charges.append((self.index, cost, reward, experience))
+
+    def _consume(self, write, undo, error):
+        """Pay the running command only if write(version) takes its entity.
+
+        write returns what it took (falsy if the entity changed since it was
+        loaded); undo(taken) puts it back.
+        """
+        self.consumes.append((self.index, write, undo, error))
+
+    def _roll(self, item_ids, chance):
+        dropped = roll(item_ids, chance)
+        self.dropped.append((self.index, dropped))
+        return dropped
+
+    # --- commands
+
+    async def harvest(self, command):
+        crop = self._entity("crops", command.id, "Crop not found")
+        crop_def = catalog.crops.get(crop["type"])
+        if not crop_def:
+            raise _bad_request("Invalid crop type")
+        state = timers.evaluate_one("crops", crop, self.now)
+        if state.phase == timers.PENDING:
+            raise _bad_request("Crop is not ready yet")
+        if state.phase == timers.EXPIRED:
+            raise _bad_request("Crop has withered")
+
+        reward = dict(crop_def["yield"])
+        butterflies_caught = 0
+        if crop_def.get("butterflies", False):
+            butterflies_caught = random.randint(1, 3)
+            reward["butterflies"] = reward.get("butterflies", 0) + butterflies_caught
+        self.charge(HARVEST_COST, reward, crop_def["experience"])
+
+        dropped_items = self._roll(crop_def.get("collection_drops", []), CROP_DROP_CHANCE)
+        self._consume(
+            lambda version: farm_store.delete(
+                self.db, "crops", self.user_id, crop["id"], query={"planted_at": crop["planted_at"]}
+            ),
+            lambda removed: farm_store.insert(self.db, "crops", removed),
+            _not_found("Crop not found")
+        )
+        self.deleted.append((self.index, "crops", crop["id"]))
+        self.entities["crops"].pop(crop["id"])
+        await self._release(crop["location"], crop["position"])
+        return {
+            "harvested": crop_def["yield"],
+            "experience_gained": crop_def["experience"],
+            "dropped_items": dropped_items,
+            "butterflies_caught": butterflies_caught
+        }
+
+    async def plant(self, command):
+        crop_def = catalog.crops.get(command.type)
+        if not crop_def:
+            raise _bad_request("Invalid crop type")
+        index = await self._check_free(command.location, command.position)
+        self._check_level(crop_def["level_required"])
+        self.charge(crop_def["cost"])
+
+        crop = Crop(
+            user_id=self.user_id,
+            location=command.location,
+            type=command.type,
+            position=command.position,
+            status="growing",
+            planted_at=self.now,
+            protected=False
+        ).model_dump()
+        self.writes.insert("crops", crop)
+        self.undos.append((self.index, lambda: farm_store.delete(self.db, "crops", self.user_id, crop["id"])))
+        self.entities.setdefault("crops", {})[crop["id"]] = crop
+        self.scheduled.append((self.index, "crops", crop))
+        await self._take(command.location, command.position, index)
+        return {
+            "crop": {
+                "id": crop["id"],
+                "type": crop["type"],
+                "name": crop_def["name"],
+                "position": crop["position"],
+                "location": crop["location"],
+                "status": crop["status"],
+                "plantedAt": crop["planted_at"].isoformat(),
+                "image": crop_def["image"]
+            }
+        }
+
+    def _animal(self, command):
+        animal = self._entity("animals", command.id, "Animal not found")
+        animal_def = catalog.animals.get(animal["type"])
+        if not animal_def:
+            raise _bad_request("Invalid animal type")
+        return animal, animal_def
+
+    async def feed(self, command):
+        animal, animal_def = self._animal(command)
+        self.charge(animal_def["feed_cost"])
+        previous = animal.get("last_fed")
+        animal["last_fed"] = self.now
+        self.writes.update("animals", animal, {"last_fed": self.now})
+        self.undos.append((self.index, lambda: farm_store.update(
+            self.db, "animals", self.user_id, animal["id"], {"last_fed": previous}, query={"last_fed": self.now}
+        )))
+        return {}
+
+    async def collect(self, command):
+        animal, animal_def = self._animal(command)
+        state = timers.evaluate_one("animals", animal, self.now)
+        if state.phase == timers.PENDING:
+            raise _bad_request("Animal is not adult yet")
+        if state.phase != timers.CYCLE_READY:
+            raise _bad_request("Production not ready yet")
+        self.charge(reward=animal_def["production_yield"], experience=animal_def["experience"])
+
+        dropped_items = self._roll(animal_def.get("collection_drops", []), ANIMAL_DROP_CHANCE)
+        previous = animal["last_collected"]
+        animal["last_collected"] = self.now
+        self._consume(
+            lambda version: farm_store.update(
+                self.db, "animals", self.user_id, animal["id"],
+                {"last_collected": self.now, "version": version}, query={"last_collected": previous}
+            ),
+            lambda started: farm_store.update(
+                self.db, "animals", self.user_id, animal["id"],
+                {"last_collected": previous}, query={"last_collected": self.now}
+            ),
+            _bad_request("Production not ready yet")
+        )
+        self.scheduled.append((self.index, "animals", animal))
+        return {
+            "collected": animal_def["production_yield"],
+            "experience_gained": animal_def["experience"],
+            "dropped_items": dropped_items
+        }
+
+    async def collect_building(self, command):
+        building = self._entity("buildings", command.id, "Building not found")
+        state = timers.evaluate_one("buildings", building, self.now)
+        if state.phase == timers.PENDING:
+            raise _bad_request("Building is not ready")
+        collected = catalog.buildings.get(building["type"], {}).get("production", {})
+        if collected and state.phase != timers.CYCLE_READY:
+            raise _bad_request("Not ready to collect yet")
+        self.charge(reward=collected)
+
+        previous = {"status": building["status"], "last_collect_time": building.get("last_collect_time")}
+        changes = {"status": "built", "progress": 100, "last_collect_time": self.now}
+        building.update(changes)
+        self._consume(
+            lambda version: farm_store.update(
+                self.db, "buildings", self.user_id, building["id"], {**changes, "version": version}, query=previous
+            ),
+            lambda started: farm_store.update(
+                self.db, "buildings", self.user_id, building["id"], previous, query={"last_collect_time": self.now}
+            ),
+            _bad_request("Not ready to collect yet")
+        )
+        self.scheduled.append((self.index, "buildings", building))
+        return {"collected": collected}
+
+    async def clear(self, command):
+        territory = self.territory.get((command.location, command.position))
+        if not territory:
+            raise _not_found("Territory element not found")
+        territory_data = catalog.territory.get(territory["type"])
+        if not territory_data:
+            raise _bad_request("Invalid territory type")
+        self.charge(territory_data["clear_cost"], territory_data["rewards"], territory_data["experience"])
+
+        pest_spawned = None
+        for pest_type, chance in (territory_data["pest_chance"] or {}).items():
+            if random.random() < chance:
+                pest = Pest(
+                    user_id=self.user_id,
+                    location=command.location,
+                    type=pest_type,
+                    position=command.position,
+                    status="active"
+                ).model_dump()
+                self.spawned.append((self.index, pest))
+                self.entities.setdefault("pests", {})[pest["id"]] = pest
+                pest_spawned = {"id": pest["id"], "type": pest_type, "position": command.position}
+                break
+
+        self._consume(
+            lambda version: territory_map.clear(self.db, self.user_id, territory, version),
+            lambda cleared: territory_map.unclear(self.db, self.user_id, territory),
+            _not_found("Territory element not found")
+        )
+        self.deleted.append((self.index, "territory", territory["id"]))
+        del self.territory[(command.location, command.position)]
+        await self._release(command.location, command.position)
+        return {
+            "rewards": territory_data["rewards"],
+            "experience_gained": territory_data["experience"],
+            "pest_spawned": pest_spawned
+        }
+
+    async def chase(self, command):
+        pest = self._entity("pests", command.id, "Pest not found")
+        if pest["status"] != "active":
+            raise _not_found("Pest not found")
+        pest_data = catalog.pests.get(pest["type"])
+        if not pest_data:
+            raise _bad_request("Invalid pest type")
+        self.charge(pest_data["chase_cost"], pest_data["rewards"], pest_data["experience"])
+
+        self._consume(
+            lambda version: farm_store.delete(self.db, "pests", self.user_id, pest["id"], query={"status": "active"}),
+            lambda removed: farm_store.insert(self.db, "pests", removed),
+            _not_found("Pest not found")
+        )
+        self.deleted.append((self.index, "pests", pest["id"]))
+        self.entities["pests"].pop(pest["id"])
+        return {
+            "rewards": pest_data["rewards"],
+            "experience_gained": pest_data["experience"]
+        }
+
+    async def purchase(self, command):
+        item = catalog.market.get(command.itemId)
+        if not item:
+            raise _not_found("Item not found")
+        self.charge(item["cost"], item["rewards"])
+        return {"purchased": item["rewards"]}
+
+    async def run(self, command):
+        """Run one command; returns its result (with the error if it failed).
+
+        The result is updated in place if commit() finds the command's entity
+        changed before it could be written.
+        """
+        self.index = len(self.results)
+        try:
+            result = {"action": command.action, "success": True, **await getattr(self, command.action)(command)}
+        except HTTPException as e:
+            result = {"action": command.action, "success": False, "status": e.status_code, "detail": e.detail}
+        self.results.append(result)
+        return result
+
+    # --- persistence
+
+    def _fail(self, index, error):
+        result = self.results[index]
+        action = result["action"]
+        result.clear()
+        result.update({"action": action, "success": False, "status": error.status_code, "detail": error.detail})
+        self.failed.add(index)
+
+    def _went_through(self, entries):
+        return [entry[1:] for entry in entries if entry[0] not in self.failed]
+
+    def _totals(self):
+        """(net change per resource, balance needed at the lowest point, experience) of the commands that went through"""
+        net = Counter()
+        require = {}
+        experience = 0
+        for cost, reward, gained in self._went_through(self.charges):
+            for resource, amount in cost.items():
+                net[resource] -= amount
+                require[resource] = max(require.get(resource, 0), -net[resource])
+            for resource, amount in reward.items():
+                net[resource] += amount
+            experience += gained
+        return net, require, experience
+
+    async def _consume_all(self, version, undos):
+        """Run the guarded writes; commands whose entity changed fail, the rest get an undo"""
+        taken = await asyncio.gather(
+            *(write(version) for _, write, _, _ in self.consumes), return_exceptions=True
+        )
+        errors = [result for result in taken if isinstance(result, BaseException)]
+        for (index, _, undo, error), result in zip(self.consumes, taken):
+            if isinstance(result, BaseException):
+                continue
+            if result:
+                undos.append(lambda undo=undo, result=result: undo(result))
+            else:
+                self._fail(index, error)
+        if errors:
+            raise errors[0]
+
+    async def commit(self):
+        """Write everything the commands did; returns (user, ids of newly exchangeable collections)"""
+        locations = list({*self.taken, *self.released})
+        swapped = []
+        undos = []
+        version = None
+        try:
+            for location in locations:
+                await occupancy.change(
+                    self.db, self.user_id, location,
+                    take=self.taken[location], release=self.released[location]
+                )
+                swapped.append(location)
+
+            if self.consumes or self.writes or self.spawned:
+                version = await next_version(self.db, self.user_id)
+                await self._consume_all(version, undos)
+                for pest in self._went_through(self.spawned):
+                    self.writes.insert("pests", pest[0])
+                    undos.append(lambda pest=pest[0]: farm_store.delete(self.db, "pests", self.user_id, pest["id"]))
+                undos.extend(undo for undo, in self._went_through(self.undos))
+                await self.writes.flush(self.db, version)
+
+            net, require, experience = self._totals()
+            if net or experience:
+                user = await ledger.apply(
+                    self.db, self.user_id,
+                    cost={resource: -amount for resource, amount in net.items() if amount < 0},
+                    reward={resource: amount for resource, amount in net.items() if amount > 0},
+                    experience=experience,
+                    min_level=self.min_level,
+                    require=require
+                )
+            else:
+                user = ledger.with_current_energy(self.user, datetime.utcnow())
+        except Exception:
+            for undo in reversed(undos):
+                await undo()
+            for location in swapped:
+                await occupancy.change(
+                    self.db, self.user_id, location,
+                    take=self.released[location], release=self.taken[location], check=False
+                )
+            raise
+
+        deleted = defaultdict(list)
+        for kind, entity_id in self._went_through(self.deleted):
+            deleted[kind].append(entity_id)
+        await record_deletions(self.db, self.user_id, deleted, version)
+        drops = DropBatch()
+        for items, in self._went_through(self.dropped):
+            for item_id in items:
+                drops.add(self.user_id, item_id)
+        exchangeable = (await drops.flush(self.db)).get(self.user_id, [])
+        for kind, doc in self._went_through(self.scheduled):
+            await schedule_entity(self.db, kind, doc, self.now)
+        return user, exchangeable
+
+def batch_response(results, user, exchangeable):
+    return {
+        "results": results,
+        "exchangeable_collections": exchangeable,
+        "updatedResources": user["resources"],
+        "newExperience": user["experience"],
+        "level": user["level"]
+    }
+
+@router.post("/batch")
+async def run_batch(
+    batch: ActionBatchRequest,
+    request: Request,
+    user_id: str = Depends(get_current_user)
+):
+    """Run an ordered list of commands; one result per command, written together"""
+    db = request.app.state.db
+
+    actions = ActionBatch(db, user_id)
+    await actions.load(
+        kinds={ACTION_KINDS[command.action] for command in batch.commands if command.action in ACTION_KINDS},
+        territory=any(command.action == "clear" for command in batch.commands)
+    )
+    results = [await actions.run(command) for command in batch.commands]
+    user, exchangeable = await actions.commit()
+
+    return batch_response(results, user, exchangeable)
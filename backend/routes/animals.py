@@ -1,67 +1,67 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
 from models.animal import Animal, AnimalCreate
 from utils.auth import get_current_user
-from game_data import ANIMALS_DATA
+from services.sync import next_version, record_deletion
+from services import farm_store, ledger, occupancy
+from services.drops import DropBatch, ANIMAL_DROP_CHANCE
+from services import timers
+from services.scheduler import schedule_entity
+from services.pagination import PageParams
+from services.projections import fields
+from utils.catalog import catalog
 from datetime import datetime
-import random
-import uuid
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 
-@router.get("")
-async def get_animals(request: Request, user_id: str = Depends(get_current_user)):
-    """Get all user's animals"""
-    db = request.app.state.db
-    animals_collection = db.animals
+# Everything serialize_animal, the timer engine and the scheduler read
+ANIMAL_FIELDS = fields("id", "user_id", "type", "position", "location", "created_at", "last_fed", "last_collected")
+
+ANIMAL_STATUS = {timers.PENDING: "growing", timers.DONE: "adult", timers.CYCLE_READY: "producing"}
+
+def serialize_animal(animal, now, state=None):
+    """Animal document -> API shape with status/age as of `now`"""
+    animal_data = catalog.animals.get(animal["type"])
+    state = state or timers.evaluate_one("animals", animal, now)
+    if not animal_data or not state:
+        return None
     
-    animals = await animals_collection.find({"user_id": user_id}).to_list(length=100)
+    animal_status = ANIMAL_STATUS[state.phase]
     
-    updated_animals = []
-    for animal in animals:
-        animal_data = ANIMALS_DATA.get(animal["type"])
-        if not animal_data:
-            continue
-        
-        elapsed = (datetime.utcnow() - animal["created_at"]).total_seconds()
-        
-        # Update status and age
-        current_age = int(elapsed)
-        if current_age >= animal_data["adult_age"]:
-            animal_status = "adult"
-            
-            # Check if can produce
-            if animal["last_collected"]:
-                time_since_collection = (datetime.utcnow() - animal["last_collected"]).total_seconds()
-            else:
-                time_since_collection = elapsed - animal_data["adult_age"]
-            
-            if time_since_collection >= animal_data["production_interval"]:
-                animal_status = "producing"
-        else:
-            animal_status = "growing"
-        
-        # Calculate growth progress
-        if animal_status == "growing":
-            progress = min(100, (current_age / animal_data["adult_age"]) * 100)
-        else:
-            progress = 100
-        
-        updated_animals.append({
-            "id": animal["id"],
-            "type": animal["type"],
-            "name": animal_data["name"],
-            "position": animal["position"],
-            "location": animal["location"],
-            "status": animal_status,
-            "age": current_age,
-            "progress": round(progress, 2),
-            "lastFed": animal["last_fed"].isoformat() if animal["last_fed"] else None,
-            "lastCollected": animal["last_collected"].isoformat() if animal["last_collected"] else None,
-            "canProduce": animal_status == "producing",
-            "image": animal_data["image"]
-        })
+    return {
+        "id": animal["id"],
+        "type": animal["type"],
+        "name": animal_data["name"],
+        "position": animal["position"],
+        "location": animal["location"],
+        "status": animal_status,
+        "age": int(state.elapsed),
+        "progress": round(state.progress, 2),
+        "lastFed": animal["last_fed"],
+        "lastCollected": animal["last_collected"],
+        "canProduce": animal_status == "producing",
+        "nextTransitionAt": state.next_at,
+        "image": animal_data["image"]
+    }
+
+def serialize_animals(animals, now):
+    """Batch of animal documents -> API shapes, evaluated in one timer pass"""
+    states = timers.evaluate("animals", animals, now)
+    serialized = (serialize_animal(animal, now, state) for animal, state in zip(animals, states))
+    return [animal for animal in serialized if animal]
+
+async def fetch_animals(db, user_id):
+    """All user's animals with status updated based on time"""
+    animals = await farm_store.find(db, "animals", user_id, projection=ANIMAL_FIELDS)
     
-    return {"animals": updated_animals}
+    return serialize_animals(animals, datetime.utcnow())
+
+@router.get("")
+async def get_animals(request: Request, page: PageParams = Depends(), user_id: str = Depends(get_current_user)):
+    """Get user's animals (paginated with limit/cursor, or streamed)"""
+    db = request.app.state.db
+    
+    return await farm_store.paginate(db, "animals", user_id, {}, "animals", serialize_animals, page, ANIMAL_FIELDS)
 
 @router.post("")
 async def add_animal(
@@ -71,86 +71,57 @@ async def add_animal(
 ):
     """Add a new animal"""
     db = request.app.state.db
-    users_collection = db.users
-    animals_collection = db.animals
     
     # Get animal definition
-    animal_def = ANIMALS_DATA.get(animal_data.type)
+    animal_def = catalog.animals.get(animal_data.type)
     if not animal_def:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid animal type"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+    # Take the cell (whatever kind holds it), then check level and deduct resources
+    await occupancy.occupy(db, user_id, animal_data.location, animal_data.position)
+    try:
+        user = await ledger.apply(
+            db, user_id,
+            cost=animal_def["cost"],
+            min_level=animal_def["level_required"]
         )
-    
-    # Check level requirement
-    if user["level"] < animal_def["level_required"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Level {animal_def['level_required']} required"
-        )
-    
-    # Check if user has enough resources
+    except HTTPException:
+        await occupancy.release(db, user_id, animal_data.location, animal_data.position)
+        raise
     resources = user["resources"]
-    for resource, amount in animal_def["cost"].items():
-        if resources.get(resource, 0) < amount:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough {resource}"
-            )
-    
-    # Check if position is already occupied
-    existing_animal = await animals_collection.find_one({
-        "user_id": user_id,
-        "position": animal_data.position,
-        "location": animal_data.location
-    })
-    if existing_animal:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Position already occupied"
-        )
-    
-    # Deduct resources
-    for resource, amount in animal_def["cost"].items():
-        resources[resource] -= amount
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources}}
-    )
     
     # Create animal
     new_animal = Animal(
         user_id=user_id,
         location=animal_data.location,
         type=animal_data.type,
-        name=animal_def["name"],
         position=animal_data.position,
         status="growing",
-        age=0,
-        adult_age=animal_def["adult_age"],
         last_fed=None,
         last_collected=None,
-        production_interval=animal_def["production_interval"],
-        production_yield=animal_def["production_yield"]
+        version=await next_version(db, user_id)
     )
     
     animal_dict = new_animal.model_dump()
-    await animals_collection.insert_one(animal_dict)
+    try:
+        await farm_store.insert(db, "animals", animal_dict)
+    except DuplicateKeyError:
+        # Lost a race for the same cell; the unique index is the source of truth
+        await ledger.apply(db, user_id, reward=animal_def["cost"])
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Position already occupied"
+        )
+    await schedule_entity(db, "animals", animal_dict)
     
     return {
         "animal": {
             "id": new_animal.id,
             "type": new_animal.type,
-            "name": new_animal.name,
+            "name": animal_def["name"],
             "position": new_animal.position,
             "location": new_animal.location,
             "status": new_animal.status,
@@ -167,58 +138,34 @@ async def feed_animal(
 ):
     """Feed an animal"""
     db = request.app.state.db
-    users_collection = db.users
-    animals_collection = db.animals
     
     # Get animal
-    animal = await animals_collection.find_one({"id": animal_id, "user_id": user_id})
+    animal = await farm_store.find_one(db, "animals", user_id, {"id": animal_id}, ANIMAL_FIELDS)
     if not animal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Animal not found"
         )
     
-    animal_def = ANIMALS_DATA.get(animal["type"])
+    animal_def = catalog.animals.get(animal["type"])
     if not animal_def:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid animal type"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Check if user has enough food
-    resources = user["resources"]
-    feed_cost = animal_def["feed_cost"]["food"]
-    if resources.get("food", 0) < feed_cost:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Not enough food"
-        )
-    
     # Deduct food
-    resources["food"] -= feed_cost
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources}}
-    )
+    user = await ledger.apply(db, user_id, cost=animal_def["feed_cost"])
     
     # Update animal
-    await animals_collection.update_one(
-        {"id": animal_id},
-        {"$set": {"last_fed": datetime.utcnow()}}
+    await farm_store.update(
+        db, "animals", user_id, animal_id,
+        {"last_fed": datetime.utcnow(), "version": await next_version(db, user_id)}
     )
     
     return {
         "success": True,
-        "updatedResources": resources
+        "updatedResources": user["resources"]
     }
 
 @router.post("/{animal_id}/collect")
@@ -229,19 +176,16 @@ async def collect_from_animal(
 ):
     """Collect production from animal"""
     db = request.app.state.db
-    users_collection = db.users
-    animals_collection = db.animals
-    collections_collection = db.collection_items
     
     # Get animal
-    animal = await animals_collection.find_one({"id": animal_id, "user_id": user_id})
+    animal = await farm_store.find_one(db, "animals", user_id, {"id": animal_id}, ANIMAL_FIELDS)
     if not animal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Animal not found"
         )
     
-    animal_def = ANIMALS_DATA.get(animal["type"])
+    animal_def = catalog.animals.get(animal["type"])
     if not animal_def:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -249,92 +193,63 @@ async def collect_from_animal(
         )
     
     # Check if animal is adult
-    elapsed = (datetime.utcnow() - animal["created_at"]).total_seconds()
-    if elapsed < animal_def["adult_age"]:
+    state = timers.evaluate_one("animals", animal, datetime.utcnow())
+    if state.phase == timers.PENDING:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Animal is not adult yet"
         )
     
     # Check if production is ready
-    if animal["last_collected"]:
-        time_since_collection = (datetime.utcnow() - animal["last_collected"]).total_seconds()
-    else:
-        time_since_collection = elapsed - animal_def["adult_age"]
-    
-    if time_since_collection < animal_def["production_interval"]:
+    if state.phase != timers.CYCLE_READY:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Production not ready yet"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
+    # Start the next cycle first, guarded on the cycle that was checked: of two
+    # concurrent collects only one matches, and only that one is paid
+    now = datetime.utcnow()
+    started = await farm_store.update(
+        db, "animals", user_id, animal_id,
+        {"last_collected": now, "version": await next_version(db, user_id)},
+        query={"last_collected": animal["last_collected"]}
+    )
+    if not started:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Production not ready yet"
         )
     
-    # Add production to user resources
-    resources = user["resources"]
-    for resource, amount in animal["production_yield"].items():
-        resources[resource] = resources.get(resource, 0) + amount
-    
-    # Add experience
-    new_experience = user["experience"] + animal_def["experience"]
-    
-    # Collection drops
-    dropped_items = []
-    if "collection_drops" in animal_def:
-        for item_id in animal_def["collection_drops"]:
-            # Random chance to drop
-            if random.random() < 0.25:  # 25% chance
-                dropped_items.append(item_id)
-                # Add to user's collection
-                existing_item = await collections_collection.find_one({
-                    "user_id": user_id,
-                    "item_id": item_id
-                })
-                if existing_item:
-                    await collections_collection.update_one(
-                        {"id": existing_item["id"]},
-                        {"$inc": {"quantity": 1}}
-                    )
-                else:
-                    await collections_collection.insert_one({
-                        "id": str(uuid.uuid4()),
-                        "user_id": user_id,
-                        "item_id": item_id,
-                        "quantity": 1,
-                        "created_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
-                    })
+    # Add production and experience in one update
+    try:
+        user = await ledger.apply(
+            db, user_id,
+            reward=animal_def["production_yield"],
+            experience=animal_def["experience"]
+        )
+    except HTTPException:
+        await farm_store.update(
+            db, "animals", user_id, animal_id,
+            {"last_collected": animal["last_collected"]}, query={"last_collected": now}
+        )
+        raise
     
-    # Update user
-    await users_collection.update_one(
-        {"id": user_id},
-        {
-            "$set": {
-                "resources": resources,
-                "experience": new_experience
-            }
-        }
-    )
+    # Collection drops, written in one inventory update
+    drops = DropBatch()
+    dropped_items = drops.roll(user_id, animal_def.get("collection_drops", []), ANIMAL_DROP_CHANCE)
+    exchangeable = (await drops.flush(db)).get(user_id, [])
     
-    # Update animal
-    await animals_collection.update_one(
-        {"id": animal_id},
-        {"$set": {"last_collected": datetime.utcnow()}}
-    )
+    await schedule_entity(db, "animals", {**animal, "last_collected": now}, now)
     
     return {
         "success": True,
-        "collected": animal["production_yield"],
+        "collected": animal_def["production_yield"],
         "experience_gained": animal_def["experience"],
         "dropped_items": dropped_items,
-        "updatedResources": resources,
-        "newExperience": new_experience
+        "exchangeable_collections": exchangeable,
+        "updatedResources": user["resources"],
+        "newExperience": user["experience"]
     }
 
 @router.delete("/{animal_id}")
@@ -345,14 +260,16 @@ async def remove_animal(
 ):
     """Remove an animal"""
     db = request.app.state.db
-    animals_collection = db.animals
     
-    result = await animals_collection.delete_one({"id": animal_id, "user_id": user_id})
+    animal = await farm_store.delete(db, "animals", user_id, animal_id, fields("position", "location"))
     
-    if result.deleted_count == 0:
+    if not animal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Animal not found"
         )
     
+    await occupancy.release(db, user_id, animal["location"], animal["position"])
+    await record_deletion(db, user_id, "animals", animal_id)
+    
     return {"success": True}
\ No newline at end of file
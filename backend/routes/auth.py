@@ -1,24 +1,28 @@
-from fastapi import APIRouter, HTTPException, status, Request
+from fastapi import APIRouter, HTTPException, status, Request, Depends
+from fastapi.security import HTTPAuthorizationCredentials
 from models.user import UserCreate, UserLogin, Token, User, UserResponse, Resources
-from utils.auth import hash_password, verify_password, create_access_token
+from utils.auth import hash_password, verify_password, password_needs_rehash, create_access_token, authenticate, revoke_token, revoke_user, security
+from services.projections import fields
 from datetime import datetime
 
 router = APIRouter()
 
+LOGIN_FIELDS = fields("id", "username", "email", "level", "experience", "resources", "password_hash")
+
 @router.post("/register", response_model=Token)
 async def register(user_data: UserCreate, request: Request):
     db = request.app.state.db
     users_collection = db.users
     
     # Check if user already exists
-    existing_user = await users_collection.find_one({"username": user_data.username})
+    existing_user = await users_collection.find_one({"username": user_data.username}, fields("_id"))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists"
         )
     
-    existing_email = await users_collection.find_one({"email": user_data.email})
+    existing_email = await users_collection.find_one({"email": user_data.email}, fields("_id"))
     if existing_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -26,7 +30,7 @@ async def register(user_data: UserCreate, request: Request):
         )
     
     # Create new user
-    hashed_pwd = hash_password(user_data.password)
+    hashed_pwd = await hash_password(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -59,13 +63,20 @@ async def login(user_data: UserLogin, request: Request):
     users_collection = db.users
     
     # Find user
-    user = await users_collection.find_one({"username": user_data.username})
-    if not user or not verify_password(user_data.password, user["password_hash"]):
+    user = await users_collection.find_one({"username": user_data.username}, LOGIN_FIELDS)
+    if not user or not await verify_password(user_data.password, user["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
+    # Upgrade the stored hash if the configured bcrypt cost has changed
+    if password_needs_rehash(user["password_hash"]):
+        await users_collection.update_one(
+            {"id": user["id"], "password_hash": user["password_hash"]},
+            {"$set": {"password_hash": await hash_password(user_data.password)}}
+        )
+    
     # Create token
     token = create_access_token({"sub": user["id"]})
     
@@ -79,3 +90,22 @@ async def login(user_data: UserLogin, request: Request):
     )
     
     return Token(access_token=token, user=user_response)
+
+@router.post("/logout")
+async def logout(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Revoke the token used for this request"""
+    db = request.app.state.db
+    await authenticate(db, credentials.credentials)
+    await revoke_token(db, credentials.credentials)
+    
+    return {"success": True}
+
+@router.post("/logout-all")
+async def logout_all(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Revoke every token issued to this user so far, on every device"""
+    db = request.app.state.db
+    payload = await authenticate(db, credentials.credentials)
+    await revoke_user(db, payload["sub"])
+    await revoke_token(db, credentials.credentials)
+    
+    return {"success": True}
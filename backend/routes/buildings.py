@@ -1,67 +1,70 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
 from models.building import Building, BuildingCreate, BuildingResponse
 from utils.auth import get_current_user
-from utils.game_data import BUILDINGS_DATA
-from datetime import datetime
+from utils.catalog import catalog
+from services.sync import next_version, record_deletion
+from services import farm_store, ledger, occupancy, timers
+from services.scheduler import schedule_entity
+from services.pagination import PageParams
+from services.projections import fields
+from datetime import datetime, timedelta
 from typing import List
 
 router = APIRouter()
 
+# Everything serialize_building, the timer engine and the scheduler read
+BUILDING_FIELDS = fields(
+    "id", "user_id", "type", "position", "status", "start_time", "build_time", "last_collect_time", "level"
+)
+
+def serialize_building(building, now, state=None):
+    """Building document -> BuildingResponse-shaped dict as of `now`"""
+    building_def = catalog.buildings.get(building["type"], {})
+    state = state or timers.evaluate_one("buildings", building, now)
+    built = state.phase != timers.PENDING
+    last_collect = building.get("last_collect_time")
+    if built and not last_collect:
+        # Income accrues from the moment construction finished
+        last_collect = building["start_time"] + timedelta(seconds=building["build_time"])
+    
+    return {
+        "id": building["id"],
+        "type": building["type"],
+        "name": building_def.get("name", building["type"]),
+        "position": building["position"],
+        "status": "built" if built else "building",
+        "progress": state.progress,
+        "startTime": building["start_time"],
+        "buildTime": building["build_time"],
+        "lastCollectTime": last_collect,
+        "readyToCollect": state.phase == timers.CYCLE_READY,
+        "level": building["level"],
+        "production": building_def.get("production", {}),
+        "image": building_def.get("image", ""),
+        "nextTransitionAt": state.next_at
+    }
+
+def serialize_buildings(buildings, now):
+    """Batch of building documents -> API shapes, evaluated in one timer pass"""
+    states = timers.evaluate("buildings", buildings, now)
+    return [serialize_building(building, now, state) for building, state in zip(buildings, states)]
+
+async def fetch_buildings(db, user_id):
+    """All user's buildings as of now (read-only).
+
+    Finished construction shows as built straight away; the stored status is
+    brought up to date by the scheduler (or the next collect).
+    """
+    buildings = await farm_store.find(db, "buildings", user_id, projection=BUILDING_FIELDS)
+    
+    return serialize_buildings(buildings, datetime.utcnow())
+
 @router.get("", response_model=List[BuildingResponse])
-async def get_buildings(request: Request, user_id: str = Depends(get_current_user)):
+async def get_buildings(request: Request, page: PageParams = Depends(), user_id: str = Depends(get_current_user)):
+    """User's buildings; with `limit` the next cursor is in the X-Next-Cursor header"""
     db = request.app.state.db
-    buildings_collection = db.buildings
-    
-    buildings = await buildings_collection.find({"user_id": user_id}).to_list(length=100)
-    
-    response_buildings = []
-    for building in buildings:
-        # Auto-update building status if construction is complete
-        if building["status"] == "building":
-            elapsed = (datetime.utcnow() - building["start_time"]).total_seconds()
-            if elapsed >= building["build_time"]:
-                building["status"] = "built"
-                building["progress"] = 100
-                building["last_collect_time"] = datetime.utcnow()
-                
-                await buildings_collection.update_one(
-                    {"id": building["id"]},
-                    {"$set": {
-                        "status": "built",
-                        "progress": 100,
-                        "last_collect_time": datetime.utcnow()
-                    }}
-                )
-            else:
-                building["progress"] = (elapsed / building["build_time"]) * 100
-        # Calculate if ready to collect
-        ready_to_collect = False
-        if building["status"] == "built" and building.get("production"):
-            last_collect = building.get("last_collect_time")
-            if last_collect:
-                time_since_collect = (datetime.utcnow() - last_collect).total_seconds()
-                if time_since_collect >= 60:  # 1 minute production interval
-                    ready_to_collect = True
-        
-        response_buildings.append(
-            BuildingResponse(
-                id=building["id"],
-                type=building["type"],
-                name=building["name"],
-                position=building["position"],
-                status=building["status"],
-                progress=building["progress"],
-                startTime=building["start_time"].isoformat(),
-                buildTime=building["build_time"],
-                lastCollectTime=building["last_collect_time"].isoformat() if building.get("last_collect_time") else None,
-                readyToCollect=ready_to_collect,
-                level=building["level"],
-                production=building["production"],
-                image=BUILDINGS_DATA.get(building["type"], {}).get("image", "")
-            )
-        )
     
-    return response_buildings
+    return await farm_store.paginate(db, "buildings", user_id, {}, None, serialize_buildings, page, BUILDING_FIELDS)
 
 @router.post("", response_model=BuildingResponse)
 async def create_building(
@@ -70,74 +73,41 @@ async def create_building(
     user_id: str = Depends(get_current_user)
 ):
     db = request.app.state.db
-    buildings_collection = db.buildings
-    users_collection = db.users
     
     # Get building definition
-    building_def = BUILDINGS_DATA.get(building_data.buildingType)
+    building_def = catalog.buildings.get(building_data.buildingType)
     if not building_def:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Building type not found"
         )
     
-    # Check if user can afford
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    resources = user["resources"]
-    for resource, cost in building_def["cost"].items():
-        if resources.get(resource, 0) < cost:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough {resource}"
-            )
-    
-    # Deduct resources
-    for resource, cost in building_def["cost"].items():
-        resources[resource] -= cost
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources, "updated_at": datetime.utcnow()}}
-    )
+    # Take the cell (whatever kind holds it), then deduct resources
+    await occupancy.occupy(db, user_id, "main", building_data.position)
+    try:
+        await ledger.apply(db, user_id, cost=building_def["cost"])
+    except HTTPException:
+        await occupancy.release(db, user_id, "main", building_data.position)
+        raise
     
     # Create building
     new_building = Building(
         user_id=user_id,
         type=building_data.buildingType,
-        name=building_def["name"],
         position=building_data.position,
         status="building",
         progress=0.0,
         start_time=datetime.utcnow(),
         build_time=building_def["time"],
-        production=building_def["production"],
-        level=1
+        level=1,
+        version=await next_version(db, user_id)
     )
     
     building_dict = new_building.model_dump()
-    await buildings_collection.insert_one(building_dict)
-    
-    return BuildingResponse(
-        id=new_building.id,
-        type=new_building.type,
-        name=new_building.name,
-        position=new_building.position,
-        status=new_building.status,
-        progress=new_building.progress,
-        startTime=new_building.start_time.isoformat(),
-        buildTime=new_building.build_time,
-        lastCollectTime=None,
-        readyToCollect=False,
-        level=new_building.level,
-        production=new_building.production,
-        image=building_def.get("image", "")
-    )
+    await farm_store.insert(db, "buildings", building_dict)
+    await schedule_entity(db, "buildings", building_dict)
+    
+    return serialize_building(building_dict, new_building.start_time)
 
 @router.post("/{building_id}/collect")
 async def collect_building(
@@ -146,56 +116,62 @@ async def collect_building(
     user_id: str = Depends(get_current_user)
 ):
     db = request.app.state.db
-    buildings_collection = db.buildings
-    users_collection = db.users
     
     # Get building
-    building = await buildings_collection.find_one({"id": building_id, "user_id": user_id})
+    building = await farm_store.find_one(db, "buildings", user_id, {"id": building_id}, BUILDING_FIELDS)
     if not building:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Building not found"
         )
     
-    if building["status"] != "built":
+    now = datetime.utcnow()
+    state = timers.evaluate_one("buildings", building, now)
+    if state.phase == timers.PENDING:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Building is not ready"
         )
     
     # Check if ready to collect
-    last_collect = building.get("last_collect_time")
-    if last_collect:
-        time_since_collect = (datetime.utcnow() - last_collect).total_seconds()
-        if time_since_collect < 60:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Not ready to collect yet"
-            )
-    
-    # Add resources
-    user = await users_collection.find_one({"id": user_id})
-    resources = user["resources"]
-    
-    collected = building["production"]
-    for resource, amount in collected.items():
-        resources[resource] = resources.get(resource, 0) + amount
+    collected = catalog.buildings.get(building["type"], {}).get("production", {})
+    if collected and state.phase != timers.CYCLE_READY:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Not ready to collect yet"
+        )
     
-    # Update user resources and building
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources, "updated_at": datetime.utcnow()}}
+    # Start the next cycle first, guarded on the state that was checked: of two
+    # concurrent collects only one matches, and only that one is paid
+    last_collect_time = building.get("last_collect_time")
+    started = await farm_store.update(
+        db, "buildings", user_id, building_id,
+        {"status": "built", "progress": 100, "last_collect_time": now, "version": await next_version(db, user_id)},
+        query={"status": building["status"], "last_collect_time": last_collect_time}
     )
+    if not started:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Not ready to collect yet"
+        )
     
-    await buildings_collection.update_one(
-        {"id": building_id},
-        {"$set": {"last_collect_time": datetime.utcnow()}}
-    )
+    # Add resources
+    try:
+        user = await ledger.apply(db, user_id, reward=collected)
+    except HTTPException:
+        await farm_store.update(
+            db, "buildings", user_id, building_id,
+            {"status": building["status"], "last_collect_time": last_collect_time},
+            query={"last_collect_time": now}
+        )
+        raise
+    
+    await schedule_entity(db, "buildings", {**building, "status": "built", "last_collect_time": now}, now)
     
     return {
         "success": True,
         "collected": collected,
-        "updatedResources": resources
+        "updatedResources": user["resources"]
     }
 
 @router.delete("/{building_id}")
@@ -205,14 +181,16 @@ async def delete_building(
     user_id: str = Depends(get_current_user)
 ):
     db = request.app.state.db
-    buildings_collection = db.buildings
     
-    result = await buildings_collection.delete_one({"id": building_id, "user_id": user_id})
+    building = await farm_store.delete(db, "buildings", user_id, building_id, fields("position"))
     
-    if result.deleted_count == 0:
+    if not building:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Building not found"
         )
     
+    await occupancy.release(db, user_id, "main", building["position"])
+    await record_deletion(db, user_id, "buildings", building_id)
+    
     return {"success": True}
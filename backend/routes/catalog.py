@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Request
+from utils.catalog import catalog
+
+router = APIRouter()
+
+# Both bodies only change on deploy: they are serialized and compressed once at
+# startup, and clients revalidate with If-None-Match
+
+@router.get("")
+async def get_catalog(request: Request):
+    """All game definitions, precompressed JSON with a content-hash ETag"""
+    return catalog.payload.response(request)
+
+@router.get("/names")
+async def get_catalog_names(request: Request):
+    """Localized display names by section and id, precompressed like the catalog"""
+    return catalog.names_payload.response(request)
@@ -1,50 +1,96 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
 from utils.auth import get_current_user
-from game_data import COLLECTIONS_DATA
-from datetime import datetime
-import uuid
+from utils.catalog import catalog
+from services import inventory, ledger
+from services.pagination import PageParams, STREAM_BATCH_SIZE, ndjson_response, page_response
+from utils.responses import GameResponse
 
 router = APIRouter()
 
+def _collection_entry(collection_id, collection_data, items_dict):
+    """One collection with the user's progress towards it"""
+    items_collected = {}
+    can_exchange = True
+    
+    for item_id, needed in collection_data["items_needed"].items():
+        collected = items_dict.get(item_id, 0)
+        items_collected[item_id] = collected
+        
+        if collected < needed:
+            can_exchange = False
+    
+    return {
+        "id": collection_id,
+        "name": collection_data["name"],
+        "items": collection_data["items"],
+        "items_needed": collection_data["items_needed"],
+        "items_collected": items_collected,
+        "can_exchange": can_exchange,
+        "rewards": collection_data["rewards"],
+        "image": collection_data["image"]
+    }
+
+async def _collection_entries(db, user_id, collection_ids):
+    """Entries for `collection_ids` plus the counts of the items they need"""
+    needed = {
+        item_id
+        for collection_id in collection_ids
+        for item_id in catalog.collections[collection_id]["items_needed"]
+    }
+    items_dict = await inventory.counts(db, user_id, needed)
+    entries = [
+        _collection_entry(collection_id, catalog.collections[collection_id], items_dict)
+        for collection_id in collection_ids
+    ]
+    return entries, items_dict
+
+async def fetch_collections(db, user_id):
+    """All collections with user's progress, plus the raw item counts"""
+    items_dict = await inventory.counts(db, user_id)
+    
+    collections_list = [
+        _collection_entry(collection_id, collection_data, items_dict)
+        for collection_id, collection_data in catalog.collections.items()
+    ]
+    
+    return {"collections": collections_list, "items": items_dict}
+
 @router.get("")
-async def get_collections(request: Request, user_id: str = Depends(get_current_user)):
-    """Get all collections with user's progress"""
+async def get_collections(request: Request, page: PageParams = Depends(), user_id: str = Depends(get_current_user)):
+    """Get collections with user's progress (paginated with limit/cursor, or streamed).
+
+    Collections come from the catalog, so pages follow catalog order and the
+    cursor is the id of the last collection on the page.
+    """
     db = request.app.state.db
-    collections_collection = db.collection_items
     
-    # Get all user's collection items
-    user_items = await collections_collection.find({"user_id": user_id}).to_list(length=200)
+    if page.limit is None and page.cursor is None and not page.stream:
+        return GameResponse(await fetch_collections(db, user_id))
     
-    # Organize items by item_id
-    items_dict = {}
-    for item in user_items:
-        items_dict[item["item_id"]] = item["quantity"]
+    collection_ids = list(catalog.collections)
+    start = 0
+    if page.cursor:
+        if page.cursor not in catalog.collections:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        start = collection_ids.index(page.cursor) + 1
+    end = len(collection_ids) if page.limit is None else start + page.limit
+    selected = collection_ids[start:end]
     
-    # Build collections list
-    collections_list = []
-    for collection_id, collection_data in COLLECTIONS_DATA.items():
-        items_collected = {}
-        can_exchange = True
+    if page.stream:
+        async def entries():
+            for offset in range(0, len(selected), STREAM_BATCH_SIZE):
+                batch, _ = await _collection_entries(db, user_id, selected[offset:offset + STREAM_BATCH_SIZE])
+                for entry in batch:
+                    yield entry
         
-        for item_id, needed in collection_data["items_needed"].items():
-            collected = items_dict.get(item_id, 0)
-            items_collected[item_id] = collected
-            
-            if collected < needed:
-                can_exchange = False
-        
-        collections_list.append({
-            "id": collection_id,
-            "name": collection_data["name"],
-            "items": collection_data["items"],
-            "items_needed": collection_data["items_needed"],
-            "items_collected": items_collected,
-            "can_exchange": can_exchange,
-            "rewards": collection_data["rewards"],
-            "image": collection_data["image"]
-        })
+        return ndjson_response(entries())
     
-    return {"collections": collections_list, "items": items_dict}
+    collections_list, items_dict = await _collection_entries(db, user_id, selected)
+    next_cursor = selected[-1] if selected and end < len(collection_ids) else None
+    return page_response("collections", collections_list, next_cursor, items=items_dict)
 
 @router.post("/{collection_id}/exchange")
 async def exchange_collection(
@@ -54,75 +100,25 @@ async def exchange_collection(
 ):
     """Exchange a completed collection for rewards"""
     db = request.app.state.db
-    users_collection = db.users
-    collections_collection = db.collection_items
     
     # Get collection definition
-    collection_data = COLLECTIONS_DATA.get(collection_id)
+    collection_data = catalog.collections.get(collection_id)
     if not collection_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Collection not found"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Check if user has all required items
-    user_items = await collections_collection.find({"user_id": user_id}).to_list(length=200)
-    items_dict = {item["item_id"]: item for item in user_items}
-    
-    for item_id, needed in collection_data["items_needed"].items():
-        item = items_dict.get(item_id)
-        if not item or item["quantity"] < needed:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough {item_id}"
-            )
-    
-    # Deduct items
-    for item_id, needed in collection_data["items_needed"].items():
-        item = items_dict[item_id]
-        new_quantity = item["quantity"] - needed
-        
-        if new_quantity > 0:
-            await collections_collection.update_one(
-                {"id": item["id"]},
-                {"$set": {"quantity": new_quantity, "updated_at": datetime.utcnow()}}
-            )
-        else:
-            await collections_collection.delete_one({"id": item["id"]})
+    # Take every required item in one guarded update (400 if any is short)
+    await inventory.take(db, user_id, collection_data["items_needed"])
     
     # Add rewards
-    resources = user["resources"]
-    new_experience = user["experience"]
-    
-    for reward, amount in collection_data["rewards"].items():
-        if reward == "experience":
-            new_experience += amount
-        else:
-            resources[reward] = resources.get(reward, 0) + amount
-    
-    # Update user
-    await users_collection.update_one(
-        {"id": user_id},
-        {
-            "$set": {
-                "resources": resources,
-                "experience": new_experience,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    reward, experience = ledger.split_rewards(collection_data["rewards"])
+    user = await ledger.apply(db, user_id, reward=reward, experience=experience)
     
     return {
         "success": True,
         "rewards": collection_data["rewards"],
-        "updatedResources": resources,
-        "newExperience": new_experience
+        "updatedResources": user["resources"],
+        "newExperience": user["experience"]
     }
@@ -2,57 +2,66 @@ from fastapi import APIRouter, HTTPException, status, Request, Depends
 from models.crop import Crop, CropCreate
 from models.user import Resources
 from utils.auth import get_current_user
-from game_data import CROPS_DATA, COLLECTIONS_DATA
+from services.sync import next_version, record_deletion
+from services import farm_store, ledger, occupancy
+from services.drops import DropBatch, CROP_DROP_CHANCE
+from services import timers
+from services.pagination import PageParams
+from services.projections import fields
+from services.scheduler import schedule_entity
+from utils.catalog import catalog
 from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
 import random
 
 router = APIRouter()
 
-@router.get("")
-async def get_crops(request: Request, user_id: str = Depends(get_current_user)):
-    """Get all user's crops"""
-    db = request.app.state.db
-    crops_collection = db.crops
+# Everything serialize_crop and the timer engine read
+CROP_FIELDS = fields("id", "user_id", "type", "position", "location", "planted_at", "protected")
+
+CROP_STATUS = {timers.PENDING: "growing", timers.DONE: "ready", timers.EXPIRED: "withered"}
+
+HARVEST_COST = {"energy": 2}
+
+def serialize_crop(crop, now, state=None):
+    """Crop document -> API shape with status/progress as of `now`"""
+    crop_data = catalog.crops.get(crop["type"])
+    state = state or timers.evaluate_one("crops", crop, now)
+    if not crop_data or not state:
+        return None
     
-    crops = await crops_collection.find({"user_id": user_id}).to_list(length=100)
+    return {
+        "id": crop["id"],
+        "type": crop["type"],
+        "name": crop_data["name"],
+        "position": crop["position"],
+        "location": crop["location"],
+        "status": CROP_STATUS[state.phase],
+        "progress": round(state.progress, 2),
+        "plantedAt": crop["planted_at"],
+        "nextTransitionAt": state.next_at,
+        "protected": crop["protected"],
+        "image": crop_data["image"]
+    }
+
+def serialize_crops(crops, now):
+    """Batch of crop documents -> API shapes, evaluated in one timer pass"""
+    states = timers.evaluate("crops", crops, now)
+    serialized = (serialize_crop(crop, now, state) for crop, state in zip(crops, states))
+    return [crop for crop in serialized if crop]
+
+async def fetch_crops(db, user_id):
+    """All user's crops with status updated based on time"""
+    crops = await farm_store.find(db, "crops", user_id, projection=CROP_FIELDS)
     
-    # Update crop status based on time
-    updated_crops = []
-    for crop in crops:
-        crop_data = CROPS_DATA.get(crop["type"])
-        if not crop_data:
-            continue
-            
-        elapsed = (datetime.utcnow() - crop["planted_at"]).total_seconds()
-        
-        # Update status
-        if elapsed >= crop_data["grow_time"] + crop_data["wither_time"] and not crop["protected"]:
-            crop["status"] = "withered"
-        elif elapsed >= crop_data["grow_time"]:
-            crop["status"] = "ready"
-        else:
-            crop["status"] = "growing"
-            
-        # Calculate progress
-        if crop["status"] == "growing":
-            progress = min(100, (elapsed / crop_data["grow_time"]) * 100)
-        else:
-            progress = 100
-            
-        updated_crops.append({
-            "id": crop["id"],
-            "type": crop["type"],
-            "name": crop_data["name"],
-            "position": crop["position"],
-            "location": crop["location"],
-            "status": crop["status"],
-            "progress": round(progress, 2),
-            "plantedAt": crop["planted_at"].isoformat(),
-            "protected": crop["protected"],
-            "image": crop_data["image"]
-        })
+    return serialize_crops(crops, datetime.utcnow())
+
+@router.get("")
+async def get_crops(request: Request, page: PageParams = Depends(), user_id: str = Depends(get_current_user)):
+    """Get user's crops (paginated with limit/cursor, or streamed)"""
+    db = request.app.state.db
     
-    return {"crops": updated_crops}
+    return await farm_store.paginate(db, "crops", user_id, {}, "crops", serialize_crops, page, CROP_FIELDS)
 
 @router.post("")
 async def plant_crop(
@@ -62,85 +71,57 @@ async def plant_crop(
 ):
     """Plant a new crop"""
     db = request.app.state.db
-    users_collection = db.users
-    crops_collection = db.crops
     
     # Get crop definition
-    crop_def = CROPS_DATA.get(crop_data.type)
+    crop_def = catalog.crops.get(crop_data.type)
     if not crop_def:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid crop type"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Check level requirement
-    if user["level"] < crop_def["level_required"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Level {crop_def['level_required']} required"
+    # Take the cell (whatever kind holds it), then check level and deduct resources
+    await occupancy.occupy(db, user_id, crop_data.location, crop_data.position)
+    try:
+        user = await ledger.apply(
+            db, user_id,
+            cost=crop_def["cost"],
+            min_level=crop_def["level_required"]
         )
-    
-    # Check if user has enough resources
+    except HTTPException:
+        await occupancy.release(db, user_id, crop_data.location, crop_data.position)
+        raise
     resources = user["resources"]
-    for resource, amount in crop_def["cost"].items():
-        if resources.get(resource, 0) < amount:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough {resource}"
-            )
-    
-    # Check if position is already occupied
-    existing_crop = await crops_collection.find_one({
-        "user_id": user_id,
-        "position": crop_data.position,
-        "location": crop_data.location
-    })
-    if existing_crop:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Position already occupied"
-        )
-    
-    # Deduct resources
-    for resource, amount in crop_def["cost"].items():
-        resources[resource] -= amount
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources}}
-    )
     
     # Create crop
     new_crop = Crop(
         user_id=user_id,
         location=crop_data.location,
         type=crop_data.type,
-        name=crop_def["name"],
         position=crop_data.position,
         status="growing",
         planted_at=datetime.utcnow(),
-        grow_time=crop_def["grow_time"],
-        wither_time=crop_def["wither_time"],
-        yield_data=crop_def["yield"],
-        protected=False
+        protected=False,
+        version=await next_version(db, user_id)
     )
     
     crop_dict = new_crop.model_dump()
-    await crops_collection.insert_one(crop_dict)
+    try:
+        await farm_store.insert(db, "crops", crop_dict)
+    except DuplicateKeyError:
+        # Lost a race for the same cell; the unique index is the source of truth
+        await ledger.apply(db, user_id, reward=crop_def["cost"])
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Position already occupied"
+        )
+    await schedule_entity(db, "crops", crop_dict)
     
     return {
         "crop": {
             "id": new_crop.id,
             "type": new_crop.type,
-            "name": new_crop.name,
+            "name": crop_def["name"],
             "position": new_crop.position,
             "location": new_crop.location,
             "status": new_crop.status,
@@ -158,19 +139,16 @@ async def harvest_crop(
 ):
     """Harvest a ready crop"""
     db = request.app.state.db
-    users_collection = db.users
-    crops_collection = db.crops
-    collections_collection = db.collection_items
     
     # Get crop
-    crop = await crops_collection.find_one({"id": crop_id, "user_id": user_id})
+    crop = await farm_store.find_one(db, "crops", user_id, {"id": crop_id}, CROP_FIELDS)
     if not crop:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Crop not found"
         )
     
-    crop_def = CROPS_DATA.get(crop["type"])
+    crop_def = catalog.crops.get(crop["type"])
     if not crop_def:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -178,99 +156,68 @@ async def harvest_crop(
         )
     
     # Check if crop is ready
-    elapsed = (datetime.utcnow() - crop["planted_at"]).total_seconds()
-    if elapsed < crop_def["grow_time"]:
+    state = timers.evaluate_one("crops", crop, datetime.utcnow())
+    if state.phase == timers.PENDING:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Crop is not ready yet"
         )
     
     # Check if withered
-    if elapsed >= crop_def["grow_time"] + crop_def["wither_time"] and not crop["protected"]:
+    if state.phase == timers.EXPIRED:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Crop has withered"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Check energy
-    if user["resources"].get("energy", 0) < 2:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Not enough energy"
-        )
-    
-    # Add yield to user resources
-    resources = user["resources"]
-    resources["energy"] -= 2
-    for resource, amount in crop["yield_data"].items():
-        resources[resource] = resources.get(resource, 0) + amount
-    
-    # Add experience
-    new_experience = user["experience"] + crop_def["experience"]
-    
-    # Collection drops
-    dropped_items = []
-    if "collection_drops" in crop_def:
-        for item_id in crop_def["collection_drops"]:
-            # Random chance to drop
-            if random.random() < 0.3:  # 30% chance
-                dropped_items.append(item_id)
-                # Add to user's collection
-                existing_item = await collections_collection.find_one({
-                    "user_id": user_id,
-                    "item_id": item_id
-                })
-                if existing_item:
-                    await collections_collection.update_one(
-                        {"id": existing_item["id"]},
-                        {"$inc": {"quantity": 1}}
-                    )
-                else:
-                    await collections_collection.insert_one({
-                        "id": str(uuid.uuid4()),
-                        "user_id": user_id,
-                        "item_id": item_id,
-                        "quantity": 1,
-                        "created_at": datetime.utcnow(),
-                        "updated_at": datetime.utcnow()
-                    })
+    # Yield to add to user resources
+    reward = dict(crop_def["yield"])
     
     # Check for butterflies (if flower crop)
     butterflies_caught = 0
     if crop_def.get("butterflies", False):
         butterflies_caught = random.randint(1, 3)
-        resources["butterflies"] = resources.get("butterflies", 0) + butterflies_caught
+        reward["butterflies"] = reward.get("butterflies", 0) + butterflies_caught
     
-    # Update user
-    await users_collection.update_one(
-        {"id": user_id},
-        {
-            "$set": {
-                "resources": resources,
-                "experience": new_experience
-            }
-        }
-    )
+    # Take the crop first, guarded on the planting that was checked: of two
+    # concurrent harvests only one gets it, and only that one is paid
+    removed = await farm_store.delete(db, "crops", user_id, crop_id, query={"planted_at": crop["planted_at"]})
+    if not removed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Crop not found"
+        )
     
-    # Remove crop
-    await crops_collection.delete_one({"id": crop_id})
+    # Spend energy, add yield and experience in one guarded update
+    try:
+        user = await ledger.apply(
+            db, user_id,
+            cost=HARVEST_COST,
+            reward=reward,
+            experience=crop_def["experience"]
+        )
+    except HTTPException:
+        # Its cell is still taken, so the crop can go back as it was
+        await farm_store.insert(db, "crops", removed)
+        raise
+    
+    # Collection drops, written in one inventory update
+    drops = DropBatch()
+    dropped_items = drops.roll(user_id, crop_def.get("collection_drops", []), CROP_DROP_CHANCE)
+    exchangeable = (await drops.flush(db)).get(user_id, [])
+    
+    await occupancy.release(db, user_id, crop["location"], crop["position"])
+    await record_deletion(db, user_id, "crops", crop_id)
     
     return {
         "success": True,
-        "harvested": crop["yield_data"],
+        "harvested": crop_def["yield"],
         "experience_gained": crop_def["experience"],
         "dropped_items": dropped_items,
+        "exchangeable_collections": exchangeable,
         "butterflies_caught": butterflies_caught,
-        "updatedResources": resources,
-        "newExperience": new_experience
+        "updatedResources": user["resources"],
+        "newExperience": user["experience"]
     }
 
 @router.delete("/{crop_id}")
@@ -281,16 +228,18 @@ async def remove_crop(
 ):
     """Remove a crop (e.g., withered crop)"""
     db = request.app.state.db
-    crops_collection = db.crops
     
-    result = await crops_collection.delete_one({"id": crop_id, "user_id": user_id})
+    crop = await farm_store.delete(db, "crops", user_id, crop_id, fields("position", "location"))
     
-    if result.deleted_count == 0:
+    if not crop:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Crop not found"
         )
     
+    await occupancy.release(db, user_id, crop["location"], crop["position"])
+    await record_deletion(db, user_id, "crops", crop_id)
+    
     return {"success": True}
 
 @router.post("/{crop_id}/protect")
@@ -301,45 +250,30 @@ async def protect_crop(
 ):
     """Apply drought protection to crop"""
     db = request.app.state.db
-    users_collection = db.users
-    crops_collection = db.crops
-    
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
     
-    # Check if user has drought protection
-    if user["resources"].get("drought_protection", 0) < 1:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No drought protection available"
-        )
+    # Deduct protection
+    try:
+        user = await ledger.apply(db, user_id, cost={"drought_protection": 1})
+    except HTTPException as e:
+        if e.status_code == status.HTTP_400_BAD_REQUEST:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No drought protection available"
+            )
+        raise
     
     # Update crop
-    result = await crops_collection.update_one(
-        {"id": crop_id, "user_id": user_id},
-        {"$set": {"protected": True}}
+    updated = await farm_store.update(
+        db, "crops", user_id, crop_id,
+        {"protected": True, "version": await next_version(db, user_id)}
     )
     
-    if result.modified_count == 0:
+    if not updated:
+        # Give the protection back
+        await ledger.apply(db, user_id, reward={"drought_protection": 1})
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Crop not found"
         )
     
-    # Deduct protection
-    resources = user["resources"]
-    resources["drought_protection"] -= 1
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources}}
-    )
-    
-    return {"success": True, "updatedResources": resources}
-
-import uuid
\ No newline at end of file
+    return {"success": True, "updatedResources": user["resources"]}
@@ -0,0 +1,178 @@
+from fastapi import APIRouter, HTTPException, status, Request, Depends, Query
+from utils.auth import get_current_user
+from routes.player import fetch_profile
+from routes.buildings import fetch_buildings, serialize_buildings
+from routes.crops import fetch_crops, serialize_crops
+from routes.animals import fetch_animals, serialize_animals
+from routes.territory import fetch_territory, serialize_territories
+from routes.pests import fetch_pests, serialize_pests
+from routes.collections import fetch_collections
+from routes.quests import fetch_quests
+from routes.friends import fetch_friends
+from routes.actions import ActionBatch, batch_response
+from routes.crops import HARVEST_COST
+from models.action import ActionCommand
+from services import farm_store, territory_map, timers
+from utils.catalog import catalog
+from utils.responses import GameResponse
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+import asyncio
+
+router = APIRouter()
+
+# Snapshot section -> loader shared with the individual list endpoints
+SNAPSHOT_SECTIONS = {
+    "profile": fetch_profile,
+    "buildings": fetch_buildings,
+    "crops": fetch_crops,
+    "animals": fetch_animals,
+    "territory": fetch_territory,
+    "pests": fetch_pests,
+    "collections": fetch_collections,
+    "quests": fetch_quests,
+    "friends": fetch_friends,
+}
+
+# Farm sections that can be served from one farm_store.load in aggregate mode
+FARM_SERIALIZERS = {
+    "buildings": serialize_buildings,
+    "crops": serialize_crops,
+    "animals": serialize_animals,
+    "territory": serialize_territories,
+    "pests": serialize_pests,
+}
+
+async def _preloaded_sections(db, user_id, names):
+    """Farm sections from a single read of the player's farm document(s)"""
+    farm = await farm_store.load(db, user_id, kinds=names, queries={"pests": {"status": "active"}})
+    if "territory" in farm:
+        farm["territory"] = await territory_map.load(db, user_id, diffs=farm["territory"])
+    now = datetime.utcnow()
+    return {name: FARM_SERIALIZERS[name](docs, now) for name, docs in farm.items()}
+
+@router.get("/snapshot")
+async def get_snapshot(
+    request: Request,
+    sections: Optional[str] = Query(None, description="Comma-separated sections, all by default"),
+    user_id: str = Depends(get_current_user)
+):
+    """Load the whole farm (or the requested sections) in one request"""
+    db = request.app.state.db
+    
+    if sections:
+        selected = list(dict.fromkeys(name.strip() for name in sections.split(",") if name.strip()))
+        unknown = [name for name in selected if name not in SNAPSHOT_SECTIONS]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown sections: {', '.join(unknown)}"
+            )
+    else:
+        selected = list(SNAPSHOT_SECTIONS)
+    
+    preloaded = {}
+    farm_sections = [name for name in selected if name in FARM_SERIALIZERS]
+    if farm_store.AGGREGATE and farm_sections:
+        preloaded = await _preloaded_sections(db, user_id, farm_sections)
+    
+    loaded = [name for name in selected if name not in preloaded]
+    results = await asyncio.gather(*(SNAPSHOT_SECTIONS[name](db, user_id) for name in loaded))
+    sections = {**preloaded, **dict(zip(loaded, results))}
+    
+    return GameResponse({name: sections[name] for name in selected})
+
+# Buildings live on the main farm; only types with production can be collected
+SWEEP_BUILDING_LOCATION = "main"
+PRODUCING_BUILDINGS = [building_type for building_type, data in catalog.buildings.items() if data.get("production")]
+
+def _ready(kind, docs, now, phase):
+    """The documents whose timer is in `phase`, soonest next event first (none last)"""
+    ready = [
+        (state.next_at or datetime.max, doc)
+        for doc, state in zip(docs, timers.evaluate(kind, docs, now))
+        if state and state.phase == phase
+    ]
+    return [doc for _, doc in sorted(ready, key=lambda entry: entry[0])]
+
+def _hungry(animal):
+    """Not fed since its production cycle last restarted"""
+    cycle_start = animal.get("last_collected") or animal["created_at"]
+    return animal.get("last_fed") is None or animal["last_fed"] < cycle_start
+
+@router.post("/{location}/sweep")
+async def sweep_location(
+    location: str,
+    request: Request,
+    feed: bool = Query(False, description="Also feed the animals that are hungry"),
+    user_id: str = Depends(get_current_user)
+):
+    """Harvest every ready crop, collect every producing animal and building, in one write"""
+    db = request.app.state.db
+    
+    queries = {"crops": {"location": location}, "animals": {"location": location}}
+    if location == SWEEP_BUILDING_LOCATION:
+        queries["buildings"] = {"type": {"$in": PRODUCING_BUILDINGS}}
+    actions = ActionBatch(db, user_id)
+    await actions.load(kinds=list(queries), queries=queries)
+    
+    entities = {kind: list(actions.entities.get(kind, {}).values()) for kind in queries}
+    # Crops closest to withering are harvested first, while energy lasts
+    crops = _ready("crops", entities["crops"], actions.now, timers.DONE)
+    buildings = _ready("buildings", entities.get("buildings", []), actions.now, timers.CYCLE_READY)
+    animals = _ready("animals", entities["animals"], actions.now, timers.CYCLE_READY)
+    
+    commands = []
+    results = []
+    skipped = Counter()
+    
+    async def run(command):
+        commands.append(command)
+        results.append(await actions.run(command))
+        return results[-1]
+    
+    for index, crop in enumerate(crops):
+        if actions.short_of(HARVEST_COST):
+            skipped["crops"] = len(crops) - index
+            break
+        await run(ActionCommand(action="harvest", id=crop["id"]))
+    for building in buildings:
+        await run(ActionCommand(action="collect_building", id=building["id"]))
+    for animal in animals:
+        await run(ActionCommand(action="collect", id=animal["id"]))
+    if feed:
+        # After collecting, so animals are fed for the cycle that just started
+        for animal in entities["animals"]:
+            if _hungry(animal) and not (await run(ActionCommand(action="feed", id=animal["id"])))["success"]:
+                skipped["feed"] += 1
+    
+    # After the commit: a command whose entity changed meanwhile fails there
+    user, exchangeable = await actions.commit()
+    
+    gathered = Counter()
+    dropped_items = Counter()
+    experience_gained = 0
+    for result in results:
+        if not result["success"]:
+            continue
+        gathered.update(result.get("harvested") or result.get("collected") or {})
+        if result.get("butterflies_caught"):
+            gathered["butterflies"] += result["butterflies_caught"]
+        dropped_items.update(result.get("dropped_items") or {})
+        experience_gained += result.get("experience_gained", 0)
+    
+    def succeeded(action):
+        return [command.id for command, result in zip(commands, results) if result["success"] and command.action == action]
+    
+    return {
+        "location": location,
+        "harvested": succeeded("harvest"),
+        "collected": {"animals": succeeded("collect"), "buildings": succeeded("collect_building")},
+        "fed": succeeded("feed"),
+        "gathered": dict(gathered),
+        "experience_gained": experience_gained,
+        "dropped_items": dict(dropped_items),
+        "skipped": dict(skipped),
+        **batch_response(results, user, exchangeable)
+    }
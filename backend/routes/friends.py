@@ -1,42 +1,70 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
-from models.friend import Friend, FriendRequest, MaterialRequestCreate, HelpFriendRequest
+from models.friend import Friend, FriendRequest, MaterialRequest, MaterialRequestCreate, HelpFriendRequest
 from utils.auth import get_current_user
-from datetime import datetime
+from services import ledger
+from services.profiles import get_public_profiles
+from services.scheduler import schedule
+from services.pagination import PageParams, paginate
+from services.projections import fields
+from utils.responses import GameResponse
+from datetime import datetime, timedelta
+import os
 import uuid
 
 router = APIRouter()
 
-@router.get("")
-async def get_friends(request: Request, user_id: str = Depends(get_current_user)):
-    """Get all user's friends"""
-    db = request.app.state.db
-    friends_collection = db.friends
-    users_collection = db.users
-    
-    # Find all friendships where user is involved and status is accepted
-    friendships = await friends_collection.find({
+MATERIAL_REQUEST_TTL = int(os.getenv("MATERIAL_REQUEST_TTL", str(24 * 3600)))
+
+def _friendships_query(user_id):
+    """Accepted friendships where the user is on either side"""
+    return {
         "$or": [
             {"user_id": user_id, "status": "accepted"},
             {"friend_id": user_id, "status": "accepted"}
         ]
-    }).to_list(length=100)
-    
-    friends_list = []
-    for friendship in friendships:
-        # Get the friend's ID (the other person)
-        friend_user_id = friendship["friend_id"] if friendship["user_id"] == user_id else friendship["user_id"]
-        
-        # Get friend's data
-        friend = await users_collection.find_one({"id": friend_user_id})
-        if friend:
-            friends_list.append({
-                "id": friend["id"],
-                "username": friend["username"],
-                "level": friend["level"],
-                "experience": friend["experience"]
-            })
+    }
+
+FRIENDSHIP_PROJECTION = {"user_id": True, "friend_id": True}
+
+def _friend_id(friendship, user_id):
+    # The friend is the other person in the friendship
+    return friendship["friend_id"] if friendship["user_id"] == user_id else friendship["user_id"]
+
+async def fetch_friend_ids(db, user_id):
+    """Ids of the user's accepted friends"""
+    friendships = await db.friends.find(
+        _friendships_query(user_id), {"_id": False, **FRIENDSHIP_PROJECTION}
+    ).to_list(length=None)
+    
+    return [_friend_id(friendship, user_id) for friendship in friendships]
+
+async def _public_friends(db, friend_ids):
+    profiles = await get_public_profiles(db, friend_ids)
+    
+    return [
+        {
+            "id": profile["id"],
+            "username": profile["username"],
+            "level": profile["level"],
+            "experience": profile["experience"]
+        }
+        for profile in (profiles.get(friend_id) for friend_id in friend_ids)
+        if profile
+    ]
+
+async def fetch_friends(db, user_id):
+    """All user's accepted friends with their public profile"""
+    return await _public_friends(db, await fetch_friend_ids(db, user_id))
+
+@router.get("")
+async def get_friends(request: Request, page: PageParams = Depends(), user_id: str = Depends(get_current_user)):
+    """Get user's friends (paginated with limit/cursor, or streamed)"""
+    db = request.app.state.db
+    
+    def serialize(friendships, now):
+        return _public_friends(db, [_friend_id(friendship, user_id) for friendship in friendships])
     
-    return {"friends": friends_list}
+    return await paginate(db.friends, _friendships_query(user_id), "friends", serialize, page, FRIENDSHIP_PROJECTION)
 
 @router.post("/add")
 async def add_friend(
@@ -50,7 +78,7 @@ async def add_friend(
     friends_collection = db.friends
     
     # Find friend by username
-    friend = await users_collection.find_one({"username": friend_data.friend_username})
+    friend = await users_collection.find_one({"username": friend_data.friend_username}, fields("id", "username", "level"))
     if not friend:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -69,7 +97,7 @@ async def add_friend(
             {"user_id": user_id, "friend_id": friend["id"]},
             {"user_id": friend["id"], "friend_id": user_id}
         ]
-    })
+    }, fields("_id"))
     
     if existing:
         raise HTTPException(
@@ -103,30 +131,16 @@ async def help_friend(
 ):
     """Help a friend (visit, speed up, etc.)"""
     db = request.app.state.db
-    users_collection = db.users
-    
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
     
     # Add small reward for helping
-    resources = user["resources"]
-    resources["gold"] = resources.get("gold", 0) + 10
-    resources["experience"] = resources.get("experience", 0) + 5
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources}}
-    )
+    rewards = {"gold": 10, "experience": 5}
+    reward, experience = ledger.split_rewards(rewards)
+    user = await ledger.apply(db, user_id, reward=reward, experience=experience)
     
     return {
         "success": True,
-        "rewards": {"gold": 10, "experience": 5},
-        "updatedResources": resources
+        "rewards": rewards,
+        "updatedResources": user["resources"]
     }
 
 @router.get("/requests")
@@ -134,31 +148,20 @@ async def get_material_requests(request: Request, user_id: str = Depends(get_cur
     """Get material requests from friends"""
     db = request.app.state.db
     material_requests_collection = db.material_requests
-    friends_collection = db.friends
-    users_collection = db.users
     
-    # Get user's friends
-    friendships = await friends_collection.find({
-        "$or": [
-            {"user_id": user_id, "status": "accepted"},
-            {"friend_id": user_id, "status": "accepted"}
-        ]
-    }).to_list(length=100)
-    
-    friend_ids = []
-    for friendship in friendships:
-        friend_id = friendship["friend_id"] if friendship["user_id"] == user_id else friendship["user_id"]
-        friend_ids.append(friend_id)
+    friend_ids = await fetch_friend_ids(db, user_id)
     
     # Get active material requests from friends
     requests = await material_requests_collection.find({
         "user_id": {"$in": friend_ids},
         "status": "active"
-    }).to_list(length=50)
+    }, fields("id", "user_id", "material_type", "quantity", "created_at")).to_list(length=50)
+    
+    profiles = await get_public_profiles(db, [req["user_id"] for req in requests])
     
     requests_list = []
     for req in requests:
-        user_data = await users_collection.find_one({"id": req["user_id"]})
+        user_data = profiles.get(req["user_id"])
         if user_data:
             requests_list.append({
                 "id": req["id"],
@@ -168,7 +171,39 @@ async def get_material_requests(request: Request, user_id: str = Depends(get_cur
                 },
                 "material_type": req["material_type"],
                 "quantity": req["quantity"],
-                "created_at": req["created_at"].isoformat()
+                "created_at": req["created_at"]
             })
     
-    return {"requests": requests_list}
+    return GameResponse({"requests": requests_list})
+
+@router.post("/requests")
+async def create_material_request(
+    request_data: MaterialRequestCreate,
+    request: Request,
+    user_id: str = Depends(get_current_user)
+):
+    """Ask friends for materials; the request expires after MATERIAL_REQUEST_TTL seconds"""
+    db = request.app.state.db
+    
+    material_request = MaterialRequest(
+        user_id=user_id,
+        material_type=request_data.material_type,
+        quantity=request_data.quantity,
+        expires_at=datetime.utcnow() + timedelta(seconds=MATERIAL_REQUEST_TTL)
+    )
+    
+    await db.material_requests.insert_one(material_request.model_dump())
+    await schedule(
+        db, user_id, "material_requests", material_request.id,
+        "material_request.expired", material_request.expires_at
+    )
+    
+    return {
+        "success": True,
+        "request": {
+            "id": material_request.id,
+            "material_type": material_request.material_type,
+            "quantity": material_request.quantity,
+            "expires_at": material_request.expires_at.isoformat()
+        }
+    }
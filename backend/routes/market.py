@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
 from utils.auth import get_current_user
-from utils.game_data import MARKET_ITEMS
-from datetime import datetime
+from utils.catalog import catalog
+from services import ledger
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -16,50 +16,20 @@ async def purchase_item(
     user_id: str = Depends(get_current_user)
 ):
     db = request.app.state.db
-    users_collection = db.users
     
     # Find item
-    item = next((i for i in MARKET_ITEMS if i["id"] == purchase.itemId), None)
+    item = catalog.market.get(purchase.itemId)
     if not item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Item not found"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    resources = user["resources"]
-    
-    # Check if user can afford
-    for resource, cost in item["cost"].items():
-        if resources.get(resource, 0) < cost:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough {resource}"
-            )
-    
-    # Deduct cost
-    for resource, cost in item["cost"].items():
-        resources[resource] -= cost
-    
-    # Add rewards
-    for resource, amount in item["rewards"].items():
-        resources[resource] = resources.get(resource, 0) + amount
-    
-    # Update user
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"resources": resources, "updated_at": datetime.utcnow()}}
-    )
+    # Deduct cost and add rewards in one guarded update
+    user = await ledger.apply(db, user_id, cost=item["cost"], reward=item["rewards"])
     
     return {
         "success": True,
         "purchased": item["rewards"],
-        "updatedResources": resources
+        "updatedResources": user["resources"]
     }
@@ -1,38 +1,53 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
 from models.pest import Pest, PestChase
 from utils.auth import get_current_user
-from game_data import PESTS_DATA
+from services.sync import record_deletion
+from services import farm_store, ledger
+from services.pagination import PageParams
+from services.projections import fields
+from utils.catalog import catalog
 from datetime import datetime
 import uuid
 
 router = APIRouter()
 
-@router.get("")
-async def get_pests(request: Request, user_id: str = Depends(get_current_user)):
-    """Get all active pests"""
-    db = request.app.state.db
-    pests_collection = db.pests
+# Everything serialize_pest reads
+PEST_FIELDS = fields("id", "type", "position", "location", "status", "appeared_at")
+
+def serialize_pest(pest, now=None):
+    """Pest document -> API shape"""
+    pest_data = catalog.pests.get(pest["type"])
+    if not pest_data:
+        return None
     
-    pests = await pests_collection.find({"user_id": user_id, "status": "active"}).to_list(length=50)
+    return {
+        "id": pest["id"],
+        "type": pest["type"],
+        "name": pest_data["name"],
+        "position": pest["position"],
+        "location": pest["location"],
+        "status": pest["status"],
+        "appearedAt": pest["appeared_at"],
+        "image": pest_data["image"]
+    }
+
+def serialize_pests(pests, now=None):
+    """Batch of pest documents -> API shapes"""
+    serialized = (serialize_pest(pest, now) for pest in pests)
+    return [pest for pest in serialized if pest]
+
+async def fetch_pests(db, user_id):
+    """All user's active pests"""
+    pests = await farm_store.find(db, "pests", user_id, {"status": "active"}, PEST_FIELDS)
     
-    pest_list = []
-    for pest in pests:
-        pest_data = PESTS_DATA.get(pest["type"])
-        if not pest_data:
-            continue
-        
-        pest_list.append({
-            "id": pest["id"],
-            "type": pest["type"],
-            "name": pest_data["name"],
-            "position": pest["position"],
-            "location": pest["location"],
-            "status": pest["status"],
-            "appearedAt": pest["appeared_at"].isoformat(),
-            "image": pest_data["image"]
-        })
+    return serialize_pests(pests)
+
+@router.get("")
+async def get_pests(request: Request, page: PageParams = Depends(), user_id: str = Depends(get_current_user)):
+    """Get active pests (paginated with limit/cursor, or streamed)"""
+    db = request.app.state.db
     
-    return {"pests": pest_list}
+    return await farm_store.paginate(db, "pests", user_id, {"status": "active"}, "pests", serialize_pests, page, PEST_FIELDS)
 
 @router.post("/{pest_id}/chase")
 async def chase_pest(
@@ -42,69 +57,48 @@ async def chase_pest(
 ):
     """Chase away a pest"""
     db = request.app.state.db
-    users_collection = db.users
-    pests_collection = db.pests
     
     # Get pest
-    pest = await pests_collection.find_one({"id": pest_id, "user_id": user_id})
+    pest = await farm_store.find_one(db, "pests", user_id, {"id": pest_id}, fields("id", "type"))
     if not pest:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pest not found"
         )
     
-    pest_data = PESTS_DATA.get(pest["type"])
+    pest_data = catalog.pests.get(pest["type"])
     if not pest_data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid pest type"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
+    # Remove the pest first: of two concurrent chases only one gets it, and only that one is paid
+    removed = await farm_store.delete(db, "pests", user_id, pest_id, query={"status": "active"})
+    if not removed:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+            detail="Pest not found"
         )
     
-    # Check if user has enough energy
-    resources = user["resources"]
-    energy_cost = pest_data["chase_cost"]["energy"]
-    if resources.get("energy", 0) < energy_cost:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Not enough energy"
+    # Deduct energy, add rewards and experience in one guarded update
+    try:
+        user = await ledger.apply(
+            db, user_id,
+            cost=pest_data["chase_cost"],
+            reward=pest_data["rewards"],
+            experience=pest_data["experience"]
         )
+    except HTTPException:
+        await farm_store.insert(db, "pests", removed)
+        raise
     
-    # Deduct energy
-    resources["energy"] -= energy_cost
-    
-    # Add rewards
-    for resource, amount in pest_data["rewards"].items():
-        resources[resource] = resources.get(resource, 0) + amount
-    
-    # Add experience
-    new_experience = user["experience"] + pest_data["experience"]
-    
-    # Update user
-    await users_collection.update_one(
-        {"id": user_id},
-        {
-            "$set": {
-                "resources": resources,
-                "experience": new_experience
-            }
-        }
-    )
-    
-    # Remove pest
-    await pests_collection.delete_one({"id": pest_id})
+    await record_deletion(db, user_id, "pests", pest_id)
     
     return {
         "success": True,
         "rewards": pest_data["rewards"],
         "experience_gained": pest_data["experience"],
-        "updatedResources": resources,
-        "newExperience": new_experience
+        "updatedResources": user["resources"],
+        "newExperience": user["experience"]
     }
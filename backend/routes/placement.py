@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Request, Depends
+from models.placement import PlacementFind
+from utils.auth import get_current_user
+from services import occupancy
+from itertools import islice
+
+router = APIRouter()
+
+@router.post("/find")
+async def find_placement(
+    find_data: PlacementFind,
+    request: Request,
+    user_id: str = Depends(get_current_user)
+):
+    """Free cells of a location: the first ones, or the nearest to `near`"""
+    db = request.app.state.db
+    
+    grid = await occupancy.load(db, user_id, find_data.location)
+    if find_data.near:
+        cells = grid.nearest_free(occupancy.cell_index(find_data.near), find_data.count)
+    elif find_data.count == 1:
+        first = grid.first_free()
+        cells = [] if first is None else [first]
+    else:
+        cells = list(islice(grid.free_cells(), find_data.count))
+    positions = [occupancy.position_of(index) for index in cells]
+    
+    return {
+        "position": positions[0] if positions else None,
+        "positions": positions,
+        "freeCells": grid.free_count(),
+        "grid": {"rows": occupancy.GRID_ROWS, "cols": occupancy.GRID_COLS}
+    }
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query, status
+from utils.auth import authenticate
+from services.push import PushSession, hub
+from routes.buildings import serialize_building, BUILDING_FIELDS
+from routes.crops import serialize_crop, CROP_FIELDS
+from routes.animals import serialize_animal, ANIMAL_FIELDS
+from routes.territory import serialize_territory, TERRITORY_FIELDS
+from utils.responses import dumps_json
+import asyncio
+
+router = APIRouter()
+
+SERIALIZERS = {
+    "buildings": serialize_building,
+    "crops": serialize_crop,
+    "animals": serialize_animal,
+    "territory": serialize_territory,
+}
+
+PROJECTIONS = {
+    "buildings": BUILDING_FIELDS,
+    "crops": CROP_FIELDS,
+    "animals": ANIMAL_FIELDS,
+    "territory": TERRITORY_FIELDS,
+}
+
+async def _until_disconnect(websocket):
+    # Nothing is expected from the client; this just notices the disconnect
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+@router.websocket("/ws")
+async def push_socket(websocket: WebSocket, token: str = Query(...)):
+    """Stream timed state transitions to the player as they become due"""
+    # Browsers can't set headers on a WebSocket, so the JWT comes in the query
+    try:
+        user_id = (await authenticate(websocket.app.state.db, token)).get("sub")
+    except HTTPException:
+        user_id = None
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    
+    async def send(event):
+        await websocket.send_text(dumps_json(event).decode("utf-8"))
+    
+    session = PushSession(websocket.app.state.db, user_id, send, SERIALIZERS, PROJECTIONS)
+    hub.register(session)
+    sender = asyncio.create_task(session.run())
+    receiver = asyncio.create_task(_until_disconnect(websocket))
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        if sender.done() and not sender.cancelled() and sender.exception():
+            # Don't leave a silent socket open: closing makes the client fall back to sync
+            print(f"⚠️  Push session failed for {user_id}: {sender.exception()!r}")
+            try:
+                await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            except RuntimeError:
+                pass  # the client is already gone
+    finally:
+        hub.unregister(session)
+        sender.cancel()
+        receiver.cancel()
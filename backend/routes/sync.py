@@ -0,0 +1,130 @@
+from fastapi import APIRouter, Request, Depends, Query
+from utils.auth import get_current_user
+from services.sync import SYNC_KINDS, current_version, encode_cursor, decode_cursor
+from services import farm_store, territory_map, timers
+from utils.responses import GameResponse
+from routes.buildings import serialize_building, BUILDING_FIELDS
+from routes.crops import serialize_crop, CROP_FIELDS
+from routes.animals import serialize_animal, ANIMAL_FIELDS
+from routes.territory import serialize_territory, TERRITORY_FIELDS
+from routes.pests import serialize_pest, PEST_FIELDS
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+
+router = APIRouter()
+
+SERIALIZERS = {
+    "buildings": serialize_building,
+    "crops": serialize_crop,
+    "animals": serialize_animal,
+    "territory": serialize_territory,
+    "pests": serialize_pest,
+}
+
+PROJECTIONS = {
+    "buildings": BUILDING_FIELDS,
+    "crops": CROP_FIELDS,
+    "animals": ANIMAL_FIELDS,
+    "territory": TERRITORY_FIELDS,
+    "pests": PEST_FIELDS,
+}
+
+def _completes_within(doc, started_field, duration_field, since_at, now):
+    started = doc.get(started_field)
+    if not started:
+        return False
+    finished_at = started + timedelta(seconds=doc[duration_field])
+    return since_at < finished_at <= now
+
+async def _changed(db, user_id, kind, since_version, since_at, now):
+    query = {}
+    if kind == "pests":
+        query["status"] = "active"
+    if kind == "territory":
+        # Generated cells are never stored: a full sync gets the whole map, a
+        # delta only stored changes (cleared cells arrive as deletions)
+        if since_at is None:
+            return await territory_map.load(db, user_id, PROJECTIONS[kind])
+        query["status"] = {"$ne": "cleared"}
+    if since_at is None:
+        return await farm_store.find(db, kind, user_id, query, PROJECTIONS[kind])
+    
+    query["version"] = {"$gt": since_version}
+    docs = await farm_store.find(db, kind, user_id, query, PROJECTIONS[kind])
+    
+    # Construction and clearing finish without a write, so they never bump the
+    # version; pick up the ones that finished since the previous sync
+    timed = None
+    if kind == "buildings":
+        timed = ({"status": "building"}, "start_time", "build_time")
+    elif kind == "territory":
+        timed = ({"status": "clearing"}, "clear_started_at", "clear_time")
+    if timed:
+        timed_query, started_field, duration_field = timed
+        seen = {doc["id"] for doc in docs}
+        for doc in await farm_store.find(db, kind, user_id, timed_query, PROJECTIONS[kind]):
+            if doc["id"] not in seen and _completes_within(doc, started_field, duration_field, since_at, now):
+                docs.append(doc)
+    
+    return docs
+
+async def _deleted(db, user_id, since_version):
+    """kind -> ids deleted after `since_version`"""
+    tombstones = await db.sync_tombstones.find(
+        {"user_id": user_id, "version": {"$gt": since_version}}
+    ).to_list(length=None)
+    
+    deleted = {kind: [] for kind in SYNC_KINDS}
+    for tombstone in tombstones:
+        deleted[tombstone["kind"]].append(tombstone["entity_id"])
+    return deleted
+
+@router.get("")
+async def get_sync(
+    request: Request,
+    since: Optional[str] = Query(None, description="Cursor from the previous sync; omit for a full sync"),
+    user_id: str = Depends(get_current_user)
+):
+    """Entities created, changed or deleted since the cursor"""
+    db = request.app.state.db
+    now = datetime.utcnow()
+    
+    since_version, since_at = decode_cursor(since)
+    # Read before the queries: every version up to `settled` is visible to them
+    latest_version, settled, full_since = await current_version(db, user_id, now)
+    if since_version > latest_version or (since_at and since_at > now) or since_version < full_since:
+        # Cursor from another database, a bogus one, or from before a change
+        # deltas can't express; start over
+        since_version, since_at = 0, None
+    full = since_at is None
+    
+    changed_docs = await asyncio.gather(*(
+        _changed(db, user_id, kind, since_version, since_at, now) for kind in SYNC_KINDS
+    ))
+    
+    changed = {}
+    for kind, docs in zip(SYNC_KINDS, changed_docs):
+        serialize = SERIALIZERS[kind]
+        if kind in timers.TRANSITION_EVENTS:
+            states = timers.evaluate(kind, docs, now)
+            serialized = (serialize(doc, now, state) for doc, state in zip(docs, states))
+        else:
+            serialized = (serialize(doc, now) for doc in docs)
+        changed[kind] = [entity for entity in serialized if entity]
+    
+    if full:
+        deleted = {kind: [] for kind in SYNC_KINDS}
+    else:
+        deleted = await _deleted(db, user_id, since_version)
+    
+    # Versions after the settled one may land later, out of order; the next
+    # sync asks for them again
+    version = since_version if settled is None else max(since_version, settled)
+    
+    return GameResponse({
+        "cursor": encode_cursor(version, now),
+        "full": full,
+        "changed": changed,
+        "deleted": deleted
+    })
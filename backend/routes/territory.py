@@ -1,49 +1,88 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
-from models.territory import Territory, TerritoryClear
+from models.territory import TerritoryClear
 from models.pest import Pest
 from utils.auth import get_current_user
-from game_data import TERRITORY_DATA, PESTS_DATA
+from services.sync import next_version, record_deletion
+from services import farm_store, ledger, occupancy, territory_map, timers
+from services.pagination import PageParams, ndjson_response, page_response
+from services.projections import fields
+from utils.catalog import catalog
 from datetime import datetime
+import bisect
 import random
 import uuid
 
 router = APIRouter()
 
+# Everything serialize_territory and the timer engine read
+TERRITORY_FIELDS = fields("id", "user_id", "type", "position", "location", "status", "clear_started_at", "clear_time")
+
+def serialize_territory(territory, now, state=None):
+    """Territory document -> API shape with clearing progress as of `now`"""
+    territory_data = catalog.territory.get(territory["type"])
+    state = state or timers.evaluate_one("territory", territory, now)
+    if not territory_data or not state:
+        return None
+    
+    status_val = "cleared" if state.phase == timers.DONE else territory["status"]
+    
+    return {
+        "id": territory["id"],
+        "type": territory["type"],
+        "position": territory["position"],
+        "location": territory["location"],
+        "status": status_val,
+        "progress": round(state.progress, 2),
+        "nextTransitionAt": state.next_at,
+        "image": territory_data["image"]
+    }
+
+def serialize_territories(territories, now):
+    """Batch of territory documents -> API shapes, evaluated in one timer pass"""
+    states = timers.evaluate("territory", territories, now)
+    serialized = (serialize_territory(territory, now, state) for territory, state in zip(territories, states))
+    return [territory for territory in serialized if territory]
+
+async def fetch_territory(db, user_id):
+    """All user's territory elements (generated map plus stored changes)"""
+    territories = await territory_map.load(db, user_id, TERRITORY_FIELDS)
+    
+    return serialize_territories(territories, datetime.utcnow())
+
 @router.get("")
-async def get_territory(request: Request, user_id: str = Depends(get_current_user)):
-    """Get all territory elements"""
+async def get_territory(request: Request, page: PageParams = Depends(), user_id: str = Depends(get_current_user)):
+    """Get territory elements (paginated with limit/cursor, or streamed).
+
+    Most elements are generated, not stored, so pages follow map order
+    (location, then cell) and the cursor is the "location:position" of the
+    last element on the page.
+    """
     db = request.app.state.db
-    territory_collection = db.territory
     
-    territories = await territory_collection.find({"user_id": user_id}).to_list(length=200)
-    
-    updated_territories = []
-    for territory in territories:
-        territory_data = TERRITORY_DATA.get(territory["type"])
-        if not territory_data:
-            continue
-        
-        status_val = territory["status"]
-        progress = 0
-        
-        if status_val == "clearing" and territory["clear_started_at"]:
-            elapsed = (datetime.utcnow() - territory["clear_started_at"]).total_seconds()
-            progress = min(100, (elapsed / territory["clear_time"]) * 100)
-            
-            if elapsed >= territory["clear_time"]:
-                status_val = "cleared"
+    territories = await territory_map.load(db, user_id, TERRITORY_FIELDS)
+    start = 0
+    if page.cursor:
+        location, _, position = page.cursor.partition(":")
+        if not position:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        order = [territory_map.map_order(territory["location"], territory["position"]) for territory in territories]
+        start = bisect.bisect_right(order, territory_map.map_order(location, position))
+    end = len(territories) if page.limit is None else start + page.limit
+    selected = serialize_territories(territories[start:end], datetime.utcnow())
+    
+    if page.stream:
+        async def entries():
+            for territory in selected:
+                yield territory
         
-        updated_territories.append({
-            "id": territory["id"],
-            "type": territory["type"],
-            "position": territory["position"],
-            "location": territory["location"],
-            "status": status_val,
-            "progress": round(progress, 2),
-            "image": territory_data["image"]
-        })
-    
-    return {"territories": updated_territories}
+        return ndjson_response(entries())
+    
+    last = territories[end - 1] if end < len(territories) else None
+    next_cursor = territory_map.cell_id(last["location"], last["position"]) if last else None
+    return page_response("territories", selected, next_cursor)
 
 @router.post("/clear")
 async def clear_territory(
@@ -53,16 +92,11 @@ async def clear_territory(
 ):
     """Clear a territory element"""
     db = request.app.state.db
-    users_collection = db.users
-    territory_collection = db.territory
-    pests_collection = db.pests
     
-    # Find territory
-    territory = await territory_collection.find_one({
-        "user_id": user_id,
-        "position": clear_data.position,
-        "location": clear_data.location
-    })
+    # Find territory (stored change, or the generated cell)
+    territory = await territory_map.find(
+        db, user_id, clear_data.location, clear_data.position, fields("id", "type", "location", "position", "status")
+    )
     
     if not territory:
         raise HTTPException(
@@ -70,50 +104,31 @@ async def clear_territory(
             detail="Territory element not found"
         )
     
-    territory_data = TERRITORY_DATA.get(territory["type"])
+    territory_data = catalog.territory.get(territory["type"])
     if not territory_data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid territory type"
         )
     
-    # Get user
-    user = await users_collection.find_one({"id": user_id})
-    if not user:
+    # Store the cell as cleared first: of two concurrent clears only one gets it, and only that one is paid
+    if not await territory_map.clear(db, user_id, territory, await next_version(db, user_id)):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+            detail="Territory element not found"
         )
     
-    # Check if user has enough energy
-    resources = user["resources"]
-    energy_cost = territory_data["clear_cost"]["energy"]
-    if resources.get("energy", 0) < energy_cost:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Not enough energy"
+    # Deduct energy, add rewards and experience in one guarded update
+    try:
+        user = await ledger.apply(
+            db, user_id,
+            cost=territory_data["clear_cost"],
+            reward=territory_data["rewards"],
+            experience=territory_data["experience"]
         )
-    
-    # Deduct energy
-    resources["energy"] -= energy_cost
-    
-    # Add rewards
-    for resource, amount in territory_data["rewards"].items():
-        resources[resource] = resources.get(resource, 0) + amount
-    
-    # Add experience
-    new_experience = user["experience"] + territory_data["experience"]
-    
-    # Update user
-    await users_collection.update_one(
-        {"id": user_id},
-        {
-            "$set": {
-                "resources": resources,
-                "experience": new_experience
-            }
-        }
-    )
+    except HTTPException:
+        await territory_map.unclear(db, user_id, territory)
+        raise
     
     # Check for pests
     pest_spawned = None
@@ -132,22 +147,24 @@ async def clear_territory(
                     location=clear_data.location,
                     type=pest_type,
                     position=clear_data.position,
-                    status="active"
+                    status="active",
+                    version=await next_version(db, user_id)
                 )
+                pest_spawned["id"] = new_pest.id
                 
-                await pests_collection.insert_one(new_pest.model_dump())
+                await farm_store.insert(db, "pests", new_pest.model_dump())
                 break
     
-    # Remove territory
-    await territory_collection.delete_one({"id": territory["id"]})
+    await occupancy.release(db, user_id, clear_data.location, clear_data.position)
+    await record_deletion(db, user_id, "territory", territory["id"])
     
     return {
         "success": True,
         "rewards": territory_data["rewards"],
         "experience_gained": territory_data["experience"],
         "pest_spawned": pest_spawned,
-        "updatedResources": resources,
-        "newExperience": new_experience
+        "updatedResources": user["resources"],
+        "newExperience": user["experience"]
     }
 
 @router.post("/generate")
@@ -155,29 +172,12 @@ async def generate_territory(
     request: Request,
     user_id: str = Depends(get_current_user)
 ):
-    """Generate random territory elements for testing"""
+    """Roll a new territory map for testing (replaces the current one)"""
     db = request.app.state.db
-    territory_collection = db.territory
-    
-    # Generate 20 random territory elements
-    territory_types = list(TERRITORY_DATA.keys())
-    territories = []
-    
-    for i in range(20):
-        territory_type = random.choice(territory_types)
-        territory_data = TERRITORY_DATA[territory_type]
-        
-        new_territory = Territory(
-            user_id=user_id,
-            location="main",
-            type=territory_type,
-            position=f"{random.randint(0, 15)}-{random.randint(0, 15)}",
-            status="active",
-            clear_time=territory_data["clear_time"]
-        )
-        
-        territories.append(new_territory.model_dump())
     
-    await territory_collection.insert_many(territories)
+    seed = await territory_map.reseed(db, user_id)
+    generated = 0
+    for location in territory_map.GENERATED_LOCATIONS:
+        generated += len(await territory_map.load(db, user_id, fields("location", "position", "status"), location))
     
-    return {"success": True, "generated": len(territories)}
+    return {"success": True, "generated": generated, "seed": seed}
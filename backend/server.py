@@ -1,6 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -9,7 +10,16 @@ from motor.motor_asyncio import AsyncIOMotorClient
 load_dotenv()
 
 # Import routes
-from routes import auth, player, buildings, quests, market, crops, animals, territory, pests, collections, friends
+from routes import auth, player, buildings, quests, market, crops, animals, territory, pests, collections, friends, farm, sync, push, catalog, placement, actions
+from services.indexes import ensure_indexes, check_indexes
+from services.push import hub as push_hub
+from services.scheduler import scheduler, backfill, SCHEDULER_ENABLED
+from services.pagination import NEXT_CURSOR_HEADER
+from services import projections
+from utils.cache import CACHES
+from utils.auth import bcrypt_stats
+from utils.responses import GameResponse, NegotiationMiddleware
+from utils.compression import CompressionMiddleware, COMPRESSION_ENABLED
 
 # Database connection
 db_client = None
@@ -20,14 +30,32 @@ async def lifespan(app: FastAPI):
     # Startup
     global db_client, db
     mongo_url = os.getenv('MONGO_URL', 'mongodb://localhost:27017/wildwest')
-    db_client = AsyncIOMotorClient(mongo_url)
+    db_client = AsyncIOMotorClient(mongo_url, event_listeners=projections.event_listeners())
     db = db_client.get_database()
     app.state.db = db
     print(f"✅ Connected to MongoDB: {mongo_url}")
     
+    await ensure_indexes(db)
+    if os.getenv('MONGO_INDEX_CHECK', '0') == '1':
+        report = await check_indexes(db)
+        for kind, names in report.items():
+            if names:
+                print(f"⚠️  {kind} indexes: {', '.join(names)}")
+    
+    if SCHEDULER_ENABLED:
+        scheduler.start(db)
+        # Entities that predate the due queue; safe to repeat on every start
+        backfill_task = asyncio.create_task(backfill(db))
+    else:
+        print("⚠️  Scheduler disabled (SCHEDULER_ENABLED=0): timed transitions get no sync versions, "
+              "and building quests complete only when quests are read or claimed")
+    
     yield
     
     # Shutdown
+    if SCHEDULER_ENABLED:
+        backfill_task.cancel()
+        await scheduler.stop()
     if db_client:
         db_client.close()
         print("👋 Disconnected from MongoDB")
@@ -37,9 +65,17 @@ app = FastAPI(
     title="Wild West Game API",
     description="Backend for Wild West farming game",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=GameResponse
 )
 
+# Accept negotiation for GameResponse (MessagePack on request)
+app.add_middleware(NegotiationMiddleware)
+
+# gzip / brotli for larger responses (precompressed bodies pass through)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -47,8 +83,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, projections.BYTES_READ_HEADER],
 )
 
+if projections.BYTES_REPORT_ENABLED:
+    @app.middleware("http")
+    async def count_mongo_reads(request: Request, call_next):
+        counter = projections.start_request()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        projections.finish_request(route.path if route else request.url.path, counter)
+        response.headers[projections.BYTES_READ_HEADER] = str(counter.bytes)
+        return response
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(player.router, prefix="/api/player", tags=["Player"])
@@ -61,6 +108,12 @@ app.include_router(territory.router, prefix="/api/territory", tags=["Territory"]
 app.include_router(pests.router, prefix="/api/pests", tags=["Pests"])
 app.include_router(collections.router, prefix="/api/collections", tags=["Collections"])
 app.include_router(friends.router, prefix="/api/friends", tags=["Friends"])
+app.include_router(farm.router, prefix="/api/farm", tags=["Farm"])
+app.include_router(placement.router, prefix="/api/placement", tags=["Placement"])
+app.include_router(actions.router, prefix="/api/actions", tags=["Actions"])
+app.include_router(sync.router, prefix="/api/sync", tags=["Sync"])
+app.include_router(push.router, prefix="/api/push", tags=["Push"])
+app.include_router(catalog.router, prefix="/api/catalog", tags=["Catalog"])
 
 @app.get("/api/health")
 async def health_check():
@@ -70,6 +123,17 @@ async def health_check():
         "database": "connected" if db is not None else "disconnected"
     }
 
+@app.get("/api/metrics")
+async def metrics():
+    """Per-worker cache, password hashing, scheduler, connection and Mongo read counters"""
+    return {
+        "caches": {name: cache.stats() for name, cache in CACHES.items()},
+        "bcrypt": bcrypt_stats(),
+        "push_sessions": push_hub.connected(),
+        "scheduler": scheduler.stats(),
+        "mongo_reads": projections.read_stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("server:app", host="0.0.0.0", port=8001, reload=True)
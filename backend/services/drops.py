@@ -0,0 +1,49 @@
+# Collection item drops from harvesting crops and collecting from animals.
+#
+# Drops are gathered per request in a DropBatch and written to each player's
+# collection inventory (services.inventory) with one $inc, however many actions
+# or item types the request produced. The post-image tells which collections
+# the drops just completed.
+
+import random
+from collections import Counter, defaultdict
+
+from services import inventory
+
+CROP_DROP_CHANCE = 0.3
+ANIMAL_DROP_CHANCE = 0.25
+
+def roll(item_ids, chance):
+    """Roll each item independently; returns the ones that dropped"""
+    return [item_id for item_id in item_ids if random.random() < chance]
+
+class DropBatch:
+    """Collection drops gathered during one request"""
+
+    def __init__(self):
+        self._counts = defaultdict(Counter)
+
+    def add(self, user_id, item_id, quantity=1):
+        self._counts[user_id][item_id] += quantity
+
+    def roll(self, user_id, item_ids, chance):
+        """Roll each item independently (see roll()) and add the ones that dropped"""
+        dropped = roll(item_ids, chance)
+        for item_id in dropped:
+            self.add(user_id, item_id)
+        return dropped
+
+    def __bool__(self):
+        return bool(self._counts)
+
+    async def flush(self, db):
+        """Write all gathered drops (one update per player) and reset the batch.
+
+        Returns user_id -> ids of the collections the drops made exchangeable.
+        """
+        exchangeable = {}
+        for user_id, quantities in self._counts.items():
+            held = await inventory.add(db, user_id, dict(quantities))
+            exchangeable[user_id] = inventory.newly_exchangeable(held, quantities)
+        self._counts.clear()
+        return exchangeable
@@ -0,0 +1,77 @@
+# Convert farm entities between the storage layouts of services.farm_store.
+#
+#   python -m services.farm_migrate --to aggregate     # per-kind collections -> farms
+#   python -m services.farm_migrate --to collections   # farms -> per-kind collections
+#
+# Players are converted one at a time. Writes are idempotent (replace by _id or
+# entity id), so an interrupted run can be repeated. The source is left in
+# place unless --drop-source is given. Switch FARM_STORAGE once the run is done.
+
+import argparse
+import asyncio
+import os
+
+from pymongo import ReplaceOne
+
+from services.farm_store import FARM_KINDS, from_farm, to_farms
+
+async def _user_ids(db, collections):
+    user_ids = set()
+    for collection in collections:
+        user_ids.update(await db[collection].distinct("user_id"))
+    return sorted(user_ids)
+
+async def to_aggregate(db, drop_source=False):
+    """Per-kind collections -> one farm document per player and location; returns farms written"""
+    written = 0
+    for user_id in await _user_ids(db, FARM_KINDS):
+        docs_by_kind = {
+            kind: await db[kind].find({"user_id": user_id}, {"_id": False}).to_list(length=None)
+            for kind in FARM_KINDS
+        }
+        farms = to_farms(docs_by_kind)
+        if farms:
+            await db.farms.bulk_write([ReplaceOne({"_id": farm["_id"]}, farm, upsert=True) for farm in farms])
+            written += len(farms)
+        if drop_source:
+            for kind in FARM_KINDS:
+                await db[kind].delete_many({"user_id": user_id})
+    return written
+
+async def to_collections(db, drop_source=False):
+    """Farm documents -> one document per entity in per-kind collections; returns entities written"""
+    written = 0
+    for user_id in await _user_ids(db, ("farms",)):
+        async for farm in db.farms.find({"user_id": user_id}):
+            for kind, docs in from_farm(farm).items():
+                if docs:
+                    await db[kind].bulk_write([ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs])
+                    written += len(docs)
+        if drop_source:
+            await db.farms.delete_many({"user_id": user_id})
+    return written
+
+async def _main(target, drop_source):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo_url = os.getenv('MONGO_URL', 'mongodb://localhost:27017/wildwest')
+    client = AsyncIOMotorClient(mongo_url)
+    db = client.get_database()
+    try:
+        if target == "aggregate":
+            print(f"farms written: {await to_aggregate(db, drop_source)}")
+        else:
+            print(f"entities written: {await to_collections(db, drop_source)}")
+    finally:
+        client.close()
+    return 0
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Convert farm storage between per-kind collections and farm documents")
+    parser.add_argument("--to", required=True, choices=("aggregate", "collections"), help="target layout")
+    parser.add_argument("--drop-source", action="store_true", help="delete converted data from the source layout")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.to, args.drop_source)))
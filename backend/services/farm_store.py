@@ -0,0 +1,375 @@
+# Farm entity storage: one collection per kind, or one aggregate document per farm.
+#
+# Every read and write of buildings, crops, animals, territory and pests goes
+# through this module, so the layout is a deployment choice:
+#
+#   FARM_STORAGE=collections  (default) each entity is its own document in
+#                             the collection named after its kind
+#   FARM_STORAGE=aggregate    each player's farm per location is one document
+#                             in `farms` ({_id: "user_id:location"}) with one
+#                             embedded array per kind; entries drop user_id and
+#                             location, which the document carries
+#
+# In aggregate mode loading a farm is one find_one. Single entities are
+# changed in place with the positional operator (`crops.$.field`), added with
+# $push (guarded against a taken cell) and removed with $pull. Entities keep
+# their ids and shapes either way, so callers can't tell the layouts apart.
+# Convert existing data with `python -m services.farm_migrate`.
+
+import asyncio
+import os
+from collections import defaultdict
+
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from services import pagination
+
+FARM_STORAGE = os.getenv("FARM_STORAGE", "collections")
+AGGREGATE = FARM_STORAGE == "aggregate"
+
+FARM_KINDS = ("buildings", "crops", "animals", "territory", "pests")
+
+# Kinds with at most one entity per cell (the unique indexes of the collection layout)
+UNIQUE_CELL_KINDS = ("crops", "animals", "territory")
+
+# Fields the aggregate document holds once instead of in every entry
+FARM_FIELDS = ("user_id", "location")
+
+def farm_id(user_id, location):
+    return f"{user_id}:{location}"
+
+def location_of(kind, doc):
+    # Buildings have no location in the collection layout: they are all in "main"
+    return doc.get("location", "main")
+
+# --- aggregate helpers
+
+_OPERATORS = {
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$exists": lambda value, operand: (value is not None) == operand,
+}
+
+def matches(doc, query):
+    """Whether an entity matches a (simple) Mongo filter: equality, comparisons, $in, $or"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+            if not all(_OPERATORS[operator](doc.get(field), operand) for operator, operand in condition.items()):
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+def _entry(doc):
+    """Entity document -> embedded entry"""
+    return {key: value for key, value in doc.items() if key not in FARM_FIELDS and key != "_id"}
+
+def _entity(farm, entry):
+    """Embedded entry -> entity document, as the collection layout returns it"""
+    return {**entry, "user_id": farm["user_id"], "location": farm["location"]}
+
+def _project(doc, projection):
+    # user_id and location are kept: writes need them to find the farm
+    if not projection:
+        return doc
+    return {key: value for key, value in doc.items() if projection.get(key) or key in FARM_FIELDS}
+
+def _farm_query(user_id, query):
+    farm_query = {"user_id": user_id}
+    if "location" in query:
+        farm_query["location"] = query["location"]
+    return farm_query
+
+def _entities(farms, kind, query, projection=None):
+    return [
+        _project(entity, projection)
+        for farm in farms
+        for entity in (_entity(farm, entry) for entry in farm.get(kind, ()))
+        if matches(entity, query)
+    ]
+
+# --- reads
+
+async def find(db, kind, user_id, query=None, projection=None):
+    """A player's entities of one kind matching `query`"""
+    query = query or {}
+    if not AGGREGATE:
+        return await db[kind].find({"user_id": user_id, **query}, projection).to_list(length=None)
+    farms = await db.farms.find(_farm_query(user_id, query), {kind: True, **dict.fromkeys(FARM_FIELDS, True)}).to_list(length=None)
+    return _entities(farms, kind, query, projection)
+
+async def find_one(db, kind, user_id, query, projection=None):
+    if not AGGREGATE:
+        return await db[kind].find_one({"user_id": user_id, **query}, projection)
+    found = await find(db, kind, user_id, query, projection)
+    return found[0] if found else None
+
+async def load(db, user_id, kinds=FARM_KINDS, queries=None, projections=None):
+    """kind -> a player's entities of that kind (every location), filtered by `queries[kind]`.
+
+    One find in aggregate mode (a single document per location); one query per
+    kind, run concurrently, otherwise.
+    """
+    queries = queries or {}
+    projections = projections or {}
+    if not AGGREGATE:
+        results = await asyncio.gather(*(
+            find(db, kind, user_id, queries.get(kind), projections.get(kind)) for kind in kinds
+        ))
+        return dict(zip(kinds, results))
+    farms = await db.farms.find({"user_id": user_id}, {kind: True for kind in (*kinds, *FARM_FIELDS)}).to_list(length=None)
+    return {kind: _entities(farms, kind, queries.get(kind) or {}, projections.get(kind)) for kind in kinds}
+
+async def find_by_ids(db, kind, entity_ids, query=None, projection=None):
+    """Entities of any player by id"""
+    query = {"id": {"$in": list(entity_ids)}, **(query or {})}
+    if not AGGREGATE:
+        return await db[kind].find(query, projection).to_list(length=None)
+    farms = await db.farms.find(
+        {f"{kind}.id": query["id"]}, {kind: True, **dict.fromkeys(FARM_FIELDS, True)}
+    ).to_list(length=None)
+    return _entities(farms, kind, query, projection)
+
+async def scan(db, kind, query, projection=None):
+    """Every player's entities of one kind matching `query` (maintenance jobs)"""
+    if not AGGREGATE:
+        async for doc in db[kind].find(query, projection):
+            yield doc
+        return
+    async for farm in db.farms.find({kind: {"$ne": []}}, {kind: True, **dict.fromkeys(FARM_FIELDS, True)}):
+        for entity in _entities([farm], kind, query, projection):
+            yield entity
+
+async def paginate(db, kind, user_id, query, key, serialize, page, projection=None):
+    """services.pagination.paginate over a player's entities of one kind.
+
+    In aggregate mode pages follow insertion (array) order and the cursor is
+    the id of the last entity on the page.
+    """
+    if not AGGREGATE:
+        return await pagination.paginate(db[kind], {"user_id": user_id, **query}, key, serialize, page, projection)
+    return await pagination.paginate_docs(await find(db, kind, user_id, query, projection), key, serialize, page)
+
+# --- writes
+
+def _push_query(kind, doc):
+    query = {"_id": farm_id(doc["user_id"], location_of(kind, doc))}
+    if kind in UNIQUE_CELL_KINDS:
+        query[f"{kind}.position"] = {"$ne": doc["position"]}
+    return query
+
+def _push_update(kind, doc, entries):
+    return {
+        "$push": {kind: {"$each": entries}},
+        "$setOnInsert": {"user_id": doc["user_id"], "location": location_of(kind, doc)}
+    }
+
+async def insert(db, kind, doc):
+    """Add one entity; DuplicateKeyError if its cell is taken (kinds with one entity per cell)"""
+    if not AGGREGATE:
+        await db[kind].insert_one(doc)
+        return
+    # A taken cell fails the guard, and the upsert then collides on _id
+    await db.farms.update_one(_push_query(kind, doc), _push_update(kind, doc, [_entry(doc)]), upsert=True)
+
+async def insert_many(db, kind, docs):
+    """Add entities (one write per farm in aggregate mode; cells are not checked)"""
+    if not docs:
+        return
+    if not AGGREGATE:
+        await db[kind].insert_many(docs)
+        return
+    by_farm = {}
+    for doc in docs:
+        by_farm.setdefault(farm_id(doc["user_id"], location_of(kind, doc)), []).append(doc)
+    await db.farms.bulk_write([
+        UpdateOne({"_id": key}, _push_update(kind, farm_docs[0], [_entry(doc) for doc in farm_docs]), upsert=True)
+        for key, farm_docs in by_farm.items()
+    ], ordered=False)
+
+def _set_update(kind, set_fields):
+    return {"$set": {f"{kind}.$.{field}": value for field, value in set_fields.items()}}
+
+async def update(db, kind, user_id, entity_id, set_fields, query=None):
+    """$set fields of one entity (if it also matches `query`); returns whether it matched"""
+    if not AGGREGATE:
+        result = await db[kind].update_one({"id": entity_id, "user_id": user_id, **(query or {})}, {"$set": set_fields})
+        return result.matched_count > 0
+    result = await db.farms.update_one(
+        {"user_id": user_id, kind: {"$elemMatch": {"id": entity_id, **(query or {})}}},
+        _set_update(kind, set_fields)
+    )
+    return result.matched_count > 0
+
+async def update_many(db, kind, changes):
+    """[(entity, fields to $set)] of any players, in one bulk write"""
+    if not changes:
+        return
+    if not AGGREGATE:
+        operations = [UpdateOne({"id": doc["id"]}, {"$set": set_fields}) for doc, set_fields in changes]
+        await db[kind].bulk_write(operations, ordered=False)
+        return
+    operations = [
+        UpdateOne({"_id": farm_id(doc["user_id"], location_of(kind, doc)), f"{kind}.id": doc["id"]}, _set_update(kind, set_fields))
+        for doc, set_fields in changes
+    ]
+    await db.farms.bulk_write(operations, ordered=False)
+
+async def upsert_cell(db, kind, user_id, location, position, set_fields, insert_fields, query=None):
+    """Set fields of the entity on a cell, creating it from `insert_fields` if there is none.
+
+    With `query`, an entity already on the cell is only changed if it matches;
+    returns whether anything was written (kinds with one entity per cell).
+    """
+    try:
+        if not AGGREGATE:
+            await db[kind].update_one(
+                {"user_id": user_id, "location": location, "position": position, **(query or {})},
+                {"$set": set_fields, "$setOnInsert": insert_fields},
+                upsert=True
+            )
+            return True
+        cell = {"position": position}
+        result = await db.farms.update_one(
+            {"_id": farm_id(user_id, location), kind: {"$elemMatch": {**cell, **(query or {})}}},
+            _set_update(kind, set_fields)
+        )
+        if not result.matched_count:
+            doc = {**insert_fields, **set_fields, **cell, "user_id": user_id, "location": location}
+            await insert(db, kind, doc)
+        return True
+    except DuplicateKeyError:
+        # An entity on the cell failed `query`, so the upsert collided with it
+        if query is None:
+            raise
+        return False
+
+async def delete(db, kind, user_id, entity_id, projection=None, query=None):
+    """Remove one entity (if it also matches `query`); returns it (projected), or None if there was none"""
+    if not AGGREGATE:
+        return await db[kind].find_one_and_delete(
+            {"id": entity_id, "user_id": user_id, **(query or {})}, projection=projection
+        )
+    farm = await db.farms.find_one_and_update(
+        {"user_id": user_id, kind: {"$elemMatch": {"id": entity_id, **(query or {})}}},
+        {"$pull": {kind: {"id": entity_id}}},
+        projection={kind: {"$elemMatch": {"id": entity_id}}, **dict.fromkeys(FARM_FIELDS, True)}
+    )
+    if not farm or not farm.get(kind):
+        return None
+    return _project(_entity(farm, farm[kind][0]), projection)
+
+async def delete_all(db, kind, user_id):
+    """Remove all of a player's entities of one kind"""
+    if not AGGREGATE:
+        await db[kind].delete_many({"user_id": user_id})
+        return
+    await db.farms.update_many({"user_id": user_id}, {"$set": {kind: []}})
+
+class FarmWrites:
+    """Entity writes gathered during one request, written with one ordered
+    bulk_write per collection (one in aggregate mode) by flush().
+
+    Entities are the documents as loaded (or about to be inserted): id,
+    user_id and location identify them in either layout.
+    """
+
+    def __init__(self):
+        self._writes = []
+
+    def insert(self, kind, doc):
+        self._writes.append(("insert", kind, doc, None))
+
+    def update(self, kind, doc, set_fields):
+        self._writes.append(("update", kind, doc, set_fields))
+
+    def delete(self, kind, doc):
+        self._writes.append(("delete", kind, doc, None))
+
+    def upsert_cell(self, kind, user_id, location, position, set_fields, insert_fields):
+        """See upsert_cell()"""
+        doc = {"user_id": user_id, "location": location, "position": position}
+        self._writes.append(("upsert_cell", kind, doc, (set_fields, insert_fields)))
+
+    def __bool__(self):
+        return bool(self._writes)
+
+    def _collection_operations(self, write, kind, doc, change, stamp):
+        entity = {"id": doc.get("id"), "user_id": doc["user_id"]}
+        if write == "insert":
+            return [InsertOne({**doc, **stamp})]
+        if write == "update":
+            return [UpdateOne(entity, {"$set": {**change, **stamp}})]
+        if write == "delete":
+            return [DeleteOne(entity)]
+        set_fields, insert_fields = change
+        return [UpdateOne(doc, {"$set": {**set_fields, **stamp}, "$setOnInsert": insert_fields}, upsert=True)]
+
+    def _farm_operations(self, write, kind, doc, change, stamp):
+        key = {"_id": farm_id(doc["user_id"], location_of(kind, doc))}
+        if write == "insert":
+            doc = {**doc, **stamp}
+            return [UpdateOne(_push_query(kind, doc), _push_update(kind, doc, [_entry(doc)]), upsert=True)]
+        if write == "update":
+            return [UpdateOne({**key, f"{kind}.id": doc["id"]}, _set_update(kind, {**change, **stamp}))]
+        if write == "delete":
+            return [UpdateOne({**key, f"{kind}.id": doc["id"]}, {"$pull": {kind: {"id": doc["id"]}}})]
+        # Set the entry on the cell if there is one, push a new one otherwise
+        set_fields, insert_fields = change
+        cell = {"position": doc["position"]}
+        entry = _entry({**insert_fields, **set_fields, **stamp, **cell})
+        return [
+            UpdateOne(key, {"$setOnInsert": {"user_id": doc["user_id"], "location": doc["location"]}}, upsert=True),
+            UpdateOne({**key, kind: {"$elemMatch": cell}}, _set_update(kind, {**set_fields, **stamp})),
+            UpdateOne({**key, f"{kind}.position": {"$ne": doc["position"]}}, {"$push": {kind: entry}})
+        ]
+
+    async def flush(self, db, version=None):
+        """Write everything in order; `version` stamps every inserted or changed entity"""
+        stamp = {"version": version} if version is not None else {}
+        by_collection = defaultdict(list)
+        for write, kind, doc, change in self._writes:
+            if AGGREGATE:
+                by_collection["farms"].extend(self._farm_operations(write, kind, doc, change, stamp))
+            else:
+                by_collection[kind].extend(self._collection_operations(write, kind, doc, change, stamp))
+        for collection, operations in by_collection.items():
+            await db[collection].bulk_write(operations, ordered=True)
+        self._writes.clear()
+
+# --- layout conversion (services.farm_migrate)
+
+def to_farms(docs_by_kind):
+    """kind -> entity documents => aggregate farm documents"""
+    farms = {}
+    for kind, docs in docs_by_kind.items():
+        for doc in docs:
+            location = location_of(kind, doc)
+            farm = farms.setdefault(farm_id(doc["user_id"], location), {
+                "_id": farm_id(doc["user_id"], location),
+                "user_id": doc["user_id"],
+                "location": location,
+                **{farm_kind: [] for farm_kind in FARM_KINDS}
+            })
+            farm[kind].append(_entry(doc))
+    return list(farms.values())
+
+def from_farm(farm):
+    """Aggregate farm document => kind -> entity documents"""
+    docs_by_kind = {}
+    for kind in FARM_KINDS:
+        docs = [_entity(farm, entry) for entry in farm.get(kind, ())]
+        if kind == "buildings":
+            for doc in docs:
+                doc.pop("location")
+        docs_by_kind[kind] = docs
+    return docs_by_kind
@@ -0,0 +1,185 @@
+# Declarative MongoDB index registry for all game collections.
+#
+# Indexes are created idempotently on startup (see server.lifespan).
+# Run `python -m services.indexes --check` to report missing and unused indexes
+# without changing anything.
+
+import argparse
+import asyncio
+import os
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from services.sync import SYNC_TOMBSTONE_TTL
+
+INDEXES = {
+    "users": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("username", ASCENDING)], "unique": True},
+        {"keys": [("email", ASCENDING)], "unique": True},
+    ],
+    "buildings": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        # Keyset pagination (services.pagination)
+        {"keys": [("user_id", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("position", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("version", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("status", ASCENDING)]},
+    ],
+    "crops": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        # Keyset pagination (services.pagination)
+        {"keys": [("user_id", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("location", ASCENDING), ("position", ASCENDING)], "unique": True},
+        {"keys": [("user_id", ASCENDING), ("version", ASCENDING)]},
+    ],
+    "animals": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        # Keyset pagination (services.pagination)
+        {"keys": [("user_id", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("location", ASCENDING), ("position", ASCENDING)], "unique": True},
+        {"keys": [("user_id", ASCENDING), ("version", ASCENDING)]},
+    ],
+    "territory": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        # Keyset pagination (services.pagination)
+        {"keys": [("user_id", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("location", ASCENDING), ("position", ASCENDING)], "unique": True},
+        {"keys": [("user_id", ASCENDING), ("version", ASCENDING)]},
+    ],
+    "pests": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("user_id", ASCENDING), ("status", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("version", ASCENDING)]},
+    ],
+    # Aggregate farm layout (FARM_STORAGE=aggregate, services.farm_store); _id is "user_id:location"
+    "farms": [
+        {"keys": [("user_id", ASCENDING)]},
+        # Scheduler lookups of entities by id
+        {"keys": [("buildings.id", ASCENDING)]},
+        {"keys": [("crops.id", ASCENDING)]},
+        {"keys": [("animals.id", ASCENDING)]},
+        {"keys": [("territory.id", ASCENDING)]},
+    ],
+    # Legacy per-item documents, read once per user to build collection_inventory
+    "collection_items": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("user_id", ASCENDING), ("item_id", ASCENDING)], "unique": True},
+    ],
+    "quest_progress": [
+        {"keys": [("user_id", ASCENDING), ("quest_id", ASCENDING)], "unique": True},
+    ],
+    "friends": [
+        {"keys": [("user_id", ASCENDING), ("status", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("friend_id", ASCENDING), ("status", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING), ("friend_id", ASCENDING)]},
+    ],
+    "material_requests": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("user_id", ASCENDING), ("status", ASCENDING)]},
+    ],
+    "due_events": [
+        {"keys": [("due_at", ASCENDING)]},
+        {"keys": [("user_id", ASCENDING)]},
+    ],
+    # Logged-out tokens and users (utils.auth), dropped once the tokens expire
+    "token_revocations": [
+        {"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+    ],
+    "sync_tombstones": [
+        {"keys": [("user_id", ASCENDING), ("version", ASCENDING)]},
+        {"keys": [("deleted_at", ASCENDING)], "expireAfterSeconds": SYNC_TOMBSTONE_TTL},
+    ],
+}
+
+def _index_name(keys):
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+def _index_model(spec):
+    options = {k: v for k, v in spec.items() if k != "keys"}
+    return IndexModel(spec["keys"], name=_index_name(spec["keys"]), **options)
+
+async def ensure_indexes(db):
+    """Create every declared index; existing indexes are left untouched"""
+    created = {}
+    for collection_name, specs in INDEXES.items():
+        collection = db[collection_name]
+        try:
+            created[collection_name] = await collection.create_indexes(
+                [_index_model(spec) for spec in specs]
+            )
+        except OperationFailure as e:
+            # Usually duplicate data blocking a unique index; don't refuse to start.
+            # Fall back to one index at a time so the rest still get created.
+            print(f"⚠️  Index creation failed on {collection_name}: {e}")
+            created[collection_name] = []
+            for spec in specs:
+                try:
+                    created[collection_name].extend(
+                        await collection.create_indexes([_index_model(spec)])
+                    )
+                except OperationFailure as spec_error:
+                    print(f"⚠️  Skipped {_index_name(spec['keys'])} on {collection_name}: {spec_error}")
+    return created
+
+async def check_indexes(db):
+    """Report declared indexes that are missing, never used, or not declared at all"""
+    report = {"missing": [], "unused": [], "undeclared": []}
+    existing_collections = set(await db.list_collection_names())
+
+    for collection_name, specs in INDEXES.items():
+        declared = {_index_name(spec["keys"]) for spec in specs}
+
+        if collection_name not in existing_collections:
+            report["missing"].extend(f"{collection_name}.{name}" for name in sorted(declared))
+            continue
+
+        collection = db[collection_name]
+        info = await collection.index_information()
+        present = {name for name in info if name != "_id_"}
+
+        for name in sorted(declared - present):
+            report["missing"].append(f"{collection_name}.{name}")
+        for name in sorted(present - declared):
+            report["undeclared"].append(f"{collection_name}.{name}")
+
+        # $indexStats counters reset on mongod restart, so "unused" means
+        # "not used since the server last started"
+        try:
+            stats = await collection.aggregate([{"$indexStats": {}}]).to_list(length=None)
+        except OperationFailure:
+            continue
+        for stat in stats:
+            if stat["name"] in declared and stat["accesses"]["ops"] == 0:
+                report["unused"].append(f"{collection_name}.{stat['name']}")
+
+    return report
+
+async def _main(check_only):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo_url = os.getenv('MONGO_URL', 'mongodb://localhost:27017/wildwest')
+    client = AsyncIOMotorClient(mongo_url)
+    db = client.get_database()
+    try:
+        if not check_only:
+            await ensure_indexes(db)
+        report = await check_indexes(db)
+    finally:
+        client.close()
+
+    for kind in ("missing", "unused", "undeclared"):
+        print(f"{kind}: {len(report[kind])}")
+        for name in report[kind]:
+            print(f"  - {name}")
+    return 1 if report["missing"] else 0
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Create or verify MongoDB indexes")
+    parser.add_argument("--check", action="store_true", help="only report, do not create indexes")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.check)))
@@ -0,0 +1,117 @@
+# Collection inventory: one counter map of collection items per user.
+#
+# A user's items are one `collection_inventory` document
+# ({_id: user_id, items: {item_id: quantity}}), so the collections screen is
+# one small read and a request's drops are one $inc. Exchanging a collection
+# is one update guarded on every required quantity: it takes all the items
+# or none, and two concurrent exchanges can't spend the same items.
+# Quantities that reach zero stay in the map as 0 and are left out of reads.
+#
+# Inventories are built on first use from the per-item `collection_items`
+# documents of earlier versions.
+
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.catalog import catalog
+
+def _held(items, item_ids=None):
+    """item_id -> quantity of the items actually held (only `item_ids` if given)"""
+    return {
+        item_id: quantity
+        for item_id, quantity in items.items()
+        if quantity > 0 and (item_ids is None or item_id in item_ids)
+    }
+
+async def _rebuild(db, user_id):
+    """Inventory from the legacy per-item documents, for users who got items before it existed"""
+    legacy = await db.collection_items.find(
+        {"user_id": user_id}, {"_id": False, "item_id": True, "quantity": True}
+    ).to_list(length=None)
+    try:
+        await db.collection_inventory.insert_one({
+            "_id": user_id,
+            "items": {item["item_id"]: item["quantity"] for item in legacy},
+            "updated_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        pass  # built concurrently
+
+async def counts(db, user_id, item_ids=None):
+    """item_id -> quantity the user holds (only `item_ids` if given)"""
+    projection = {f"items.{item_id}": True for item_id in item_ids} if item_ids is not None else {"items": True}
+    if item_ids is not None and not projection:
+        return {}
+    for attempt in range(2):
+        doc = await db.collection_inventory.find_one({"_id": user_id}, projection)
+        if doc:
+            return _held(doc.get("items", {}), item_ids)
+        await _rebuild(db, user_id)
+    return {}
+
+async def add(db, user_id, quantities):
+    """Add item quantities in one update; returns all of the user's counts afterwards"""
+    update = {
+        "$inc": {f"items.{item_id}": quantity for item_id, quantity in quantities.items()},
+        "$set": {"updated_at": datetime.utcnow()}
+    }
+    for attempt in range(2):
+        doc = await db.collection_inventory.find_one_and_update(
+            {"_id": user_id}, update, projection={"items": True}, return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            return _held(doc.get("items", {}))
+        await _rebuild(db, user_id)
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Items changed, try again"
+    )
+
+async def take(db, user_id, quantities):
+    """Atomically remove every quantity in `quantities`, or nothing (400 if any item is short)"""
+    query = {"_id": user_id}
+    for item_id, quantity in quantities.items():
+        query[f"items.{item_id}"] = {"$gte": quantity}
+    update = {
+        "$inc": {f"items.{item_id}": -quantity for item_id, quantity in quantities.items()},
+        "$set": {"updated_at": datetime.utcnow()}
+    }
+    for attempt in range(2):
+        result = await db.collection_inventory.update_one(query, update)
+        if result.modified_count:
+            return
+        # Work out which item is short; a missing inventory is built and retried
+        held = await counts(db, user_id, quantities)
+        for item_id, quantity in quantities.items():
+            if held.get(item_id, 0) < quantity:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Not enough {item_id}"
+                )
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Items changed, try again"
+    )
+
+def exchangeable(collection_id, held):
+    return all(held.get(item_id, 0) >= needed for item_id, needed in catalog.collections[collection_id]["items_needed"].items())
+
+def newly_exchangeable(held, added):
+    """Collections that adding `added` (item_id -> quantity) made exchangeable, given the counts after.
+
+    Only collections needing one of the added items are checked (catalog.collections_by_item).
+    """
+    before = {item_id: quantity - added.get(item_id, 0) for item_id, quantity in held.items()}
+    candidates = dict.fromkeys(
+        collection_id
+        for item_id in added
+        for collection_id in catalog.collections_by_item.get(item_id, ())
+    )
+    return [
+        collection_id
+        for collection_id in candidates
+        if exchangeable(collection_id, held) and not exchangeable(collection_id, before)
+    ]
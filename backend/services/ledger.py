@@ -0,0 +1,182 @@
+# Resource ledger: every spend/reward on a user goes through apply().
+#
+# The whole delta is applied with a single guarded find_one_and_update, so a
+# concurrent action can't overdraw resources or lose an update, and the caller
+# gets the post-image back without a separate read (also written through to
+# the per-worker user cache, see services.user_state).
+#
+# Energy regenerates in closed form from `last_energy_update`: reads compute it
+# (current_energy) and never write. It is only persisted by a change that
+# spends or grants energy, as part of that same guarded update.
+#
+# Resource gains and level-ups are reported to services.quest_engine, which
+# advances quest progress from them.
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, status
+
+from utils.catalog import catalog
+from services import profiles, quest_engine, user_state
+
+def level_for_experience(experience):
+    level = 1
+    for level_data in catalog.levels:
+        if experience >= level_data["experience_required"]:
+            level = level_data["level"]
+    return level
+
+ENERGY_TICK_SECONDS = 300  # 1 energy (x energy_regen_rate) per 5 minutes
+
+def _regenerate(user, now):
+    """(energy, regen clock) as of `now`; the clock keeps any partial tick"""
+    stored = user["resources"].get("energy", 0)
+    max_energy = user.get("max_energy", 100)
+    last_update = user.get("last_energy_update") or user.get("updated_at") or now
+    if stored >= max_energy:
+        return stored, now
+    ticks = max(int((now - last_update).total_seconds() // ENERGY_TICK_SECONDS), 0)
+    energy = stored + ticks * user.get("energy_regen_rate", 1)
+    if energy >= max_energy:
+        return max_energy, now
+    return energy, last_update + timedelta(seconds=ticks * ENERGY_TICK_SECONDS)
+
+def current_energy(user, now):
+    """Energy including regeneration since the last persisted update"""
+    return _regenerate(user, now)[0]
+
+def with_current_energy(user, now):
+    """The user as clients should see it: regenerated energy, not the stored value"""
+    user["resources"]["energy"] = current_energy(user, now)
+    return user
+
+def split_rewards(rewards):
+    """Separate the `experience` entry used by quest/collection rewards from real resources"""
+    rewards = dict(rewards or {})
+    return rewards, rewards.pop("experience", 0)
+
+def _build_update(cost, reward, experience, min_level, set_fields, now, user=None, held=None):
+    """(query, update) for one ledger change.
+
+    `held` is what the user must have of each resource (the cost by default).
+    Energy changes need the user's current state (`user`): regenerated energy
+    is materialized and the update is guarded on the stored energy and regen
+    clock, so it only applies to the state it was computed from.
+    """
+    query = {}
+    inc = defaultdict(int)
+    update = {"$set": {"updated_at": now, **(set_fields or {})}}
+    held = cost if held is None else held
+
+    for resource, amount in cost.items():
+        if amount:
+            inc[f"resources.{resource}"] -= amount
+    for resource, amount in held.items():
+        if amount and resource != "energy":
+            query[f"resources.{resource}"] = {"$gte": amount}
+    for resource, amount in reward.items():
+        if amount:
+            inc[f"resources.{resource}"] += amount
+    if experience:
+        inc["experience"] += experience
+    if min_level:
+        query["level"] = {"$gte": min_level}
+
+    inc = {field: amount for field, amount in inc.items() if amount}
+    if "resources.energy" in inc or held.get("energy"):
+        energy, regen_clock = _regenerate(user, now)
+        query["resources.energy"] = user["resources"].get("energy", 0)
+        query["last_energy_update"] = user.get("last_energy_update")
+        update["$set"]["resources.energy"] = energy + inc.pop("resources.energy", 0)
+        update["$set"]["last_energy_update"] = regen_clock
+    if inc:
+        update["$inc"] = inc
+    return query, update
+
+async def _rejection(db, user_id, held, min_level):
+    """Work out why the guarded update matched nothing; None if it should just be retried"""
+    user = await db.users.find_one({"id": user_id}, user_state.USER_PROJECTION)
+    if not user:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    if min_level and user["level"] < min_level:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Level {min_level} required"
+        )
+    # Fresh copy for the retry
+    user_state.remember(user)
+    with_current_energy(user, datetime.utcnow())
+    for resource, amount in held.items():
+        if user["resources"].get(resource, 0) < amount:
+            return HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Not enough {resource}"
+            )
+    return None
+
+async def apply(db, user_id, cost=None, reward=None, experience=0, min_level=None, set_fields=None, require=None):
+    """Atomically charge `cost`, grant `reward` and `experience`; returns the updated user.
+
+    `require` asks for more of a resource to be held than the cost takes (a
+    batch of actions that spends before it earns). Raises 404 if the user is
+    missing and 400 if the level or any resource is short.
+    """
+    cost = cost or {}
+    reward = reward or {}
+    require = require or {}
+    held = {resource: max(cost.get(resource, 0), require.get(resource, 0)) for resource in {*cost, *require}}
+
+    spends_energy = bool(cost.get("energy") or reward.get("energy") or held.get("energy"))
+    for attempt in range(2):
+        now = datetime.utcnow()
+        user = await user_state.get_user_state(db, user_id) if spends_energy else None
+        if user and current_energy(user, now) < held.get("energy", 0):
+            user = None
+        else:
+            query, update = _build_update(cost, reward, experience, min_level, set_fields, now, user, held)
+            user = await user_state.update_user(db, user_id, update, query=query)
+        if user:
+            break
+        error = await _rejection(db, user_id, held, min_level)
+        if error:
+            raise error
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Resources changed, try again"
+        )
+
+    gained = {
+        resource: amount - cost.get(resource, 0)
+        for resource, amount in reward.items()
+        if amount > cost.get(resource, 0)
+    }
+    if gained:
+        resources = user["resources"]
+        before = {resource: resources.get(resource, 0) - amount for resource, amount in gained.items()}
+        await quest_engine.resources_changed(db, user_id, before, {resource: resources.get(resource, 0) for resource in gained})
+
+    if experience:
+        new_level = level_for_experience(user["experience"])
+        if new_level > user["level"]:
+            # Guarded so a stale concurrent level-up can't move the level backwards
+            leveled = await user_state.update_user(
+                db, user_id,
+                {"$set": {"level": new_level}},
+                query={"level": {"$lt": new_level}}
+            )
+            if leveled:
+                user = leveled
+            else:
+                user["level"] = new_level
+                user_state.forget(user_id)
+            # Start progress of the quests this level unlocks
+            await quest_engine.unlock(db, user)
+        # Level/experience are public; don't serve this worker's stale copy
+        profiles.invalidate(user_id)
+
+    return with_current_energy(user, now)
@@ -0,0 +1,246 @@
+# Occupancy grid: which cells of a location hold something, for every entity kind.
+#
+# Buildings, crops, animals and territory elements live in separate
+# collections but share the same cells. One `occupancy` document per user and
+# location holds a bitmap of the grid (bit row * GRID_COLS + col), so a
+# collision check is one small read and a bit test, and finding free cells
+# never scans the entity collections.
+#
+# The bitmap is stored as an array of 64-bit words. Taking cells is one
+# update: $bit sets them, filtered with $bitsAllClear on the same bits, so two
+# requests can't both take a cell and nothing is retried. A missing document
+# is rebuilt from the entity collections on first use; the per-collection
+# unique position indexes stay as the last line of defence.
+
+import os
+
+from bson.int64 import Int64
+from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
+
+from services import farm_store, territory_map
+from services.projections import fields
+
+GRID_ROWS = int(os.getenv("GRID_ROWS", "16"))
+GRID_COLS = int(os.getenv("GRID_COLS", "16"))
+GRID_CELLS = GRID_ROWS * GRID_COLS
+
+WORD_BITS = 64
+GRID_WORDS = (GRID_CELLS + WORD_BITS - 1) // WORD_BITS
+
+# Collections whose documents take up a cell, besides territory (generated,
+# see services.territory_map). Buildings have no location: they are all in "main".
+OCCUPANT_KINDS = ("buildings", "crops", "animals")
+
+def cell_index(position):
+    """"row-col" -> bit index; 400 if it isn't a cell of the grid"""
+    try:
+        row, col = (int(part) for part in position.split("-"))
+    except (AttributeError, ValueError):
+        row = col = -1
+    if not (0 <= row < GRID_ROWS and 0 <= col < GRID_COLS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid position"
+        )
+    return row * GRID_COLS + col
+
+def position_of(index):
+    return f"{index // GRID_COLS}-{index % GRID_COLS}"
+
+def _grid_id(user_id, location):
+    return f"{user_id}:{location}"
+
+def _word(value):
+    """Unsigned 64-bit word -> the signed Int64 Mongo stores"""
+    return Int64(value - (1 << WORD_BITS) if value >> (WORD_BITS - 1) else value)
+
+def _encode(bits):
+    word_mask = (1 << WORD_BITS) - 1
+    return [_word((bits >> (word * WORD_BITS)) & word_mask) for word in range(GRID_WORDS)]
+
+def _decode(words):
+    bits = 0
+    for word, value in enumerate(words):
+        bits |= (value & ((1 << WORD_BITS) - 1)) << (word * WORD_BITS)
+    return bits
+
+def _split(mask):
+    """word index -> (bit positions, unsigned word) of the bits set in `mask`"""
+    words = {}
+    for word in range(GRID_WORDS):
+        value = (mask >> (word * WORD_BITS)) & ((1 << WORD_BITS) - 1)
+        if value:
+            words[word] = ([bit for bit in range(WORD_BITS) if (value >> bit) & 1], value)
+    return words
+
+class Grid:
+    """Snapshot of one location's bitmap"""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    def is_free(self, index):
+        return not (self.bits >> index) & 1
+
+    def free_count(self):
+        return GRID_CELLS - bin(self.bits).count("1")
+
+    def first_free(self):
+        """Lowest free cell in row-major order, or None if the grid is full"""
+        index = (~self.bits & (self.bits + 1)).bit_length() - 1
+        return index if index < GRID_CELLS else None
+
+    def free_cells(self):
+        free = ~self.bits & ((1 << GRID_CELLS) - 1)
+        while free:
+            lowest = free & -free
+            yield lowest.bit_length() - 1
+            free ^= lowest
+
+    def nearest_free(self, origin, count):
+        """Up to `count` free cells closest to `origin` (Euclidean, then row-major)"""
+        row, col = divmod(origin, GRID_COLS)
+
+        def distance(index):
+            other_row, other_col = divmod(index, GRID_COLS)
+            return ((other_row - row) ** 2 + (other_col - col) ** 2, index)
+
+        return sorted(self.free_cells(), key=distance)[:count]
+
+def _occupant_query(kind, location):
+    if kind == "buildings":
+        return {} if location == "main" else None
+    return {"location": location}
+
+async def _rebuild(db, user_id, location):
+    """Bitmap from the entity collections, for users placed before the grid existed"""
+    positions = [
+        doc["position"]
+        for doc in await territory_map.load(db, user_id, fields("location", "position", "status"), location)
+    ]
+    for kind in OCCUPANT_KINDS:
+        query = _occupant_query(kind, location)
+        if query is not None:
+            positions.extend(doc["position"] for doc in await farm_store.find(db, kind, user_id, query, fields("position")))
+
+    bits = 0
+    for position in positions:
+        try:
+            bits |= 1 << cell_index(position)
+        except HTTPException:
+            continue  # placed off-grid before positions were checked
+    try:
+        await db.occupancy.insert_one({
+            "_id": _grid_id(user_id, location),
+            "user_id": user_id,
+            "location": location,
+            "words": _encode(bits)
+        })
+    except DuplicateKeyError:
+        return None  # built concurrently; read that one
+    return Grid(bits)
+
+async def _convert(db, doc):
+    """Grid stored by an earlier version (one binary `cells` field) -> words"""
+    bits = int.from_bytes(doc["cells"], "little")
+    await db.occupancy.update_one(
+        {"_id": doc["_id"], "words": {"$exists": False}},
+        {"$set": {"words": _encode(bits)}, "$unset": {"cells": "", "rev": ""}}
+    )
+
+async def load(db, user_id, location="main"):
+    """Current grid of a location"""
+    for attempt in range(2):
+        doc = await db.occupancy.find_one({"_id": _grid_id(user_id, location)}, fields("words", "cells"))
+        if doc and "words" in doc:
+            return Grid(_decode(doc["words"]))
+        if doc:
+            await _convert(db, doc)
+            continue
+        grid = await _rebuild(db, user_id, location)
+        if grid:
+            return grid
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Placement changed, try again"
+    )
+
+async def reset(db, user_id):
+    """Drop a user's grids; they are rebuilt on next use"""
+    await db.occupancy.delete_many({"user_id": user_id})
+
+def _occupied():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Position already occupied"
+    )
+
+async def _update(db, user_id, location, take_mask=0, release_mask=0, check=True):
+    """Free `release_mask`, then take `take_mask`, in one atomic update.
+
+    With `check`, nothing changes unless every cell of `take_mask` is free
+    once `release_mask` is freed (400 otherwise).
+    """
+    required = _split(take_mask & ~release_mask) if check else {}
+    releases = _split(release_mask)
+    takes = _split(take_mask)
+    query = {"_id": _grid_id(user_id, location), "words": {"$exists": True}}
+    for word, (positions, _) in required.items():
+        query[f"words.{word}"] = {"$bitsAllClear": positions}
+    update = {}
+    for word in sorted({*releases, *takes}):
+        operations = {}
+        if word in releases:
+            operations["and"] = _word(~releases[word][1] & ((1 << WORD_BITS) - 1))
+        if word in takes:
+            operations["or"] = _word(takes[word][1])
+        update[f"words.{word}"] = operations
+
+    for attempt in range(2):
+        result = await db.occupancy.update_one(query, {"$bit": update})
+        if result.matched_count:
+            return
+        # No grid yet (or one stored by an earlier version), or a cell is taken
+        grid = await load(db, user_id, location)
+        if (grid.bits & ~release_mask) & take_mask and check:
+            raise _occupied()
+    raise _occupied()
+
+def _mask(positions):
+    mask = 0
+    for position in positions:
+        mask |= 1 << cell_index(position)
+    return mask
+
+async def occupy(db, user_id, location, *positions):
+    """Take every cell in `positions`, or none of them (400 if any is occupied)"""
+    await _update(db, user_id, location, take_mask=_mask(positions))
+
+def _release_mask(positions):
+    mask = 0
+    for position in positions:
+        try:
+            mask |= 1 << cell_index(position)
+        except HTTPException:
+            continue
+    return mask
+
+async def release(db, user_id, location, *positions):
+    """Free the cells in `positions` (off-grid positions are ignored)"""
+    mask = _release_mask(positions)
+    if mask:
+        await _update(db, user_id, location, release_mask=mask)
+
+async def change(db, user_id, location, take=(), release=(), check=True):
+    """Free `release`, then take `take`, in one update.
+
+    400 if a cell to take is occupied (unless `check` is off, which is for
+    undoing an earlier change).
+    """
+    take_mask = _mask(take) if check else _release_mask(take)
+    release_mask = _release_mask(release)
+    if take_mask or release_mask:
+        await _update(db, user_id, location, take_mask, release_mask, check)
@@ -0,0 +1,153 @@
+# Keyset pagination and NDJSON streaming for the list endpoints.
+#
+# Pages are read in `_id` order and the cursor is the `_id` of the last
+# document returned, so a page costs one indexed range scan however deep it
+# is and rows inserted meanwhile don't shift later pages. Without `limit` the
+# whole list is returned; nothing is cut off silently.
+#
+# In stream mode documents are serialized batch by batch as the Motor cursor
+# yields them and written out one JSON object per line.
+
+import inspect
+import os
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from pymongo import ASCENDING
+
+from utils.responses import GameResponse, dumps_json
+
+PAGE_LIMIT_MAX = int(os.getenv("PAGE_LIMIT_MAX", "500"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "100"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class PageParams:
+    """`limit`, `cursor` and `stream` query parameters shared by the list endpoints"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=PAGE_LIMIT_MAX, description="Page size; omit for the whole list"),
+        cursor: Optional[str] = Query(None, description="nextCursor of the previous page"),
+        stream: bool = Query(False, description="Stream items as NDJSON instead of one JSON body")
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.stream = stream
+
+def decode_page_cursor(cursor):
+    """Page cursor -> ObjectId; 400 if it isn't one of ours"""
+    try:
+        return ObjectId(cursor)
+    except (InvalidId, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        ) from None
+
+def _find(collection, query, after, projection):
+    if after:
+        query = {**query, "_id": {"$gt": decode_page_cursor(after)}}
+    return collection.find(query, projection).sort("_id", ASCENDING)
+
+async def read_page(collection, query, limit=None, after=None, projection=None):
+    """(documents, next cursor) in _id order; the cursor is None on the last page"""
+    cursor = _find(collection, query, after, projection)
+    if limit is None:
+        return await cursor.to_list(length=None), None
+    # One extra document tells whether there is a next page
+    docs = await cursor.limit(limit + 1).to_list(length=None)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, str(docs[-1]["_id"])
+
+async def read_batches(collection, query, limit=None, after=None, projection=None):
+    """Documents in _id order, yielded in lists of up to STREAM_BATCH_SIZE"""
+    cursor = _find(collection, query, after, projection).batch_size(STREAM_BATCH_SIZE)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def _serialized(serialize, docs, now):
+    items = serialize(docs, now)
+    return await items if inspect.isawaitable(items) else items
+
+def ndjson_response(items):
+    """StreamingResponse writing each item of an async iterable as one JSON line"""
+    async def lines():
+        async for item in items:
+            yield dumps_json(item) + b"\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+async def paginate(collection, query, key, serialize, page, projection=None):
+    """Response of a paginated list endpoint for `page` (PageParams).
+
+    `serialize(docs, now)` turns a batch of documents into API items (it may
+    be async and may drop documents). The page is returned as
+    `{key: [...], "nextCursor": ...}` (key=None for a bare list, with the
+    cursor only in the X-Next-Cursor header), or streamed as NDJSON.
+    """
+    if page.stream:
+        if page.cursor:
+            # Reject a bad cursor before the 200 goes out
+            decode_page_cursor(page.cursor)
+
+        async def items():
+            async for docs in read_batches(collection, query, page.limit, page.cursor, projection):
+                for item in await _serialized(serialize, docs, datetime.utcnow()):
+                    yield item
+
+        return ndjson_response(items())
+
+    docs, next_cursor = await read_page(collection, query, page.limit, page.cursor, projection)
+    items = await _serialized(serialize, docs, datetime.utcnow())
+    return page_response(key, items, next_cursor)
+
+async def paginate_docs(docs, key, serialize, page):
+    """paginate() over documents already in memory, in list order.
+
+    The cursor is the `id` of the last document on the page.
+    """
+    start = 0
+    if page.cursor:
+        ids = [doc["id"] for doc in docs]
+        if page.cursor not in ids:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        start = ids.index(page.cursor) + 1
+    end = len(docs) if page.limit is None else start + page.limit
+    selected = docs[start:end]
+
+    if page.stream:
+        async def items():
+            for offset in range(0, len(selected), STREAM_BATCH_SIZE):
+                batch = selected[offset:offset + STREAM_BATCH_SIZE]
+                for item in await _serialized(serialize, batch, datetime.utcnow()):
+                    yield item
+
+        return ndjson_response(items())
+
+    next_cursor = selected[-1]["id"] if selected and end < len(docs) else None
+    return page_response(key, await _serialized(serialize, selected, datetime.utcnow()), next_cursor)
+
+def page_response(key, entries, next_cursor, **extra):
+    """One page (JSON or MessagePack), with the next cursor in the body (unless key=None) and header"""
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    body = entries if key is None else {key: entries, **extra, "nextCursor": next_cursor}
+    return GameResponse(body, headers=headers)
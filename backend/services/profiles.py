@@ -0,0 +1,37 @@
+# Public player profiles (what friends and other players may see).
+#
+# Looked up in one batched $in query limited to public fields, and kept for a
+# few seconds in a per-worker cache so popular players aren't re-read on every
+# friend-list view.
+
+import os
+
+from utils.cache import TTLCache
+
+PUBLIC_PROFILE_PROJECTION = {"_id": False, "id": True, "username": True, "level": True, "experience": True}
+
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "30"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+_cache = TTLCache("profiles", PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+async def get_public_profiles(db, user_ids):
+    """Public profiles by user id; unknown ids are left out"""
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        profile = _cache.get(user_id)
+        if profile is None:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+
+    if missing:
+        cursor = db.users.find({"id": {"$in": missing}}, PUBLIC_PROFILE_PROJECTION)
+        async for profile in cursor:
+            _cache.set(profile["id"], profile)
+            profiles[profile["id"]] = profile
+    return profiles
+
+def invalidate(user_id):
+    _cache.pop(user_id)
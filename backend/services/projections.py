@@ -0,0 +1,91 @@
+# Field projections for game queries, and bytes-read accounting.
+#
+# Each route declares the fields it reads with fields(); queries pass that as
+# their projection, so Mongo only sends (and the driver only decodes) those.
+# MONGO_PROJECTIONS=0 turns every projection off (full documents, as before)
+# to compare against.
+#
+# With MONGO_BYTES_REPORT=1 a driver command listener adds up the BSON size of
+# every reply per request; GET /api/metrics reports the totals per route and
+# responses carry an X-Mongo-Bytes-Read header. Sizing a reply re-encodes it,
+# so this is for measurement runs, not for production.
+
+import os
+from collections import defaultdict
+from contextvars import ContextVar
+
+import bson
+from pymongo import monitoring
+
+PROJECTIONS_ENABLED = os.getenv("MONGO_PROJECTIONS", "1") == "1"
+BYTES_REPORT_ENABLED = os.getenv("MONGO_BYTES_REPORT", "0") == "1"
+
+BYTES_READ_HEADER = "X-Mongo-Bytes-Read"
+
+def fields(*names):
+    """Projection of `names` (None when projections are disabled)"""
+    if not PROJECTIONS_ENABLED:
+        return None
+    return {name: True for name in names}
+
+class ReadCounter:
+    """Replies, documents and bytes read by one request"""
+
+    __slots__ = ("replies", "documents", "bytes")
+
+    def __init__(self):
+        self.replies = 0
+        self.documents = 0
+        self.bytes = 0
+
+_current = ContextVar("mongo_read_counter", default=None)
+
+# route path -> totals
+_routes = defaultdict(lambda: {"requests": 0, "replies": 0, "documents": 0, "bytes": 0})
+
+def _reply_documents(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    return 1 if reply.get("value") else 0
+
+class ReplySizeListener(monitoring.CommandListener):
+    """Adds each command reply to the current request's ReadCounter"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        counter = _current.get()
+        if counter is None:
+            return
+        counter.replies += 1
+        counter.documents += _reply_documents(event.reply)
+        counter.bytes += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+def event_listeners():
+    """Listeners to pass to the Mongo client"""
+    return [ReplySizeListener()] if BYTES_REPORT_ENABLED else []
+
+def start_request():
+    """Count reads from here on (the counter follows the request's context)"""
+    counter = ReadCounter()
+    _current.set(counter)
+    return counter
+
+def finish_request(route, counter):
+    totals = _routes[route]
+    totals["requests"] += 1
+    totals["replies"] += counter.replies
+    totals["documents"] += counter.documents
+    totals["bytes"] += counter.bytes
+
+def read_stats():
+    """route -> read totals and bytes per request"""
+    return {
+        route: {**totals, "bytes_per_request": round(totals["bytes"] / totals["requests"])}
+        for route, totals in sorted(_routes.items())
+    }
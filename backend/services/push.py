@@ -0,0 +1,116 @@
+# Server push of timed state transitions.
+#
+# Every connected player gets a PushSession that loads their entities, works
+# out when the next transition is due (construction finished, crop ready or
+# withered, animal grown up or producing, territory cleared) and sends each
+# one the moment it happens. Writes stamped through services.sync wake the
+# session so the plan follows the player's own actions; a periodic replan
+# covers writes made by other workers.
+
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from services import farm_store
+from services.timers import transitions
+
+PUSH_REPLAN_DELAY = float(os.getenv("PUSH_REPLAN_DELAY", "0.2"))
+PUSH_REPLAN_INTERVAL = float(os.getenv("PUSH_REPLAN_INTERVAL", "60"))
+
+class PushSession:
+    """One connected client: plans the user's upcoming transitions and sends them when due"""
+
+    def __init__(self, db, user_id, send, serializers, projections=None):
+        self.db = db
+        self.user_id = user_id
+        self.send = send
+        self.serializers = serializers
+        # kind -> fields the serializer reads (None: whole documents)
+        self.projections = projections or {}
+        self._wakeup = asyncio.Event()
+
+    def touch(self):
+        self._wakeup.set()
+
+    async def _load_plan(self, since):
+        """Upcoming transitions from `since` on (inclusive), sorted by due time"""
+        farm = await farm_store.load(
+            self.db, self.user_id,
+            kinds=("buildings", "crops", "animals", "territory"),
+            queries={"territory": {"status": "clearing"}},
+            projections=self.projections
+        )
+
+        plan = []
+        for kind, docs in farm.items():
+            for doc in docs:
+                for due_at, event_type in transitions(kind, doc):
+                    if due_at >= since:
+                        plan.append((due_at, event_type, kind, doc))
+        plan.sort(key=lambda item: item[0])
+        return plan
+
+    async def _wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def run(self):
+        sent_until = datetime.utcnow()
+        # Transitions already sent that are due exactly at sent_until: a replan
+        # starts from that moment again, and others can share it (everything
+        # one batch planted has the same planted_at)
+        sent = set()
+        while True:
+            self._wakeup.clear()
+            plan = await self._load_plan(sent_until)
+            replan_at = datetime.utcnow() + timedelta(seconds=PUSH_REPLAN_INTERVAL)
+
+            woken = False
+            for due_at, event_type, kind, doc in plan:
+                key = (event_type, kind, doc["id"])
+                if due_at == sent_until and key in sent:
+                    continue
+                if due_at > replan_at:
+                    break
+                if await self._wait((due_at - datetime.utcnow()).total_seconds()):
+                    woken = True
+                    break
+                entity = self.serializers[kind](doc, datetime.utcnow())
+                if entity:
+                    await self.send({"type": event_type, "kind": kind, "entity": entity})
+                if due_at != sent_until:
+                    sent_until, sent = due_at, set()
+                sent.add(key)
+
+            if woken or await self._wait((replan_at - datetime.utcnow()).total_seconds()):
+                # Coalesce a burst of writes into one replan, after they have landed
+                await asyncio.sleep(PUSH_REPLAN_DELAY)
+
+class PushHub:
+    """Connected push sessions of this worker, by user"""
+
+    def __init__(self):
+        self._sessions = defaultdict(set)
+
+    def register(self, session):
+        self._sessions[session.user_id].add(session)
+
+    def unregister(self, session):
+        sessions = self._sessions.get(session.user_id)
+        if sessions:
+            sessions.discard(session)
+            if not sessions:
+                del self._sessions[session.user_id]
+
+    def touch(self, user_id):
+        for session in self._sessions.get(user_id, ()):
+            session.touch()
+
+    def connected(self):
+        return sum(len(sessions) for sessions in self._sessions.values())
+
+hub = PushHub()
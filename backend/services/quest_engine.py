@@ -0,0 +1,194 @@
+# Quest progress engine: requirements compiled into trigger indexes, progress
+# updated incrementally when a trigger fires.
+#
+# Quest requirements are indexed by the event that can meet them:
+#   building built       building type -> quests needing it
+#   resource threshold   resource -> quests sorted by required amount, so the
+#                        thresholds a change from `before` to `after` crossed
+#                        are found with two bisects
+#   level reached        quests sorted by level_required; the quests a user
+#                        can see are a prefix found with one bisect
+#
+# Every unlocked quest has a quest_progress document listing the requirements
+# met so far. A requirement stays met once met (a building once it is built, a
+# resource amount once reached). The quest completes when all of them are, in
+# the same bulk write that records the last one. An event only writes the
+# progress of the quests it can affect, and GET /api/quests is one indexed read.
+#
+# Progress starts when a quest unlocks, seeded from the farm as it is then:
+# the user's `quest_level` is the level up to which quests were seeded.
+# Level-ups seed the newly unlocked quests. Users from before the engine are
+# seeded on their first quest read.
+#
+# Buildings are marked by the scheduler when construction ends. Reading or
+# claiming quests also marks finished buildings it hasn't got to, so quests
+# still complete when the scheduler is late or turned off.
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from models.quest import QuestProgress
+from services import farm_store, timers, user_state
+from utils.catalog import catalog
+
+def _level_required(quest):
+    return quest.get("level_required", 1)
+
+# Quests by level (catalog order within a level) and their levels, for bisect
+QUESTS = tuple(sorted(catalog.quests.values(), key=_level_required))
+_QUEST_LEVELS = [_level_required(quest) for quest in QUESTS]
+
+def _compile():
+    by_building = defaultdict(list)
+    by_resource = defaultdict(list)
+    for quest in QUESTS:
+        requirements = quest["requirements"]
+        for building_type in requirements.get("buildings", ()):
+            by_building[building_type].append(quest["id"])
+        for resource, amount in requirements.get("resources", {}).items():
+            by_resource[resource].append((amount, quest["id"]))
+    thresholds = {}
+    for resource, entries in by_resource.items():
+        entries.sort()
+        thresholds[resource] = ([amount for amount, _ in entries], [quest_id for _, quest_id in entries])
+    return dict(by_building), thresholds
+
+# building type -> quest ids; resource -> (sorted amounts, quest ids in the same order)
+BY_BUILDING, BY_RESOURCE = _compile()
+
+def available(level):
+    """Quests a user of `level` can see, by level_required"""
+    return QUESTS[:bisect_right(_QUEST_LEVELS, level)]
+
+def unlocked_between(low, high):
+    """Quests with low < level_required <= high"""
+    return QUESTS[bisect_right(_QUEST_LEVELS, low):bisect_right(_QUEST_LEVELS, high)]
+
+def crossed(resource, before, after):
+    """Ids of quests needing an amount of `resource` in (before, after]"""
+    if resource not in BY_RESOURCE or after <= before:
+        return []
+    amounts, quest_ids = BY_RESOURCE[resource]
+    return quest_ids[bisect_right(amounts, before):bisect_right(amounts, after)]
+
+def _met(quest, built, resources):
+    requirements = quest["requirements"]
+    return {
+        "buildings": [building_type for building_type in requirements.get("buildings", ()) if building_type in built],
+        "resources": [
+            resource for resource, amount in requirements.get("resources", {}).items()
+            if resources.get(resource, 0) >= amount
+        ]
+    }
+
+def _all_met(quest, met):
+    requirements = quest["requirements"]
+    return (
+        set(requirements.get("buildings", ())) <= set(met["buildings"])
+        and set(requirements.get("resources", {})) <= set(met["resources"])
+    )
+
+async def _built_types(db, user_id):
+    buildings = await farm_store.find(db, "buildings", user_id, projection=timers.TIMER_FIELDS["buildings"])
+    states = timers.evaluate("buildings", buildings, datetime.utcnow())
+    return {building["type"] for building, state in zip(buildings, states) if state and state.phase != timers.PENDING}
+
+async def unlock(db, user):
+    """Seed progress of the quests unlocked up to the user's level (no-op once seeded)"""
+    seeded = user.get("quest_level", 0)
+    if seeded >= user["level"]:
+        return
+    quests = unlocked_between(seeded, user["level"])
+    if quests:
+        needs_buildings = any(quest["requirements"].get("buildings") for quest in quests)
+        built = await _built_types(db, user["id"]) if needs_buildings else set()
+        now = datetime.utcnow()
+        operations = []
+        for quest in quests:
+            met = _met(quest, built, user["resources"])
+            completed = _all_met(quest, met)
+            progress = QuestProgress(
+                user_id=user["id"],
+                quest_id=quest["id"],
+                completed=completed,
+                completed_at=now if completed else None,
+                **met
+            )
+            # Progress that already exists (claimed before the engine) is kept
+            operations.append(UpdateOne(
+                {"user_id": user["id"], "quest_id": quest["id"]},
+                {"$setOnInsert": progress.model_dump()},
+                upsert=True
+            ))
+        await db.quest_progress.bulk_write(operations, ordered=False)
+    await user_state.update_user(db, user["id"], {"$max": {"quest_level": user["level"]}})
+
+def _mark(user_id, quest_id, field, value, now):
+    """Operations recording one met requirement, completing the quest if it was the last one"""
+    quest = catalog.quests[quest_id]
+    requirements = quest["requirements"]
+    others = {
+        "buildings": [item for item in requirements.get("buildings", ()) if (field, item) != ("buildings", value)],
+        "resources": [item for item in requirements.get("resources", {}) if (field, item) != ("resources", value)]
+    }
+    query = {"user_id": user_id, "quest_id": quest_id, "completed": False}
+    completing = dict(query)
+    for other_field, items in others.items():
+        if items:
+            completing[other_field] = {"$all": items}
+    return [
+        UpdateOne(completing, {"$addToSet": {field: value}, "$set": {"completed": True, "completed_at": now}}),
+        UpdateOne(query, {"$addToSet": {field: value}})
+    ]
+
+async def _apply(db, operations):
+    if operations:
+        await db.quest_progress.bulk_write(operations)
+
+async def buildings_built(db, buildings):
+    """Buildings (any players) finished construction"""
+    now = datetime.utcnow()
+    operations = []
+    for building in buildings:
+        for quest_id in BY_BUILDING.get(building["type"], ()):
+            operations.extend(_mark(building["user_id"], quest_id, "buildings", building["type"], now))
+    await _apply(db, operations)
+
+async def buildings_finished(db, user_id, progresses):
+    """Record buildings of `progresses` (this user's quest_progress documents)
+    that finished construction but weren't marked yet; returns whether any were.
+
+    The scheduler marks them when construction ends; this catches the ones it
+    hasn't got to yet, or all of them when it is off (SCHEDULER_ENABLED=0).
+    """
+    waiting = {}
+    for progress in progresses:
+        quest = catalog.quests.get(progress["quest_id"])
+        if progress.get("completed") or not quest:
+            continue
+        missing = set(quest["requirements"].get("buildings", ())) - set(progress.get("buildings", ()))
+        if missing:
+            waiting[quest["id"]] = missing
+    if not waiting:
+        return False
+
+    built = await _built_types(db, user_id)
+    now = datetime.utcnow()
+    operations = []
+    for quest_id, missing in waiting.items():
+        for building_type in sorted(missing & built):
+            operations.extend(_mark(user_id, quest_id, "buildings", building_type, now))
+    await _apply(db, operations)
+    return bool(operations)
+
+async def resources_changed(db, user_id, before, after):
+    """A user's resources went from `before` to `after`; records thresholds crossed upwards"""
+    now = datetime.utcnow()
+    operations = []
+    for resource, amount in after.items():
+        for quest_id in crossed(resource, before.get(resource, 0), amount):
+            operations.extend(_mark(user_id, quest_id, "resources", resource, now))
+    await _apply(db, operations)
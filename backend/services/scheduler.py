@@ -0,0 +1,331 @@
+# Background scheduler for things that become due on their own.
+#
+# Due events live in the `due_events` collection (indexed on due_at), so they
+# survive restarts and any worker can run them. Each worker keeps the events
+# due within SCHEDULER_LOOKAHEAD in a heap and sleeps until the earliest one.
+# Due events are claimed with a short lease, handled in batches per event type
+# and coalesced per user: one change version per user per batch, and one bulk
+# write per collection.
+#
+# Handled events:
+#   building.built             construction finished -> status "built", quest progress
+#   material_request.expired   past expires_at -> status "expired"
+#   crop.ready, crop.withered, animal.adult, building.ready, animal.producing
+#                              timer passed (grown, withered, grown up,
+#                              production available) -> new change version, so
+#                              delta sync and push pick it up
+
+import asyncio
+import heapq
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from services import farm_store, quest_engine, timers
+from services.projections import fields
+from utils.catalog import catalog
+from services.sync import next_version
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_POLL_INTERVAL = float(os.getenv("SCHEDULER_POLL_INTERVAL", "5"))
+SCHEDULER_LOOKAHEAD = float(os.getenv("SCHEDULER_LOOKAHEAD", "60"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "500"))
+SCHEDULER_LEASE = float(os.getenv("SCHEDULER_LEASE", "30"))
+# A backfill left "running" this long by a worker that died is taken over
+SCHEDULER_BACKFILL_LEASE = float(os.getenv("SCHEDULER_BACKFILL_LEASE", "3600"))
+
+# Entity transitions (see services.timers) that the scheduler acts on
+ENTITY_EVENTS = {
+    "building.built", "building.ready",
+    "crop.ready", "crop.withered", "animal.adult", "animal.producing"
+}
+
+# Events that write stored state, so they are still worth handling late
+STATE_EVENTS = {"building.built", "material_request.expired"}
+
+# Timer-only events -> phases an entity is in once it really made the
+# transition (it may have been harvested, collected or protected since)
+REACHED = {
+    "crop.ready": {timers.DONE, timers.EXPIRED},
+    "crop.withered": {timers.EXPIRED},
+    "animal.adult": {timers.DONE, timers.CYCLE_READY},
+    "building.ready": {timers.CYCLE_READY},
+    "animal.producing": {timers.CYCLE_READY},
+}
+
+def _event_id(kind, entity_id, event):
+    return f"{kind}:{entity_id}:{event}"
+
+def _schedule_operation(user_id, kind, entity_id, event, due_at):
+    return UpdateOne(
+        {"_id": _event_id(kind, entity_id, event)},
+        {"$set": {
+            "user_id": user_id,
+            "kind": kind,
+            "entity_id": entity_id,
+            "event": event,
+            "due_at": due_at,
+            "lease_until": None,
+            "owner": None
+        }},
+        upsert=True
+    )
+
+async def schedule(db, user_id, kind, entity_id, event, due_at):
+    """Queue (or move) one event; an entity has at most one pending event of each type"""
+    await db.due_events.bulk_write([_schedule_operation(user_id, kind, entity_id, event, due_at)])
+    scheduler.notify(_event_id(kind, entity_id, event), due_at)
+
+def _upcoming(kind, doc, now, past_events=()):
+    """(due_at, event) the scheduler handles for this entity: due after `now`, or in `past_events`"""
+    return [
+        (due_at, event) for due_at, event in timers.transitions(kind, doc)
+        if event in ENTITY_EVENTS and (due_at > now or event in past_events)
+    ]
+
+async def schedule_entity(db, kind, doc, now=None):
+    """Queue the upcoming transitions of an entity that was just created or changed"""
+    for due_at, event in _upcoming(kind, doc, now or datetime.utcnow()):
+        await schedule(db, doc["user_id"], kind, doc["id"], event, due_at)
+
+async def _stamp_versions(db, kind, docs, versions, extra=None):
+    await farm_store.update_many(db, kind, [
+        (doc, {**(extra(doc) if extra else {}), "version": versions[doc["user_id"]]})
+        for doc in docs
+    ])
+
+async def _buildings_built(db, events, now, versions):
+    docs = await farm_store.find_by_ids(
+        db, "buildings", [e["entity_id"] for e in events], {"status": "building"}, timers.TIMER_FIELDS["buildings"]
+    )
+    states = timers.evaluate("buildings", docs, now)
+    done = [doc for doc, state in zip(docs, states) if state.phase != timers.PENDING]
+
+    def completion(doc):
+        completed_at = doc["start_time"] + timedelta(seconds=doc["build_time"])
+        doc.update(status="built", last_collect_time=completed_at)
+        return {"status": "built", "progress": 100, "last_collect_time": completed_at}
+
+    await _stamp_versions(db, "buildings", done, versions, completion)
+    await quest_engine.buildings_built(db, done)
+    for doc in done:
+        await schedule_entity(db, "buildings", doc, now)
+
+async def _transitioned(db, events, now, versions):
+    """Stamp a version on entities whose timer passed, so the change shows up in sync"""
+    by_kind = defaultdict(list)
+    for event in events:
+        by_kind[event["kind"], event["event"]].append(event["entity_id"])
+    for (kind, event), entity_ids in by_kind.items():
+        docs = await farm_store.find_by_ids(db, kind, entity_ids, projection=timers.TIMER_FIELDS[kind])
+        states = timers.evaluate(kind, docs, now)
+        reached = [doc for doc, state in zip(docs, states) if state and state.phase in REACHED[event]]
+        await _stamp_versions(db, kind, reached, versions)
+
+async def _material_requests_expired(db, events, now, versions):
+    await db.material_requests.update_many(
+        {
+            "id": {"$in": [e["entity_id"] for e in events]},
+            "status": "active",
+            "expires_at": {"$lte": now}
+        },
+        {"$set": {"status": "expired"}}
+    )
+
+# event -> (handler, whether it changes a versioned entity)
+HANDLERS = {
+    "building.built": (_buildings_built, True),
+    "crop.ready": (_transitioned, True),
+    "crop.withered": (_transitioned, True),
+    "animal.adult": (_transitioned, True),
+    "building.ready": (_transitioned, True),
+    "animal.producing": (_transitioned, True),
+    "material_request.expired": (_material_requests_expired, False),
+}
+
+class Scheduler:
+    """This worker's view of the due queue"""
+
+    def __init__(self):
+        self.db = None
+        self.owner = str(uuid.uuid4())
+        self._heap = []
+        self._queued = set()
+        self._horizon = datetime.min
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.fired = 0
+
+    def notify(self, event_id, due_at):
+        """Pick up an event scheduled by this worker without waiting for the next poll"""
+        # A stale duplicate in the heap is harmless: claiming checks the stored due_at
+        if self._task is None or due_at > self._horizon:
+            return
+        heapq.heappush(self._heap, (due_at, event_id))
+        self._queued.add(event_id)
+        if self._heap[0][1] == event_id:
+            self._wakeup.set()
+
+    def start(self, db):
+        self.db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _load(self, now):
+        """Queue every unleased event due before the next poll"""
+        self._horizon = now + timedelta(seconds=SCHEDULER_LOOKAHEAD)
+        cursor = self.db.due_events.find(
+            {
+                "due_at": {"$lte": self._horizon},
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]
+            },
+            {"_id": True, "due_at": True}
+        ).sort("due_at", 1).limit(SCHEDULER_BATCH_SIZE * 10)
+        async for event in cursor:
+            if event["_id"] not in self._queued:
+                heapq.heappush(self._heap, (event["due_at"], event["_id"]))
+                self._queued.add(event["_id"])
+
+    async def _claim(self, event_ids, now):
+        lease_until = now + timedelta(seconds=SCHEDULER_LEASE)
+        await self.db.due_events.update_many(
+            {
+                "_id": {"$in": event_ids},
+                "due_at": {"$lte": now},
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]
+            },
+            {"$set": {"lease_until": lease_until, "owner": self.owner}}
+        )
+        return await self.db.due_events.find(
+            {"_id": {"$in": event_ids}, "owner": self.owner, "lease_until": lease_until}
+        ).to_list(length=None)
+
+    async def fire_due(self, now=None):
+        """Claim and handle everything in the heap that is due; returns the number handled"""
+        now = now or datetime.utcnow()
+        event_ids = []
+        while self._heap and self._heap[0][0] <= now and len(event_ids) < SCHEDULER_BATCH_SIZE:
+            _, event_id = heapq.heappop(self._heap)
+            self._queued.discard(event_id)
+            event_ids.append(event_id)
+        if not event_ids:
+            return 0
+
+        events = await self._claim(event_ids, now)
+        by_event = defaultdict(list)
+        for event in events:
+            by_event[event["event"]].append(event)
+
+        # Coalesce per user: one change version covers all of a user's events
+        users = {event["user_id"] for event in events if HANDLERS.get(event["event"], (None, False))[1]}
+        versions = dict(zip(users, await asyncio.gather(*(next_version(self.db, user_id) for user_id in users))))
+
+        for event_type, batch in by_event.items():
+            handler = HANDLERS.get(event_type)
+            if handler:
+                await handler[0](self.db, batch, now, versions)
+
+        await self.db.due_events.delete_many(
+            {"_id": {"$in": [event["_id"] for event in events]}, "owner": self.owner}
+        )
+        self.fired += len(events)
+        return len(events)
+
+    async def _run(self):
+        next_poll = datetime.min
+        while True:
+            try:
+                now = datetime.utcnow()
+                if now >= next_poll:
+                    await self._load(now)
+                    next_poll = now + timedelta(seconds=SCHEDULER_POLL_INTERVAL)
+                await self.fire_due(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Scheduler batch failed: {e}")
+
+            wake_at = next_poll
+            if self._heap:
+                wake_at = min(wake_at, self._heap[0][0])
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=max((wake_at - datetime.utcnow()).total_seconds(), 0)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {"queued": len(self._heap), "fired": self.fired}
+
+scheduler = Scheduler()
+
+# Bump to run the backfill again (e.g. after adding event types)
+BACKFILL_MARKER = "scheduler_backfill:2"
+
+async def _claim_backfill(db, now):
+    """Whether this worker runs the one-time backfill (recorded in `migrations`)"""
+    try:
+        await db.migrations.insert_one({"_id": BACKFILL_MARKER, "status": "running", "started_at": now})
+        return True
+    except DuplicateKeyError:
+        # Done, or running on another worker; taken over only if that worker died
+        return await db.migrations.find_one_and_update(
+            {
+                "_id": BACKFILL_MARKER,
+                "status": "running",
+                "started_at": {"$lt": now - timedelta(seconds=SCHEDULER_BACKFILL_LEASE)}
+            },
+            {"$set": {"started_at": now}}
+        ) is not None
+
+async def backfill(db):
+    """Queue events for entities created before the scheduler handled them; runs once per deployment.
+
+    Transitions already in the past are skipped (delta sync and push don't need
+    them any more) except the ones that still change stored state.
+    """
+    now = datetime.utcnow()
+    if not await _claim_backfill(db, now):
+        return
+    sources = {
+        "buildings": {"$or": [
+            {"status": "building"},
+            {"type": {"$in": [building_id for building_id, building in catalog.buildings.items() if building["production"]]}}
+        ]},
+        "crops": {},
+        "animals": {},
+    }
+    operations = []
+    for kind, query in sources.items():
+        async for doc in farm_store.scan(db, kind, query, timers.TIMER_FIELDS[kind]):
+            for due_at, event in _upcoming(kind, doc, now, STATE_EVENTS):
+                operations.append(_schedule_operation(doc["user_id"], kind, doc["id"], event, due_at))
+            if len(operations) >= SCHEDULER_BATCH_SIZE:
+                await db.due_events.bulk_write(operations, ordered=False)
+                operations = []
+    async for request in db.material_requests.find(
+        {"status": "active", "expires_at": {"$ne": None}}, fields("id", "user_id", "expires_at")
+    ):
+        operations.append(_schedule_operation(
+            request["user_id"], "material_requests", request["id"], "material_request.expired", request["expires_at"]
+        ))
+    if operations:
+        await db.due_events.bulk_write(operations, ordered=False)
+    await db.migrations.update_one(
+        {"_id": BACKFILL_MARKER}, {"$set": {"status": "done", "finished_at": datetime.utcnow()}}
+    )
@@ -0,0 +1,115 @@
+# Change versions for user-owned entities, used by GET /api/sync.
+#
+# Every write to buildings, crops, animals, territory or pests stamps the
+# document with the next value of a per-user counter. Deletions leave a
+# tombstone carrying the same kind of version so clients can drop the entity.
+# Tombstones expire after SYNC_TOMBSTONE_TTL seconds; a client whose cursor is
+# older than that should do a full resync (since=0). Changes that can't be
+# listed entity by entity (a new generated territory map) make cursors from
+# before them get a full sync.
+#
+# A version is allocated before the write carrying it lands, and concurrent
+# requests can land out of order, so a sync can see version 6 before version
+# 5 exists. Cursors therefore stop at the settled version: every version up
+# to it was allocated more than SYNC_WRITE_LAG seconds ago, so its write is
+# visible. Later versions are sent again by the next sync; clients apply
+# changes by id, so a repeat is harmless.
+
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from services.push import hub as push_hub
+from services.timers import EPOCH
+
+SYNC_KINDS = ("buildings", "crops", "animals", "territory", "pests")
+SYNC_TOMBSTONE_TTL = int(os.getenv("SYNC_TOMBSTONE_TTL", str(7 * 24 * 3600)))
+SYNC_WRITE_LAG = float(os.getenv("SYNC_WRITE_LAG", "30"))
+SYNC_RECENT_VERSIONS = int(os.getenv("SYNC_RECENT_VERSIONS", "64"))
+
+async def next_version(db, user_id):
+    """Allocate the next change version for this user"""
+    counter = await db.sync_counters.find_one_and_update(
+        {"_id": user_id},
+        {
+            "$inc": {"version": 1},
+            # When the latest versions were allocated, oldest first (see settled_version)
+            "$push": {"allocated_at": {"$each": [datetime.utcnow()], "$slice": -SYNC_RECENT_VERSIONS}}
+        },
+        projection={"version": True},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    # Any change can move the user's next timed transition
+    push_hub.touch(user_id)
+    return counter["version"]
+
+def settled_version(counter, now):
+    """Highest version whose write, and every earlier one's, has landed; None if unknown.
+
+    Versions allocated within the last SYNC_WRITE_LAG seconds may still be in
+    flight. If all of the recent allocations kept are that new, older ones
+    may be too.
+    """
+    allocated = counter.get("allocated_at", [])
+    cutoff = now - timedelta(seconds=SYNC_WRITE_LAG)
+    recent = next((index for index, at in enumerate(allocated) if at > cutoff), len(allocated))
+    if recent == 0 and len(allocated) >= SYNC_RECENT_VERSIONS:
+        return None
+    return counter["version"] - (len(allocated) - recent)
+
+async def current_version(db, user_id, now=None):
+    """(latest allocated version, settled version, version that cursors below need a full sync to catch up to)"""
+    counter = await db.sync_counters.find_one({"_id": user_id})
+    if not counter:
+        return 0, 0, 0
+    return counter["version"], settled_version(counter, now or datetime.utcnow()), counter.get("full_since", 0)
+
+async def require_full_sync(db, user_id, version):
+    """Send clients with a cursor before `version` a full sync: the change can't be expressed as a delta"""
+    await db.sync_counters.update_one({"_id": user_id}, {"$max": {"full_since": version}}, upsert=True)
+
+async def record_deletion(db, user_id, kind, entity_ids):
+    """Leave tombstones for deleted entities so delta sync can report them"""
+    if isinstance(entity_ids, str):
+        entity_ids = [entity_ids]
+    return await record_deletions(db, user_id, {kind: entity_ids})
+
+async def record_deletions(db, user_id, deleted, version=None):
+    """Tombstones for deletions of several kinds (kind -> entity ids), in one write.
+
+    Uses `version` if the caller already allocated one for these changes.
+    """
+    if not any(deleted.values()):
+        return None
+
+    version = version or await next_version(db, user_id)
+    now = datetime.utcnow()
+    await db.sync_tombstones.insert_many([
+        {
+            "user_id": user_id,
+            "kind": kind,
+            "entity_id": entity_id,
+            "version": version,
+            "deleted_at": now
+        }
+        for kind, entity_ids in deleted.items()
+        for entity_id in entity_ids
+    ])
+    return version
+
+def encode_cursor(version, at):
+    """Cursor = change version plus the sync time, so timed transitions can be windowed"""
+    millis = int((at - EPOCH).total_seconds() * 1000)
+    return f"{version}.{millis}"
+
+def decode_cursor(cursor):
+    """Return (version, datetime) or (0, None) for an empty/invalid cursor"""
+    if not cursor:
+        return 0, None
+    try:
+        version, millis = cursor.split(".", 1)
+        return int(version), EPOCH + timedelta(milliseconds=int(millis))
+    except ValueError:
+        return 0, None
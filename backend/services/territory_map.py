@@ -0,0 +1,222 @@
+# Procedural territory: each location's obstacles are derived from a per-user seed.
+#
+# Which cells hold grass, stones or trees is a pure function of
+# (territory_seed, location, cell). Clustered value noise sets the local
+# density and per-cell hashes roll presence and type. Cheap obstacles are the
+# common ones. Generated cells are never stored. The `territory` collection
+# only keeps the cells a player changed (cleared, or placed by older versions
+# of /generate), so storage and reads grow with player actions, not map size.
+#
+# Users without a seed have no generated territory, only what is stored.
+
+import os
+import random
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+from fastapi import HTTPException
+
+from services import farm_store, occupancy, user_state
+from services.projections import fields
+from services.sync import next_version, require_full_sync
+from utils.catalog import catalog
+
+# Locations with a generated map; elsewhere territory is only what is stored
+GENERATED_LOCATIONS = ("main",)
+
+TERRITORY_DENSITY = float(os.getenv("TERRITORY_DENSITY", "0.3"))
+NOISE_SCALE = 4  # cells between value-noise lattice points
+MAP_CACHE_SIZE = int(os.getenv("TERRITORY_MAP_CACHE_SIZE", "1024"))
+
+_MASK64 = (1 << 64) - 1
+_SALT_NOISE, _SALT_ROLL, _SALT_TYPE = 0x6E6F697365, 0x726F6C6C, 0x74797065
+
+# Obstacle types and cumulative weights (inverse of the energy it takes to clear)
+_TYPES = tuple(catalog.territory)
+_WEIGHTS = np.cumsum([1 / max(definition["clear_cost"].get("energy", 1), 1) for definition in catalog.territory.values()])
+
+def _mix(keys):
+    """splitmix64 finalizer over a uint64 array"""
+    z = keys + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _unit(base, salt, keys):
+    """Uniform [0, 1) per key, fixed by (base, salt)"""
+    hashed = _mix(np.uint64((base ^ salt * 0x9E3779B97F4A7C15) & _MASK64) ^ keys.astype(np.uint64))
+    return (hashed >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+def _value_noise(base, rows, cols):
+    """Smoothly interpolated lattice values in [0, 1] per cell"""
+    lattice_cols = occupancy.GRID_COLS // NOISE_SCALE + 2
+    y, x = rows / NOISE_SCALE, cols / NOISE_SCALE
+    y0, x0 = np.floor(y).astype(np.int64), np.floor(x).astype(np.int64)
+    ty, tx = y - y0, x - x0
+    ty, tx = ty * ty * (3 - 2 * ty), tx * tx * (3 - 2 * tx)
+
+    def corner(dy, dx):
+        return _unit(base, _SALT_NOISE, (y0 + dy) * lattice_cols + (x0 + dx))
+
+    top = corner(0, 0) * (1 - tx) + corner(0, 1) * tx
+    bottom = corner(1, 0) * (1 - tx) + corner(1, 1) * tx
+    return top * (1 - ty) + bottom * ty
+
+@lru_cache(maxsize=MAP_CACHE_SIZE)
+def generate(seed, location):
+    """Generated obstacles of one location: cell index -> territory type (read-only)"""
+    base = (seed * 0x9E3779B97F4A7C15 + zlib.crc32(location.encode("utf-8"))) & _MASK64
+    cells = np.arange(occupancy.GRID_CELLS)
+    rows, cols = np.divmod(cells, occupancy.GRID_COLS)
+
+    # Noise averages 0.5, so the map averages TERRITORY_DENSITY, denser in clusters
+    density = np.minimum(TERRITORY_DENSITY * 2 * _value_noise(base, rows, cols), 1.0)
+    present = _unit(base, _SALT_ROLL, cells) < density
+    types = np.searchsorted(_WEIGHTS, _unit(base, _SALT_TYPE, cells) * _WEIGHTS[-1], side="right")
+
+    return MappingProxyType({
+        int(index): _TYPES[min(int(types[index]), len(_TYPES) - 1)]
+        for index in np.flatnonzero(present)
+    })
+
+def cell_id(location, position):
+    """Stable id of a generated cell (stored diffs keep it)"""
+    return f"{location}:{position}"
+
+def _generated_doc(user_id, location, index, territory_type):
+    position = occupancy.position_of(index)
+    return {
+        "id": cell_id(location, position),
+        "user_id": user_id,
+        "location": location,
+        "type": territory_type,
+        "position": position,
+        "status": "active",
+        "clear_started_at": None,
+        "clear_time": catalog.territory[territory_type]["clear_time"]
+    }
+
+def _cell_order(position):
+    try:
+        return occupancy.cell_index(position)
+    except HTTPException:
+        return occupancy.GRID_CELLS  # off-grid leftovers go last
+
+def map_order(location, position):
+    """Sort key of a cell: location, then row-major"""
+    return location, _cell_order(position)
+
+async def user_seed(db, user_id):
+    return (await user_state.get_user_state(db, user_id)).get("territory_seed")
+
+async def load(db, user_id, projection=None, location=None, diffs=None):
+    """Territory as the player sees it: generated cells overlaid with stored diffs.
+
+    Sorted by location, then cell. Cleared cells are left out. `diffs` are the
+    stored territory documents, if the caller already loaded them.
+    """
+    seed = await user_seed(db, user_id)
+    if diffs is None:
+        diffs = await farm_store.find(db, "territory", user_id, {"location": location} if location else {}, projection)
+
+    by_cell = {}
+    if seed is not None:
+        for generated_location in GENERATED_LOCATIONS:
+            if location and generated_location != location:
+                continue
+            for index, territory_type in generate(seed, generated_location).items():
+                doc = _generated_doc(user_id, generated_location, index, territory_type)
+                by_cell[(generated_location, doc["position"])] = doc
+    for diff in diffs:
+        key = (diff["location"], diff["position"])
+        if diff["status"] == "cleared":
+            by_cell.pop(key, None)
+        else:
+            by_cell[key] = diff
+
+    return [by_cell[key] for key in sorted(by_cell, key=lambda key: map_order(*key))]
+
+async def find(db, user_id, location, position, projection=None):
+    """The territory element on one cell, or None"""
+    diff = await farm_store.find_one(db, "territory", user_id, {"location": location, "position": position}, projection)
+    if diff:
+        return None if diff["status"] == "cleared" else diff
+
+    seed = await user_seed(db, user_id)
+    if seed is None or location not in GENERATED_LOCATIONS:
+        return None
+    index = occupancy.cell_index(position)
+    territory_type = generate(seed, location).get(index)
+    return _generated_doc(user_id, location, index, territory_type) if territory_type else None
+
+# Only a cell that isn't cleared yet can be cleared (and paid for)
+NOT_CLEARED = {"status": {"$ne": "cleared"}}
+
+def cleared_fields(territory):
+    """(fields to set, fields to insert) storing a cell as cleared"""
+    return (
+        {"status": "cleared", "type": territory["type"]},
+        {"id": territory["id"], "clear_time": 0, "created_at": datetime.utcnow()}
+    )
+
+async def clear(db, user_id, territory, version):
+    """Store a cell as cleared (the generated map would bring it back otherwise).
+
+    Returns False if it was cleared already (by a concurrent request).
+    """
+    set_fields, insert_fields = cleared_fields(territory)
+    return await farm_store.upsert_cell(
+        db, "territory", user_id, territory["location"], territory["position"],
+        {**set_fields, "version": version}, insert_fields, query=NOT_CLEARED
+    )
+
+async def unclear(db, user_id, territory):
+    """Undo clear() when what it was for (e.g. paying for it) failed"""
+    await farm_store.update(db, "territory", user_id, territory["id"], {"status": territory["status"]}, query={"status": "cleared"})
+
+async def reseed(db, user_id):
+    """New random map for every generated location; stored diffs are dropped.
+
+    Cells already taken by buildings, crops or animals are stored as cleared,
+    so nothing ends up under an obstacle. Returns the new seed.
+    """
+    seed = random.getrandbits(62)
+    await user_state.update_user(db, user_id, {"$set": {"territory_seed": seed}})
+    await farm_store.delete_all(db, "territory", user_id)
+
+    taken = [
+        ("main", building["position"])
+        for building in await farm_store.find(db, "buildings", user_id, projection=fields("position"))
+    ]
+    for kind in ("crops", "animals"):
+        docs = await farm_store.find(
+            db, kind, user_id, {"location": {"$in": list(GENERATED_LOCATIONS)}}, fields("location", "position")
+        )
+        taken.extend((doc["location"], doc["position"]) for doc in docs)
+
+    version = await next_version(db, user_id)
+    cleared = []
+    for location, position in set(taken):
+        index = _cell_order(position)
+        territory_type = generate(seed, location).get(index)
+        if territory_type:
+            cleared.append({
+                "id": cell_id(location, position),
+                "user_id": user_id,
+                "location": location,
+                "type": territory_type,
+                "position": position,
+                "status": "cleared",
+                "clear_time": 0,
+                "created_at": datetime.utcnow(),
+                "version": version
+            })
+    await farm_store.insert_many(db, "territory", cleared)
+
+    await occupancy.reset(db, user_id)
+    # Generated cells aren't stored, so a delta can't say the whole map changed
+    await require_full_sync(db, user_id, version)
+    return seed
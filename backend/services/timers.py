@@ -0,0 +1,152 @@
+# Timer-state engine shared by crops, animals, buildings and territory.
+#
+# Every timed entity is the same shape: it starts at some moment, becomes done
+# after a duration (grown, adult, built, cleared), may expire some time after
+# that (withered) and may produce on a repeating cycle (animal production,
+# building income). evaluate() takes a batch of documents of one kind, turns
+# them into arrays and works out status phase, progress and the next
+# transition time for all of them in one NumPy pass against a single `now`.
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from services.projections import fields
+from utils.catalog import catalog
+
+# Stored datetimes are naive UTC
+EPOCH = datetime(1970, 1, 1)
+_EPOCH64 = np.datetime64(EPOCH, "us")
+
+BUILDING_COLLECT_INTERVAL = 60
+
+PENDING, DONE, EXPIRED, CYCLE_READY = 0, 1, 2, 3
+
+TimerState = namedtuple("TimerState", ["phase", "progress", "elapsed", "next_at"])
+
+# kind -> (done, expired, cycle ready) push event names
+TRANSITION_EVENTS = {
+    "crops": ("crop.ready", "crop.withered", None),
+    "animals": ("animal.adult", None, "animal.producing"),
+    "buildings": ("building.built", None, "building.ready"),
+    "territory": ("territory.cleared", None, None),
+}
+
+INF = float("inf")
+
+# kind -> everything timer_params and transitions read, plus what callers need
+# to act on the result (ids, owner, type)
+TIMER_FIELDS = {
+    "crops": fields("id", "user_id", "type", "planted_at", "protected"),
+    "animals": fields("id", "user_id", "type", "created_at", "last_collected"),
+    "buildings": fields("id", "user_id", "type", "status", "start_time", "build_time", "last_collect_time"),
+    "territory": fields("id", "user_id", "type", "status", "clear_started_at", "clear_time"),
+}
+
+def timer_params(kind, doc):
+    """(start, duration, expire, cycle_from, interval, settled) of one document.
+
+    `settled` means the stored status is already final, whatever the clock says.
+    Returns None for documents whose type is not in the catalog.
+    """
+    if kind == "crops":
+        crop_data = catalog.crops.get(doc["type"])
+        if not crop_data:
+            return None
+        expire = INF if doc["protected"] else crop_data["wither_time"]
+        return doc["planted_at"], crop_data["grow_time"], expire, None, INF, False
+
+    if kind == "animals":
+        animal_data = catalog.animals.get(doc["type"])
+        if not animal_data:
+            return None
+        interval = animal_data["production_interval"] or INF
+        return doc["created_at"], animal_data["adult_age"], INF, doc["last_collected"], interval, False
+
+    if kind == "buildings":
+        production = catalog.buildings.get(doc["type"], {}).get("production")
+        interval = BUILDING_COLLECT_INTERVAL if production else INF
+        return (
+            doc["start_time"], doc["build_time"], INF,
+            doc.get("last_collect_time"), interval, doc["status"] != "building"
+        )
+
+    if kind == "territory":
+        if not catalog.territory.get(doc["type"]):
+            return None
+        if doc["status"] == "clearing" and doc.get("clear_started_at"):
+            return doc["clear_started_at"], doc["clear_time"], INF, None, INF, False
+        # Not on a timer: keeps its stored status
+        return None, INF, INF, None, INF, doc["status"] == "cleared"
+
+    raise ValueError(f"Unknown timer kind: {kind}")
+
+def _seconds(values):
+    """Naive UTC datetimes (None allowed) -> seconds since EPOCH, NaN for None"""
+    return (np.array(values, dtype="datetime64[us]") - _EPOCH64) / np.timedelta64(1, "s")
+
+def _to_datetime(seconds):
+    return EPOCH + timedelta(seconds=float(seconds)) if np.isfinite(seconds) else None
+
+def evaluate(kind, docs, now):
+    """TimerState per document (None where timer_params is None), all as of `now`"""
+    params = [timer_params(kind, doc) for doc in docs]
+    valid = [p for p in params if p is not None]
+    if not valid:
+        return [None] * len(docs)
+
+    start_at, duration, expire, cycle_from, interval, settled = zip(*valid)
+    start = _seconds(start_at)
+    cycle_base = _seconds(cycle_from)
+    duration = np.array(duration, dtype=float)
+    expire = np.array(expire, dtype=float)
+    interval = np.array(interval, dtype=float)
+    settled = np.array(settled, dtype=bool)
+    now_s = (now - EPOCH).total_seconds()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        elapsed = now_s - start
+        ready_at = start + duration
+        done = settled | (elapsed >= duration)
+        expire_at = ready_at + expire
+        expired = done & (now_s >= expire_at)
+        cycle_at = np.where(np.isnan(cycle_base), ready_at, cycle_base) + interval
+        cycle_ready = done & ~expired & (now_s >= cycle_at)
+
+        phase = np.select([expired, cycle_ready, done], [EXPIRED, CYCLE_READY, DONE], PENDING)
+        progress = np.where(done, 100.0, np.nan_to_num(np.clip(elapsed / duration * 100, 0, 100)))
+        next_at = np.where(
+            ~done,
+            ready_at,
+            np.where(expired | cycle_ready, INF, np.fmin(expire_at, cycle_at))
+        )
+
+    states = iter(
+        TimerState(int(p), float(pr), float(e), _to_datetime(n))
+        for p, pr, e, n in zip(phase, progress, np.nan_to_num(elapsed), next_at)
+    )
+    return [next(states) if p is not None else None for p in params]
+
+def evaluate_one(kind, doc, now):
+    return evaluate(kind, [doc], now)[0]
+
+def transitions(kind, doc):
+    """All (due_at, event_type) transitions of one entity, past and future"""
+    params = timer_params(kind, doc)
+    if params is None:
+        return []
+    start_at, duration, expire, cycle_from, interval, settled = params
+    if start_at is None:
+        return []
+
+    done_event, expired_event, cycle_event = TRANSITION_EVENTS[kind]
+    ready_at = start_at + timedelta(seconds=duration)
+    result = []
+    if not settled:
+        result.append((ready_at, done_event))
+    if expired_event and expire != INF:
+        result.append((ready_at + timedelta(seconds=expire), expired_event))
+    if cycle_event and interval != INF:
+        result.append(((cycle_from or ready_at) + timedelta(seconds=interval), cycle_event))
+    return result
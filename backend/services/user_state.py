@@ -0,0 +1,63 @@
+# Per-worker cache of user state (resources, level, experience, energy).
+#
+# Every write to a user document $incs its `state_version` and hands the
+# post-image to remember(), so this worker's cache is written through and a
+# read right after a mutation costs nothing. Entries only ever move forward in
+# version; the TTL bounds how stale a user changed by another worker can be.
+
+import copy
+import os
+
+import bson
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+
+from utils.cache import TTLCache
+
+# Fields routes never need back from the users collection
+USER_PROJECTION = {"_id": False, "password_hash": False}
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "5000"))
+
+_cache = TTLCache("users", USER_CACHE_SIZE, USER_CACHE_TTL, sizeof=lambda user: len(bson.encode(user)))
+
+def remember(user):
+    """Write a fresh user post-image through to the cache"""
+    cached = _cache.peek(user["id"])
+    if cached is not None and cached.get("state_version", 0) > user.get("state_version", 0):
+        return
+    _cache.set(user["id"], copy.deepcopy(user))
+
+def forget(user_id):
+    _cache.pop(user_id)
+
+async def get_user_state(db, user_id):
+    """User document without password hash; the caller gets its own copy"""
+    user = _cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, USER_PROJECTION)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        remember(user)
+    return copy.deepcopy(user)
+
+async def update_user(db, user_id, update, query=None):
+    """Apply `update` to the user, bump its state version and cache the result.
+
+    Returns the updated user, or None if nothing matched.
+    """
+    update = dict(update)
+    update["$inc"] = {**update.get("$inc", {}), "state_version": 1}
+    user = await db.users.find_one_and_update(
+        {"id": user_id, **(query or {})},
+        update,
+        projection=USER_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if user:
+        remember(user)
+    return user
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from services.indexes import ensure_indexes
+
+# Tests that touch the database run against a real MongoDB server, e.g.
+# TEST_MONGO_URL=mongodb://localhost:27017; they are skipped without one.
+TEST_MONGO_URL = os.getenv("TEST_MONGO_URL")
+
+@pytest.fixture
+def mongo():
+    """Runs `scenario(db)` on a fresh database with the app's indexes, dropped afterwards"""
+    if not TEST_MONGO_URL:
+        pytest.skip("TEST_MONGO_URL is not set")
+
+    def run(scenario):
+        async def main():
+            client = AsyncIOMotorClient(TEST_MONGO_URL)
+            db = client[f"test_{uuid.uuid4().hex[:12]}"]
+            try:
+                await ensure_indexes(db)
+                return await scenario(db)
+            finally:
+                await client.drop_database(db.name)
+                client.close()
+
+        return asyncio.run(main())
+
+    return run
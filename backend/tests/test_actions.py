@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from models.action import ActionCommand
+from models.crop import Crop
+from models.user import User
+from routes.actions import ActionBatch
+from routes.crops import HARVEST_COST
+from services import farm_store, occupancy
+from utils.catalog import catalog
+
+WHEAT = catalog.crops["wheat"]
+WOOD_PACK = catalog.market["wood_pack"]
+
+async def _user(db):
+    user = User(username="farmer", email="farmer@example.com", password_hash="-")
+    await db.users.insert_one(user.model_dump())
+    return user.id
+
+async def _resources(db, user_id):
+    return (await db.users.find_one({"id": user_id}))["resources"]
+
+async def _ready_crop(db, user_id, position):
+    crop = Crop(
+        user_id=user_id, type="wheat", position=position, status="growing",
+        planted_at=datetime.utcnow() - timedelta(seconds=WHEAT["grow_time"] + 1)
+    ).model_dump()
+    await occupancy.occupy(db, user_id, "main", position)
+    await farm_store.insert(db, "crops", crop)
+    return crop
+
+async def _batch(db, user_id, commands):
+    batch = ActionBatch(db, user_id)
+    await batch.load(kinds={"crops"})
+    results = [await batch.run(ActionCommand(**command)) for command in commands]
+    return batch, results
+
+def _free(grid, position):
+    return grid.is_free(occupancy.cell_index(position))
+
+def test_harvest_then_replant_the_same_cell(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        before = await _resources(db, user_id)
+        crop = await _ready_crop(db, user_id, "1-1")
+
+        batch, results = await _batch(db, user_id, [
+            {"action": "harvest", "id": crop["id"]},
+            {"action": "plant", "type": "wheat", "position": "1-1"},
+        ])
+        await batch.commit()
+
+        assert [result["success"] for result in results] == [True, True]
+        crops = await farm_store.find(db, "crops", user_id)
+        assert [(doc["id"], doc["position"]) for doc in crops] == [(results[1]["crop"]["id"], "1-1")]
+        assert not _free(await occupancy.load(db, user_id), "1-1")
+        after = await _resources(db, user_id)
+        assert after["energy"] == before["energy"] - HARVEST_COST["energy"]
+        assert after["gold"] == before["gold"] + WHEAT["yield"]["gold"] - WHEAT["cost"]["gold"]
+        assert after["food"] == before["food"] + WHEAT["yield"]["food"]
+
+    mongo(scenario)
+
+def test_harvest_lost_to_another_request_is_not_paid(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        before = await _resources(db, user_id)
+        crop = await _ready_crop(db, user_id, "1-1")
+
+        # Both batches load the ready crop; the other one commits first
+        slow, slow_results = await _batch(db, user_id, [
+            {"action": "harvest", "id": crop["id"]},
+            {"action": "purchase", "itemId": "wood_pack"},
+        ])
+        fast, fast_results = await _batch(db, user_id, [{"action": "harvest", "id": crop["id"]}])
+        await fast.commit()
+        await slow.commit()
+
+        assert fast_results[0]["success"]
+        assert slow_results[0] == {"action": "harvest", "success": False, "status": 404, "detail": "Crop not found"}
+        assert slow_results[1]["success"]
+        after = await _resources(db, user_id)
+        # One harvest, one purchase
+        assert after["energy"] == before["energy"] - HARVEST_COST["energy"]
+        assert after["food"] == before["food"] + WHEAT["yield"]["food"]
+        assert after["gold"] == before["gold"] + WHEAT["yield"]["gold"] - WOOD_PACK["cost"]["gold"]
+        assert after["wood"] == before["wood"] + WOOD_PACK["rewards"]["wood"]
+
+    mongo(scenario)
+
+def test_ledger_failure_undoes_entity_writes_and_cells(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        crop = await _ready_crop(db, user_id, "1-1")
+
+        batch, results = await _batch(db, user_id, [
+            {"action": "harvest", "id": crop["id"]},
+            {"action": "plant", "type": "wheat", "position": "2-2"},
+        ])
+        assert [result["success"] for result in results] == [True, True]
+        # Energy spent elsewhere after the batch loaded: the ledger update fails
+        await db.users.update_one(
+            {"id": user_id}, {"$set": {"resources.energy": 0, "last_energy_update": datetime.utcnow()}}
+        )
+        before = await _resources(db, user_id)
+        crops = await farm_store.find(db, "crops", user_id)
+        with pytest.raises(HTTPException) as error:
+            await batch.commit()
+
+        assert error.value.status_code == 400
+        assert await farm_store.find(db, "crops", user_id) == crops
+        grid = await occupancy.load(db, user_id)
+        assert not _free(grid, "1-1") and _free(grid, "2-2")
+        assert await _resources(db, user_id) == before
+        assert await db.sync_tombstones.count_documents({"user_id": user_id}) == 0
+
+    mongo(scenario)
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from models.user import User
+from services import occupancy
+
+async def _user(db):
+    user = User(username="farmer", email="farmer@example.com", password_hash="-")
+    await db.users.insert_one(user.model_dump())
+    return user.id
+
+def _taken(grid):
+    return sorted(occupancy.position_of(index) for index in range(occupancy.GRID_CELLS) if not grid.is_free(index))
+
+def test_taken_cell_rejects_a_second_occupant(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        await occupancy.occupy(db, user_id, "main", "0-0", "15-15")
+        with pytest.raises(HTTPException) as error:
+            await occupancy.occupy(db, user_id, "main", "1-1", "15-15")
+        assert error.value.status_code == 400
+        # all or nothing: 1-1 wasn't taken either
+        assert _taken(await occupancy.load(db, user_id)) == ["0-0", "15-15"]
+
+    mongo(scenario)
+
+def test_concurrent_takes_of_one_cell_let_exactly_one_through(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        await occupancy.load(db, user_id)
+        results = await asyncio.gather(
+            *(occupancy.occupy(db, user_id, "main", "7-7") for _ in range(8)), return_exceptions=True
+        )
+        assert sum(result is None for result in results) == 1
+        assert all(result.status_code == 400 for result in results if result is not None)
+
+    mongo(scenario)
+
+def test_change_frees_before_taking(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        await occupancy.occupy(db, user_id, "main", "3-3")
+        await occupancy.change(db, user_id, "main", take=["3-3", "3-4"], release=["3-3"])
+        assert _taken(await occupancy.load(db, user_id)) == ["3-3", "3-4"]
+        await occupancy.release(db, user_id, "main", "3-3", "3-4")
+        assert _taken(await occupancy.load(db, user_id)) == []
+
+    mongo(scenario)
+
+def test_grid_stored_as_bytes_is_converted(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        bits = 1 | 1 << (occupancy.GRID_CELLS - 1)
+        await db.occupancy.insert_one({
+            "_id": f"{user_id}:main",
+            "user_id": user_id,
+            "location": "main",
+            "cells": bits.to_bytes((occupancy.GRID_CELLS + 7) // 8, "little"),
+            "rev": 3
+        })
+        with pytest.raises(HTTPException):
+            await occupancy.occupy(db, user_id, "main", "15-15")
+        await occupancy.occupy(db, user_id, "main", "15-14")
+        assert _taken(await occupancy.load(db, user_id)) == ["0-0", "15-14", "15-15"]
+
+    mongo(scenario)
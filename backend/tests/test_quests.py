@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from models.building import Building
+from models.user import User
+from routes.quests import fetch_quests
+from services import farm_store
+
+async def _user(db):
+    user = User(username="farmer", email="farmer@example.com", password_hash="-")
+    await db.users.insert_one(user.model_dump())
+    return user.id
+
+async def _saloon(db, user_id, started_ago):
+    building = Building(
+        user_id=user_id, type="saloon", position="2-2", build_time=180,
+        start_time=datetime.utcnow() - timedelta(seconds=started_ago)
+    )
+    await farm_store.insert(db, "buildings", building.model_dump())
+
+def _completed(quests):
+    return {quest.id for quest in quests if quest.completed}
+
+def test_building_quest_completes_without_the_scheduler(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        await _saloon(db, user_id, started_ago=60)
+        assert "quest1" not in _completed(await fetch_quests(db, user_id))
+        # Construction ends; nothing marks it but the read
+        await farm_store.update_many(db, "buildings", [
+            (building, {"start_time": datetime.utcnow() - timedelta(seconds=200)})
+            for building in await farm_store.find(db, "buildings", user_id)
+        ])
+        assert "quest1" in _completed(await fetch_quests(db, user_id))
+
+    mongo(scenario)
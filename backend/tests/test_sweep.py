@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from routes.farm import _ready
+from services import timers
+from utils.catalog import catalog
+
+def _crop(crop_id, age, protected=False):
+    return {
+        "id": crop_id,
+        "user_id": "user",
+        "type": "wheat",
+        "position": "1-1",
+        "location": "main",
+        "planted_at": NOW - timedelta(seconds=age),
+        "protected": protected,
+    }
+
+NOW = datetime(2026, 1, 1)
+WHEAT = catalog.crops["wheat"]
+
+def test_ready_crops_closest_to_withering_first():
+    crops = [
+        _crop("protected", WHEAT["grow_time"] + WHEAT["wither_time"] - 5, protected=True),
+        _crop("fresh", WHEAT["grow_time"] + 1),
+        _crop("at_risk", WHEAT["grow_time"] + WHEAT["wither_time"] - 10),
+        _crop("growing", WHEAT["grow_time"] - 1),
+    ]
+    ready = _ready("crops", crops, NOW, timers.DONE)
+    assert [crop["id"] for crop in ready] == ["at_risk", "fresh", "protected"]
+
+def test_limited_energy_harvests_the_crop_at_risk():
+    # With energy for one harvest the sweep takes the first ready crop only
+    crops = [
+        _crop("protected", WHEAT["grow_time"] + 1, protected=True),
+        _crop("at_risk", WHEAT["grow_time"] + WHEAT["wither_time"] - 10),
+    ]
+    ready = _ready("crops", crops, NOW, timers.DONE)
+    assert ready[0]["id"] == "at_risk"
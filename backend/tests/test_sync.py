@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import orjson
+
+from models.crop import Crop
+from models.user import User
+from routes.sync import get_sync
+from services import farm_store, sync
+
+async def _user(db):
+    user = User(username="farmer", email="farmer@example.com", password_hash="-")
+    await db.users.insert_one(user.model_dump())
+    return user.id
+
+async def _sync(db, user_id, since=None):
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(db=db)))
+    return orjson.loads((await get_sync(request, since=since, user_id=user_id)).body)
+
+async def _plant(db, user_id, position, version):
+    crop = Crop(user_id=user_id, type="wheat", position=position, status="growing", version=version).model_dump()
+    await farm_store.insert(db, "crops", crop)
+    return crop["id"]
+
+def test_write_landing_after_a_later_one_is_still_synced(mongo):
+    async def scenario(db):
+        user_id = await _user(db)
+        cursor = (await _sync(db, user_id))["cursor"]
+        # Two requests allocate versions; the later one writes first
+        first = await sync.next_version(db, user_id)
+        second = await sync.next_version(db, user_id)
+        late = await _plant(db, user_id, "1-2", second)
+        between = await _sync(db, user_id, cursor)
+        assert [crop["id"] for crop in between["changed"]["crops"]] == [late]
+        early = await _plant(db, user_id, "1-1", first)
+        after = await _sync(db, user_id, between["cursor"])
+        assert {crop["id"] for crop in after["changed"]["crops"]} == {early, late}
+
+    mongo(scenario)
+
+def test_cursor_moves_past_versions_once_settled(mongo, monkeypatch):
+    monkeypatch.setattr(sync, "SYNC_WRITE_LAG", 0)
+
+    async def scenario(db):
+        user_id = await _user(db)
+        await _plant(db, user_id, "1-1", await sync.next_version(db, user_id))
+        first = await _sync(db, user_id)
+        assert first["cursor"].startswith("1.")
+        again = await _sync(db, user_id, first["cursor"])
+        assert again["changed"]["crops"] == []
+
+    mongo(scenario)
@@ -1,9 +1,14 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 import bcrypt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from utils.cache import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
 import os
+import time
 
 security = HTTPBearer()
 
@@ -11,42 +16,168 @@ JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRATION_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "72"))
 
-def hash_password(password: str) -> str:
+# bcrypt runs in its own small thread pool (it releases the GIL) so a login
+# burst doesn't block the event loop; the cap bounds CPU spent on hashing.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", "2"))
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_stats = {"in_flight": 0, "peak_queued": 0, "completed": 0, "wait_seconds": 0.0}
+
+# Verified token payloads, so polling clients don't re-verify the signature
+# on every request. Entries never outlive the token's own exp.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "900"))
+
+_token_cache = TTLCache("tokens", TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+# Revocations live in `token_revocations`, so a logout holds on every worker
+# and across restarts; a TTL index drops them once the tokens they cover have
+# expired anyway:
+#   {_id: "token:<sha256>", expires_at}               one logged-out token
+#   {_id: "user:<user_id>", revoked_at, expires_at}   every token issued before revoked_at
+# Each worker caches the outcome of a token's check: "revoked" until the token
+# expires, "not revoked" for REVOCATION_CHECK_TTL seconds, which bounds how
+# long a logout on another worker takes to apply here.
+REVOCATION_CHECK_TTL = float(os.getenv("REVOCATION_CHECK_TTL", "10"))
+
+_revocation_checks = TTLCache("token_revocations", TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def _hash_password_sync(password: str) -> str:
     # Обрезаем пароль до 72 байт для bcrypt
     password_bytes = password.encode('utf-8')[:72]
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def _verify_password_sync(plain_password: str, hashed_password: str) -> bool:
     password_bytes = plain_password.encode('utf-8')[:72]
     hashed_bytes = hashed_password.encode('utf-8')
     return bcrypt.checkpw(password_bytes, hashed_bytes)
 
+async def _run_bcrypt(func, *args):
+    stats = _bcrypt_stats
+    stats["in_flight"] += 1
+    stats["peak_queued"] = max(stats["peak_queued"], stats["in_flight"] - BCRYPT_MAX_WORKERS)
+    submitted = time.monotonic()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, func, *args)
+    finally:
+        stats["in_flight"] -= 1
+        stats["completed"] += 1
+        stats["wait_seconds"] += time.monotonic() - submitted
+
+async def hash_password(password: str) -> str:
+    return await _run_bcrypt(_hash_password_sync, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_bcrypt(_verify_password_sync, plain_password, hashed_password)
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True if the hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def bcrypt_stats() -> dict:
+    stats = _bcrypt_stats
+    return {
+        "max_workers": BCRYPT_MAX_WORKERS,
+        "rounds": BCRYPT_ROUNDS,
+        "in_flight": stats["in_flight"],
+        "queued": max(stats["in_flight"] - BCRYPT_MAX_WORKERS, 0),
+        "peak_queued": stats["peak_queued"],
+        "completed": stats["completed"],
+        "avg_seconds": round(stats["wait_seconds"] / stats["completed"], 4) if stats["completed"] else None
+    }
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
-    to_encode.update({"exp": expire})
+    # Fractional iat, so a revoke_user doesn't also reject tokens issued later in the same second
+    to_encode.update({"exp": expire, "iat": time.time()})
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _credentials_error():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+    )
+
+def _remaining(payload):
+    return payload["exp"] - time.time() if "exp" in payload else None
+
 def decode_token(token: str) -> dict:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
+    """Verified payload of a token (signature and expiry only, see authenticate)"""
+    key = _token_key(token)
+    payload = _token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except JWTError:
+            raise _credentials_error()
+        _token_cache.set(key, payload, _remaining(payload))
+    return payload
+
+async def _is_revoked(db, key, payload):
+    revoked = _revocation_checks.get(key)
+    if revoked is None:
+        user_revocation = f"user:{payload.get('sub')}"
+        revocations = await db.token_revocations.find(
+            {"_id": {"$in": [f"token:{key}", user_revocation]}}, {"revoked_at": True}
+        ).to_list(length=None)
+        revoked = any(
+            revocation["_id"] != user_revocation or payload.get("iat", 0) < revocation["revoked_at"]
+            for revocation in revocations
         )
+        _revocation_checks.set(key, revoked, _remaining(payload) if revoked else REVOCATION_CHECK_TTL)
+    return revoked
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    token = credentials.credentials
+async def authenticate(db, token: str) -> dict:
+    """Payload of a valid token that hasn't been revoked (401 otherwise)"""
     payload = decode_token(token)
+    if await _is_revoked(db, _token_key(token), payload):
+        raise _credentials_error()
+    return payload
+
+def _expires_at(seconds):
+    return datetime.utcnow() + timedelta(seconds=max(seconds, 0))
+
+async def revoke_token(db, token: str):
+    """Log a single token out, on every worker"""
+    key = _token_key(token)
+    payload = decode_token(token)
+    remaining = _remaining(payload)
+    await db.token_revocations.update_one(
+        {"_id": f"token:{key}"},
+        {"$set": {"expires_at": _expires_at(remaining if remaining is not None else JWT_EXPIRATION_HOURS * 3600)}},
+        upsert=True
+    )
+    _revocation_checks.set(key, True, remaining)
+
+async def revoke_user(db, user_id: str):
+    """Reject every token issued to this user so far (logout everywhere)"""
+    await db.token_revocations.update_one(
+        {"_id": f"user:{user_id}"},
+        {"$set": {
+            "revoked_at": time.time(),
+            # Every token it covers has expired by then
+            "expires_at": _expires_at(JWT_EXPIRATION_HOURS * 3600)
+        }},
+        upsert=True
+    )
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> str:
+    payload = await authenticate(request.app.state.db, credentials.credentials)
     user_id = payload.get("sub")
     if user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-        )
-    return user_id
\ No newline at end of file
+        raise _credentials_error()
+    return user_id
@@ -0,0 +1,86 @@
+# Small in-process caches shared by the services.
+#
+# Each worker process has its own copy, so entries must be safe to serve
+# slightly stale (bounded by their TTL) or be invalidated explicitly on write.
+
+import time
+from collections import OrderedDict
+
+# name -> cache, for metrics reporting
+CACHES = {}
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, name, maxsize, ttl, sizeof=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Optional value -> approximate bytes, for memory reporting
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries = OrderedDict()
+        CACHES[name] = self
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and self.sizeof:
+            self.bytes -= entry[2]
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry[:2]
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._discard(key)
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Store `value`; `ttl` overrides the cache default for this entry"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._discard(key)
+        if ttl <= 0:
+            return
+        size = self.sizeof(value) if self.sizeof else 0
+        self._entries[key] = (value, time.monotonic() + ttl, size)
+        self.bytes += size
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+
+    def peek(self, key):
+        """Current value without touching LRU order or hit counters"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def pop(self, key):
+        entry = self._discard(key)
+        return entry[0] if entry else None
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+        if self.sizeof:
+            stats["bytes"] = self.bytes
+        return stats
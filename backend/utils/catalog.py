@@ -0,0 +1,142 @@
+# Game catalog: every static definition in one immutable, pre-indexed object.
+#
+# Built once at import from game_data.py and utils/game_data.py. Sections are
+# read-only dicts keyed by id; lists become tuples. The serialized bodies of
+# GET /api/catalog and GET /api/catalog/names are built and compressed once
+# too (see utils.compression.StaticPayload).
+
+import copy
+import json
+from collections import defaultdict
+
+import game_data
+from utils import game_data as town_data
+from utils.compression import StaticPayload
+
+# Fields that take resources from the player / give resources to the player
+COST_FIELDS = ("cost", "clear_cost", "chase_cost", "feed_cost")
+YIELD_FIELDS = ("yield", "production_yield", "production", "rewards")
+
+class FrozenDict(dict):
+    """dict that refuses mutation, so a route can't change a shared definition.
+
+    Still a dict, so pydantic, jsonable_encoder and bson take it as is; copies
+    (copy/deepcopy) are plain mutable dicts.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("catalog definitions are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(item, memo) for key, item in self.items()}
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def freeze(value):
+    """Deep read-only copy: dicts -> FrozenDict, lists -> tuple"""
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def unlock_level(definition):
+    """Level at which a definition becomes available (buildings call it `level`)"""
+    return definition.get("level_required", definition.get("level", 1))
+
+class Catalog:
+    """Read-only game definitions with id, level and resource indexes"""
+
+    def __init__(self, sources):
+        # section -> definition source as shipped to clients (dict by id or list)
+        self.sections = freeze(sources)
+
+        by_id = {}
+        for section, definitions in self.sections.items():
+            if section == "levels":
+                continue
+            if isinstance(definitions, tuple):
+                definitions = {definition["id"]: definition for definition in definitions}
+            by_id[section] = FrozenDict(definitions)
+        # section -> id -> definition
+        self.by_id = FrozenDict(by_id)
+
+        by_level = defaultdict(lambda: defaultdict(list))
+        costs = defaultdict(lambda: defaultdict(list))
+        yields = defaultdict(lambda: defaultdict(list))
+        for section, definitions in by_id.items():
+            for definition_id, definition in definitions.items():
+                by_level[unlock_level(definition)][section].append(definition_id)
+                for field in COST_FIELDS:
+                    for resource in definition.get(field, ()):
+                        costs[resource][section].append(definition_id)
+                for field in YIELD_FIELDS:
+                    for resource in definition.get(field, ()):
+                        yields[resource][section].append(definition_id)
+        # level -> section -> ids unlocked at exactly that level
+        self.by_level = freeze({level: by_level[level] for level in sorted(by_level)})
+        # resource -> section -> ids that cost / yield that resource
+        self.by_resource = freeze({
+            resource: {"costs": costs.get(resource, {}), "yields": yields.get(resource, {})}
+            for resource in sorted(set(costs) | set(yields))
+        })
+
+        # collection item -> ids of the collections that need it
+        collections_by_item = defaultdict(list)
+        for collection_id, collection in by_id.get("collections", {}).items():
+            for item_id in collection["items_needed"]:
+                collections_by_item[item_id].append(collection_id)
+        self.collections_by_item = freeze(dict(collections_by_item))
+
+        # section -> id -> display name
+        self.names = freeze({
+            section: {definition_id: definition["name"] for definition_id, definition in definitions.items() if "name" in definition}
+            for section, definitions in by_id.items()
+        })
+
+        self.payload = StaticPayload(_dumps(self.sections))
+        self.names_payload = StaticPayload(_dumps(self.names))
+
+    def __getattr__(self, section):
+        try:
+            return self.__dict__["by_id"][section]
+        except KeyError:
+            raise AttributeError(section) from None
+
+    @property
+    def levels(self):
+        return self.sections["levels"]
+
+    def unlocked_until(self, level):
+        """section -> ids of everything available at `level`"""
+        unlocked = defaultdict(list)
+        for unlock, sections in self.by_level.items():
+            if unlock > level:
+                break
+            for section, ids in sections.items():
+                unlocked[section].extend(ids)
+        return dict(unlocked)
+
+catalog = Catalog({
+    "crops": game_data.CROPS_DATA,
+    "animals": game_data.ANIMALS_DATA,
+    "territory": game_data.TERRITORY_DATA,
+    "pests": game_data.PESTS_DATA,
+    "collections": game_data.COLLECTIONS_DATA,
+    "special_buildings": game_data.SPECIAL_BUILDINGS_DATA,
+    "totems": game_data.TOTEMS_DATA,
+    "levels": game_data.LEVELS_DATA,
+    "buildings": town_data.BUILDINGS_DATA,
+    "quests": town_data.QUESTS_DATA,
+    "market": town_data.MARKET_ITEMS,
+})
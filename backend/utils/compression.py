@@ -0,0 +1,188 @@
+# Response compression: brotli or gzip, negotiated from Accept-Encoding.
+#
+# CompressionMiddleware compresses dynamic responses at or above
+# COMPRESSION_MIN_SIZE bytes, at a tunable level (cheap levels by default,
+# since this runs on every request). Streamed responses are compressed chunk
+# by chunk with a flush after each, so NDJSON lines still arrive as they are
+# produced.
+#
+# Payloads that never change (the catalog, localized names) are wrapped in a
+# StaticPayload instead: it compresses every encoding once, at the highest
+# level, when the process starts, and serves the right variant with its own
+# ETag. Responses that already carry a Content-Encoding are left alone.
+
+import gzip
+import hashlib
+import os
+import zlib
+
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/msgpack", "text/")
+
+def supported_encodings():
+    """Encodings this process can produce, preferred first"""
+    return ("br", "gzip") if brotli else ("gzip",)
+
+def negotiate(accept_encoding):
+    """Best of our encodings the client accepts (q > 0), or None for identity"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+
+    candidates = [
+        (accepted.get(encoding, accepted.get("*", 0.0)), -rank, encoding)
+        for rank, encoding in enumerate(supported_encodings())
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+def compress(body, encoding, level=None):
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY if level is None else level)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL if level is None else level, mtime=0)
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+            self.process = lambda data: self._compressor.process(data) + self._compressor.flush()
+            self.finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self.process = lambda data: self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = self._compressor.flush
+
+def _header(headers, name):
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+def _with_vary(headers):
+    vary = [value for key, value in headers if key == b"vary"]
+    if any(part.strip().lower() == b"accept-encoding" for value in vary for part in value.split(b",")):
+        return headers
+    return headers + [(b"vary", b"Accept-Encoding")]
+
+class CompressionMiddleware:
+    """Compresses compressible responses of at least `minimum_size` bytes (plain ASGI)"""
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate((_header(scope["headers"], b"accept-encoding") or b"").decode("latin-1"))
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            if start is not None:
+                headers = _with_vary(list(start.get("headers", [])))
+                content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                if (
+                    encoding is None
+                    or start["status"] in (204, 304)
+                    or _header(headers, b"content-encoding") is not None
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send({**start, "headers": headers})
+                    start = None
+                    return await send(message)
+
+                headers = [(key, value) for key, value in headers if key != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                if more_body:
+                    compressor = _StreamCompressor(encoding)
+                    body = compressor.process(body)
+                else:
+                    body = compress(body, encoding)
+                    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                await send({**start, "headers": headers})
+                start = None
+                return await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+            # Later chunks of a streamed response
+            more_body = message.get("more_body", False)
+            body = compressor.process(message.get("body", b""))
+            if not more_body:
+                body += compressor.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+class StaticPayload:
+    """Immutable body compressed once in every supported encoding, with strong per-encoding ETags"""
+
+    def __init__(self, body, media_type="application/json", cache_control="public, no-cache"):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.content_hash = hashlib.sha256(body).hexdigest()
+        self.variants = {None: body}
+        self.etags = {None: f'"{self.content_hash}"'}
+        for encoding in supported_encodings():
+            self.variants[encoding] = compress(body, encoding, level=11 if encoding == "br" else 9)
+            self.etags[encoding] = f'"{self.content_hash}-{encoding}"'
+
+    @property
+    def body(self):
+        return self.variants[None]
+
+    def _etag_matches(self, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        return any(tag.strip() in self.etags.values() for tag in if_none_match.split(","))
+
+    def response(self, request):
+        """The variant the request accepts, or 304 if the client already has this content"""
+        encoding = negotiate(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": self.etags[encoding],
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding"
+        }
+        # Each encoding is its own representation, but any of them proves the client is current
+        if self._etag_matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
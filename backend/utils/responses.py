@@ -0,0 +1,88 @@
+# JSON (orjson) and MessagePack response rendering.
+#
+# GameResponse is the app's default response class. It renders with orjson,
+# which encodes dicts, lists, tuples, datetimes and numpy scalars natively,
+# so serializers can hand over datetimes as they come from Mongo. A client
+# that sends `Accept: application/msgpack` gets the same content as
+# MessagePack (datetimes as ISO strings, like in JSON).
+#
+# Hot GET endpoints return GameResponse(content) themselves; FastAPI passes a
+# returned Response through untouched, which skips response_model validation
+# and jsonable_encoder for data the serializers already shaped.
+
+from contextvars import ContextVar
+from datetime import date, datetime
+
+import msgpack
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+_wants_msgpack = ContextVar("wants_msgpack", default=False)
+
+def _default(value):
+    """Types neither encoder handles natively"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def dumps_json(content):
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+def dumps_msgpack(content):
+    return msgpack.packb(content, default=_default, datetime=False)
+
+def wants_msgpack(accept):
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+class GameResponse(JSONResponse):
+    """orjson-encoded JSON, or MessagePack for requests that accept it"""
+
+    def render(self, content):
+        if _wants_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return dumps_msgpack(content)
+        return dumps_json(content)
+
+class NegotiationMiddleware:
+    """Notes the request's Accept header for GameResponse (plain ASGI, no buffering)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept":
+                accept = value.decode("latin-1").lower()
+                break
+        token = _wants_msgpack.set(wants_msgpack(accept))
+
+        async def send_with_vary(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                vary = [value for name, value in headers if name == b"vary"]
+                if not any(b"accept" == part.strip().lower() for value in vary for part in value.split(b",")):
+                    headers.append((b"vary", b"Accept"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_vary)
+        finally:
+            _wants_msgpack.reset(token)
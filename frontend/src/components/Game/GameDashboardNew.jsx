@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { Button } from '../ui/button';
 import { LogOut } from 'lucide-react';
 import TopHUD from './TopHUD';
@@ -13,7 +13,19 @@ import CropModal from './CropModal';
 import AnimalModal from './AnimalModal';
 import { LEVELS } from '../../mockData';
 import { toast } from '../../hooks/use-toast';
-import { player, buildings as buildingsApi, quests as questsApi, market as marketApi, crops as cropsApi, animals as animalsApi } from '../../services/api';
+import { buildings as buildingsApi, quests as questsApi, market as marketApi, crops as cropsApi, animals as animalsApi, farm as farmApi, sync as syncApi, push as pushApi, placement as placementApi } from '../../services/api';
+
+// Apply a delta from /api/sync to a list of entities
+const applyDelta = (items, changed = [], deleted = [], full = false) => {
+  if (full) return changed;
+  if (!changed.length && !deleted.length) return items;
+  const changedById = new Map(changed.map(item => [item.id, item]));
+  const kept = items
+    .filter(item => !deleted.includes(item.id))
+    .map(item => changedById.get(item.id) || item);
+  const known = new Set(kept.map(item => item.id));
+  return [...kept, ...changed.filter(item => !known.has(item.id))];
+};
 
 const GameDashboard = ({ user: initialUser, onLogout }) => {
   const [user, setUser] = useState(initialUser);
@@ -38,21 +50,15 @@ const GameDashboard = ({ user: initialUser, onLogout }) => {
   // Load game data from backend
   const loadGameData = useCallback(async () => {
     try {
-      const [profileData, buildingsData, questsData, cropsData, animalsData] = await Promise.all([
-        player.getProfile(),
-        buildingsApi.getAll(),
-        questsApi.getAll(),
-        cropsApi.getAll(),
-        animalsApi.getAll()
-      ]);
+      const snapshot = await farmApi.getSnapshot(['profile', 'buildings', 'quests', 'crops', 'animals']);
       
-      setUser(profileData);
-      setResources(profileData.resources);
-      setPlayerLevel(profileData.level);
-      setBuildings(buildingsData);
-      setQuests(questsData);
-      setCrops(cropsData);
-      setAnimals(animalsData);
+      setUser(snapshot.profile);
+      setResources(snapshot.profile.resources);
+      setPlayerLevel(snapshot.profile.level);
+      setBuildings(snapshot.buildings);
+      setQuests(snapshot.quests);
+      setCrops(snapshot.crops);
+      setAnimals(snapshot.animals);
     } catch (error) {
       toast({
         title: 'Ошибка загрузки',
@@ -79,30 +85,39 @@ const GameDashboard = ({ user: initialUser, onLogout }) => {
     setPlayerLevel(currentLevel);
   }, [user.experience]);
 
-  // Building construction timer - check progress from server
+  // Timed transitions are pushed by the server; on every (re)connect catch up
+  // on whatever changed while the socket was down
+  const syncCursor = useRef(null);
   useEffect(() => {
-    const interval = setInterval(async () => {
+    const catchUp = async () => {
       try {
-        const buildingsData = await buildingsApi.getAll();
-        setBuildings(prevBuildings => {
-        // Check if any building completed
-          prevBuildings.forEach(prevBuilding => {
-            const newBuilding = buildingsData.find(b => b.id === prevBuilding.id);
-            if (prevBuilding.status === 'building' && newBuilding && newBuilding.status === 'built') {
-              toast({
-                title: 'Строительство завершено!',
-                description: `${newBuilding.name} готово к использованию`,
-              });
-              }
-          });
-          return buildingsData;
-        });
+        const delta = await syncApi.since(syncCursor.current);
+        syncCursor.current = delta.cursor;
+        setBuildings(prevBuildings => applyDelta(prevBuildings, delta.changed.buildings, delta.deleted.buildings, delta.full));
+        setCrops(prevCrops => applyDelta(prevCrops, delta.changed.crops, delta.deleted.crops, delta.full));
+        setAnimals(prevAnimals => applyDelta(prevAnimals, delta.changed.animals, delta.deleted.animals, delta.full));
       } catch (error) {
-        console.error('Failed to update buildings:', error);
+        console.error('Failed to sync:', error);
+      }
+    };
+
+    const disconnect = pushApi.connect((event) => {
+      if (event.kind === 'buildings') {
+        if (event.type === 'building.built') {
+          toast({
+            title: 'Строительство завершено!',
+            description: `${event.entity.name} готово к использованию`,
+          });
+        }
+        setBuildings(prevBuildings => applyDelta(prevBuildings, [event.entity]));
+      } else if (event.kind === 'crops') {
+        setCrops(prevCrops => applyDelta(prevCrops, [event.entity]));
+      } else if (event.kind === 'animals') {
+        setAnimals(prevAnimals => applyDelta(prevAnimals, [event.entity]));
       }
-    }, 5000); // Check every 5 seconds
+    }, { onOpen: catchUp });
 
-    return () => clearInterval(interval);
+    return disconnect;
   }, []);
 
   const getExperienceToNext = () => {
@@ -110,24 +125,28 @@ const GameDashboard = ({ user: initialUser, onLogout }) => {
     return nextLevel ? nextLevel.experienceRequired : 10000;
   };
 
-  const findEmptyCell = () => {
-    const gridRows = 12;
-    const gridCols = 16;
-    
-    for (let row = 0; row < gridRows; row++) {
-      for (let col = 0; col < gridCols; col++) {
-        const cellKey = `${row}-${col}`;
-        if (!buildings.find(b => b.position === cellKey)) {
-          return cellKey;
-        }
-      }
+  const findEmptyCell = async () => {
+    const { position } = await placementApi.find();
+    if (!position) throw new Error('Нет свободных клеток');
+    return position;
+  };
+
+  const openWithEmptyCell = async (openModal) => {
+    try {
+      setSelectedCell(await findEmptyCell());
+      openModal(true);
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: error.message,
+        variant: 'destructive'
+      });
     }
-    return '0-0';
   };
 
   const handleBuildStart = async (buildingData) => {
     try {
-      const newBuilding = await buildingsApi.create(buildingData.id, findEmptyCell());
+      const newBuilding = await buildingsApi.create(buildingData.id, await findEmptyCell());
       
       // Reload data from server
       await loadGameData();
@@ -366,14 +385,8 @@ const GameDashboard = ({ user: initialUser, onLogout }) => {
       {/* Side Panel */}
       <SidePanel
         onOpenBuilding={() => setBuildListModalOpen(true)}
-        onOpenCrops={() => {
-          setSelectedCell(findEmptyCell());
-          setCropModalOpen(true);
-        }}
-        onOpenAnimals={() => {
-          setSelectedCell(findEmptyCell());
-          setAnimalModalOpen(true);
-        }}
+        onOpenCrops={() => openWithEmptyCell(setCropModalOpen)}
+        onOpenAnimals={() => openWithEmptyCell(setAnimalModalOpen)}
         onOpenMarket={() => setMarketModalOpen(true)}
         onOpenQuests={() => setQuestModalOpen(true)}
         questsAvailable={questsAvailable}
@@ -7,7 +7,8 @@ const IsometricMap = ({ buildings = [], crops = [], animals = [], onBuildingClic
   const [offset, setOffset] = useState({ x: 0, y: 0 });
   const containerRef = useRef(null);
 
-  const gridRows = 12;
+  // Same size as the server's occupancy grid (GRID_ROWS x GRID_COLS)
+  const gridRows = 16;
   const gridCols = 16;
   const tileWidth = 120;
   const tileHeight = 60;
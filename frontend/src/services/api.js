@@ -24,6 +24,16 @@ const getHeaders = () => {
   };
 };
 
+// Catalog API - static game definitions. The response carries an ETag and
+// Cache-Control: no-cache, so the browser cache revalidates it for us.
+export const catalog = {
+  get: async () => {
+    const response = await fetch(`${API_URL}/api/catalog`);
+    if (!response.ok) throw new Error('Failed to fetch catalog');
+    return await response.json();
+  }
+};
+
 // Auth API
 export const auth = {
   register: async (username, email, password) => {
@@ -61,6 +71,13 @@ export const auth = {
   },
   
   logout: () => {
+    if (getToken()) {
+      // Revoke the token server-side; don't hold up the local logout for it
+      fetch(`${API_URL}/api/auth/logout`, {
+        method: 'POST',
+        headers: getHeaders()
+      }).catch(() => {});
+    }
     removeToken();
   }
 };
@@ -334,6 +351,23 @@ export const territory = {
   }
 };
 
+// Placement API - free cells come from the server's occupancy grid, which
+// also knows about territory, crops and animals
+export const placement = {
+  find: async ({ location = "main", near, count = 1 } = {}) => {
+    const response = await fetch(`${API_URL}/api/placement/find`, {
+      method: 'POST',
+      headers: getHeaders(),
+      body: JSON.stringify({ location, count, ...(near && { near }) })
+    });
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Failed to find a free cell');
+    }
+    return await response.json();
+  }
+};
+
 // Pests API
 export const pests = {
   getAll: async () => {
@@ -428,5 +462,59 @@ export const friends = {
   }
 };
 
+// Farm API
+export const farm = {
+  getSnapshot: async (sections = []) => {
+    const query = sections.length ? `?sections=${sections.join(',')}` : '';
+    const response = await fetch(`${API_URL}/api/farm/snapshot${query}`, {
+      headers: getHeaders()
+    });
+    if (!response.ok) throw new Error('Failed to fetch farm');
+    return await response.json();
+  }
+};
+
+// Sync API
+export const sync = {
+  since: async (cursor) => {
+    const query = cursor ? `?since=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(`${API_URL}/api/sync${query}`, {
+      headers: getHeaders()
+    });
+    if (!response.ok) throw new Error('Failed to sync');
+    return await response.json();
+  }
+};
+
+// Push API - timed transitions (building built, crop ready, ...) as they happen
+export const push = {
+  connect: (onEvent, { onOpen } = {}) => {
+    const wsUrl = API_URL.replace(/^http/, 'ws');
+    let socket = null;
+    let retryDelay = 1000;
+    let closed = false;
+
+    const open = () => {
+      socket = new WebSocket(`${wsUrl}/api/push/ws?token=${encodeURIComponent(getToken())}`);
+      socket.onopen = () => {
+        retryDelay = 1000;
+        if (onOpen) onOpen();
+      };
+      socket.onmessage = (message) => onEvent(JSON.parse(message.data));
+      socket.onclose = () => {
+        if (closed) return;
+        setTimeout(open, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+
+    open();
+    return () => {
+      closed = true;
+      if (socket) socket.close();
+    };
+  }
+};
+
 
 export { setToken, removeToken, getToken };